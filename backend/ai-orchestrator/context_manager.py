@@ -0,0 +1,194 @@
+"""
+Context Manager - Compactación del historial según presupuesto de tokens
+Antes de cada llamada al LLM el historial se ajusta al presupuesto del proveedor:
+
+1. Los resultados de herramientas antiguos se resumen (solo nombres y un extracto)
+2. Si aún no cabe, los turnos más antiguos se reemplazan por un resumen breve
+3. Si el último mensaje por sí solo excede el presupuesto (p.ej. un PDF), se recorta
+
+El conteo de tokens es una estimación por proveedor (caracteres por token);
+si tiktoken está instalado se usa para OpenAI
+"""
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import math
+import os
+
+
+# Caracteres promedio por token (texto en español) según el tokenizador del proveedor
+CHARS_PER_TOKEN = {"gemini": 4.0, "groq": 3.5, "openai": 4.0}
+
+# Tokens extra por mensaje (rol y separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Presupuesto por defecto (tokens de entrada del historial)
+DEFAULT_BUDGETS = {"gemini": 8000, "groq": 6000, "openai": 6000}
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior:"
+
+
+def _tiktoken_encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+_openai_encoder = _tiktoken_encoder()
+
+
+def count_tokens(text: str, provider: str) -> int:
+    """Tokens estimados de un texto para el proveedor"""
+    if provider == "openai" and _openai_encoder is not None:
+        return len(_openai_encoder.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN.get(provider, 4.0))
+
+
+def count_messages_tokens(messages: List[Dict[str, str]], provider: str) -> int:
+    return sum(count_tokens(msg.get("content", ""), provider) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
+
+
+def _clip(text: str, max_chars: int) -> str:
+    """Recortar por el medio conservando el inicio y el final"""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n[... {omitted} caracteres omitidos ...]\n{text[-tail:] if tail else ''}"
+
+
+def summarize_tool_message(content: str, max_chars: int = 300) -> str:
+    """Resumen de un mensaje `tool`: herramientas usadas y un extracto de cada resultado"""
+    try:
+        results = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return _clip(content, max_chars)
+    if not isinstance(results, list):
+        return _clip(content, max_chars)
+
+    per_tool = max(60, max_chars // max(len(results), 1))
+    parts = []
+    for item in results:
+        if not isinstance(item, dict):
+            continue
+        payload = item.get("result", item.get("error"))
+        parts.append(f"{item.get('name')}: {_clip(json.dumps(payload, ensure_ascii=False, default=str), per_tool)}")
+    return "[resultado resumido] " + " | ".join(parts)
+
+
+def summarize_turns(messages: List[Dict[str, str]], max_chars: int = 600) -> str:
+    """Resumen extractivo (sin llamar al LLM) de los turnos descartados"""
+    lines = []
+    for msg in messages:
+        role = msg.get("role")
+        content = " ".join(msg.get("content", "").split())
+        if role == "user":
+            lines.append(f"- Usuario: {content[:120]}")
+        elif role == "assistant" and not content.startswith("USE_TOOL:"):
+            lines.append(f"- Asistente: {content[:80]}")
+        elif role == "system" and content.startswith(SUMMARY_PREFIX):
+            # Resumen de una compactación anterior
+            lines.append(content[len(SUMMARY_PREFIX):].strip()[:200])
+    return _clip(f"{SUMMARY_PREFIX}\n" + "\n".join(lines), max_chars)
+
+
+class ContextManager:
+    """
+    Ajusta el historial al presupuesto de tokens de cada proveedor y
+    registra la relación de compactación (tokens después / antes)
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        keep_recent: int = 4,
+        tool_summary_chars: int = 300
+    ):
+        self.budgets = budgets or dict(DEFAULT_BUDGETS)
+        self.keep_recent = keep_recent
+        self.tool_summary_chars = tool_summary_chars
+        self.calls = 0
+        self.compacted_calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def budget_for(self, provider: str) -> int:
+        return self.budgets.get(provider, DEFAULT_BUDGETS["gemini"])
+
+    def compact(self, history: List[Dict[str, str]], provider: str) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Retorna (historial compactado, estadísticas de esta llamada)
+        No modifica la lista recibida
+        """
+        budget = self.budget_for(provider)
+        messages = [dict(msg) for msg in history]
+        before = count_messages_tokens(messages, provider)
+        after = before
+
+        if before > budget:
+            # 1. Resumir resultados de herramientas fuera de los últimos mensajes
+            recent_start = max(len(messages) - self.keep_recent, 0)
+            for i in range(recent_start):
+                if messages[i].get("role") == "tool":
+                    messages[i]["content"] = summarize_tool_message(messages[i]["content"], self.tool_summary_chars)
+            after = count_messages_tokens(messages, provider)
+
+            # 2. Reemplazar los turnos más antiguos por un resumen (siempre queda el último)
+            dropped: List[Dict[str, str]] = []
+            while after > budget and len(messages) > 1:
+                dropped.append(messages.pop(0))
+                summary = {"role": "system", "content": summarize_turns(dropped)}
+                after = count_messages_tokens([summary] + messages, provider)
+            if dropped:
+                messages.insert(0, {"role": "system", "content": summarize_turns(dropped)})
+
+            # 3. Recortar el último mensaje si por sí solo no cabe
+            if after > budget:
+                last = messages[-1]
+                other = after - count_tokens(last["content"], provider)
+                available_tokens = max(budget - other, 50)
+                # Margen para el marcador "[... N caracteres omitidos ...]"
+                max_chars = max(int(available_tokens * CHARS_PER_TOKEN.get(provider, 4.0)) - 60, 200)
+                last["content"] = _clip(last["content"], max_chars)
+                after = count_messages_tokens(messages, provider)
+
+        self.calls += 1
+        self.tokens_before += before
+        self.tokens_after += after
+        if after < before:
+            self.compacted_calls += 1
+
+        return messages, {
+            "tokens_before": before,
+            "tokens_after": after,
+            "budget": budget,
+            "compaction_ratio": round(after / before, 4) if before else 1.0
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budgets": self.budgets,
+            "calls": self.calls,
+            "compacted_calls": self.compacted_calls,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "compaction_ratio": round(self.tokens_after / self.tokens_before, 4) if self.tokens_before else 1.0
+        }
+
+
+def create_context_manager() -> ContextManager:
+    """
+    Crear el context manager según variables de entorno
+    CONTEXT_BUDGET_TOKENS_<PROVEEDOR> fija el presupuesto de cada proveedor
+    """
+    budgets = {
+        provider: int(os.getenv(f"CONTEXT_BUDGET_TOKENS_{provider.upper()}", str(default)))
+        for provider, default in DEFAULT_BUDGETS.items()
+    }
+    return ContextManager(
+        budgets=budgets,
+        keep_recent=int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES", "4")),
+        tool_summary_chars=int(os.getenv("CONTEXT_TOOL_SUMMARY_CHARS", "300"))
+    )
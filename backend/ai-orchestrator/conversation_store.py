@@ -0,0 +1,304 @@
+"""
+Conversation Store - Historial de conversaciones del orquestador
+Nivel en memoria acotado (LRU + TTL por inactividad) con persistencia opcional
+en SQLite o MongoDB para sobrevivir reinicios y compartirse entre workers
+(historial versionado: la memoria se valida contra el backend y los turnos se
+agregan con guardados condicionales)
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Reintentos de un guardado condicional cuando otro worker escribió antes
+MAX_SAVE_ATTEMPTS = 5
+
+
+class ConversationBackend(ABC):
+    """
+    Interface abstracta para la persistencia de conversaciones
+    Cada historial tiene un número de versión que aumenta en cada guardado:
+    los guardados son condicionales (compare-and-set) para no pisar los
+    turnos que otro worker escribió entre la lectura y la escritura
+    """
+
+    @abstractmethod
+    async def load(self, conversation_id: str) -> Optional[Tuple[List[Dict], int]]:
+        """Cargar (historial, versión); None si no existe"""
+        pass
+
+    @abstractmethod
+    async def version(self, conversation_id: str) -> Optional[int]:
+        """Versión actual del historial sin cargarlo (None si no existe)"""
+        pass
+
+    @abstractmethod
+    async def save(self, conversation_id: str, history: List[Dict], expected_version: Optional[int]) -> Optional[int]:
+        """
+        Guardar el historial completo solo si la versión guardada es
+        `expected_version` (None: solo si la conversación no existe)
+        Retorna la nueva versión, o None si otro guardado se adelantó
+        """
+        pass
+
+    @abstractmethod
+    async def delete(self, conversation_id: str) -> bool:
+        """Eliminar historial; True si existía"""
+        pass
+
+
+class SQLiteConversationBackend(ConversationBackend):
+    """Persistencia en un archivo SQLite local (operaciones en un hilo aparte)"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Tablas creadas antes de existir la versión
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+            if "version" not in columns:
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._conn.commit()
+
+    def _load(self, conversation_id: str) -> Optional[Tuple[List[Dict], int]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, version FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _version(self, conversation_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _save(self, conversation_id: str, history: List[Dict], expected_version: Optional[int]) -> Optional[int]:
+        data = json.dumps(history, ensure_ascii=False)
+        with self._lock:
+            if expected_version is None:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO conversations (id, history, updated_at, version) VALUES (?, ?, ?, 1)",
+                    (conversation_id, data, time.time())
+                )
+                new_version = 1
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE conversations SET history = ?, updated_at = ?, version = version + 1 "
+                    "WHERE id = ? AND version = ?",
+                    (data, time.time(), conversation_id, expected_version)
+                )
+                new_version = expected_version + 1
+            self._conn.commit()
+        return new_version if cursor.rowcount > 0 else None
+
+    def _delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    async def load(self, conversation_id: str) -> Optional[Tuple[List[Dict], int]]:
+        return await asyncio.to_thread(self._load, conversation_id)
+
+    async def version(self, conversation_id: str) -> Optional[int]:
+        return await asyncio.to_thread(self._version, conversation_id)
+
+    async def save(self, conversation_id: str, history: List[Dict], expected_version: Optional[int]) -> Optional[int]:
+        return await asyncio.to_thread(self._save, conversation_id, history, expected_version)
+
+    async def delete(self, conversation_id: str) -> bool:
+        return await asyncio.to_thread(self._delete, conversation_id)
+
+
+class MongoConversationBackend(ConversationBackend):
+    """Persistencia en MongoDB (requiere motor instalado)"""
+
+    def __init__(self, mongo_url: str, db_name: str):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self._collection = AsyncIOMotorClient(mongo_url)[db_name]["conversations"]
+
+    async def load(self, conversation_id: str) -> Optional[Tuple[List[Dict], int]]:
+        doc = await self._collection.find_one({"_id": conversation_id})
+        return (doc["history"], doc.get("version", 0)) if doc else None
+
+    async def version(self, conversation_id: str) -> Optional[int]:
+        doc = await self._collection.find_one({"_id": conversation_id}, {"version": 1})
+        return doc.get("version", 0) if doc else None
+
+    async def save(self, conversation_id: str, history: List[Dict], expected_version: Optional[int]) -> Optional[int]:
+        from pymongo.errors import DuplicateKeyError
+
+        if expected_version is None:
+            try:
+                await self._collection.insert_one(
+                    {"_id": conversation_id, "history": history, "updated_at": time.time(), "version": 1}
+                )
+            except DuplicateKeyError:
+                return None
+            return 1
+
+        # Documentos guardados antes de existir la versión no tienen el campo (= 0)
+        version_filter = expected_version if expected_version else {"$in": [0, None]}
+        result = await self._collection.update_one(
+            {"_id": conversation_id, "version": version_filter},
+            {"$set": {"history": history, "updated_at": time.time()}, "$inc": {"version": 1}}
+        )
+        return expected_version + 1 if result.matched_count else None
+
+    async def delete(self, conversation_id: str) -> bool:
+        result = await self._collection.delete_one({"_id": conversation_id})
+        return result.deleted_count > 0
+
+
+class ConversationStore:
+    """
+    Historial de conversaciones con nivel en memoria acotado
+
+    - LRU: como máximo `max_conversations` en memoria
+    - TTL: se descartan de memoria las inactivas por más de `idle_ttl` segundos
+    - Backend opcional (compartido entre workers): la memoria guarda la última
+      versión leída; antes de usarla se compara con la versión del backend, y
+      los turnos nuevos se agregan con un guardado condicional que, si otro
+      worker escribió antes, relee el historial y reintenta
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 1000,
+        idle_ttl: float = 3600,
+        backend: Optional[ConversationBackend] = None
+    ):
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        # id → (último acceso, historial, versión en el backend)
+        self._memory: "OrderedDict[str, Tuple[float, List[Dict], Optional[int]]]" = OrderedDict()
+        self.stale_reads = 0
+        self.save_conflicts = 0
+
+    @staticmethod
+    def new_id() -> str:
+        """ID de conversación sin colisiones"""
+        return f"conv_{uuid.uuid4().hex}"
+
+    def _evict(self):
+        """Descarta de memoria las conversaciones inactivas y el exceso LRU"""
+        now = time.time()
+        # El OrderedDict está ordenado por último acceso: las inactivas van primero
+        while self._memory:
+            oldest_id, (last_access, _, _) = next(iter(self._memory.items()))
+            if now - last_access <= self.idle_ttl and len(self._memory) <= self.max_conversations:
+                break
+            del self._memory[oldest_id]
+
+    def _remember(self, conversation_id: str, history: List[Dict], version: Optional[int]):
+        self._memory[conversation_id] = (time.time(), list(history), version)
+        self._memory.move_to_end(conversation_id)
+        self._evict()
+
+    def _cached(self, conversation_id: str) -> Optional[Tuple[List[Dict], Optional[int]]]:
+        entry = self._memory.get(conversation_id)
+        if entry and time.time() - entry[0] <= self.idle_ttl:
+            return entry[1], entry[2]
+        return None
+
+    async def _load(self, conversation_id: str) -> Tuple[List[Dict], Optional[int]]:
+        """(historial, versión) vigentes: la copia en memoria solo si su versión sigue siendo la del backend"""
+        cached = self._cached(conversation_id)
+        if not self.backend:
+            return cached if cached else ([], None)
+
+        if cached is not None:
+            if await self.backend.version(conversation_id) == cached[1]:
+                return cached
+            self.stale_reads += 1
+        loaded = await self.backend.load(conversation_id)
+        if loaded is None:
+            self._memory.pop(conversation_id, None)
+            return [], None
+        return loaded
+
+    async def get(self, conversation_id: str) -> List[Dict]:
+        """Obtener una copia del historial (lista vacía si no existe)"""
+        history, version = await self._load(conversation_id)
+        if not history and version is None:
+            return []
+        self._remember(conversation_id, history, version)
+        return list(history)
+
+    async def append(self, conversation_id: str, messages: List[Dict], max_messages: Optional[int] = None) -> None:
+        """
+        Agregar los turnos nuevos al historial (conservando los últimos
+        `max_messages`). Con backend el guardado es condicional: si otro worker
+        agregó turnos desde la lectura se relee el historial y se reintenta
+        """
+        history, version = await self._load(conversation_id)
+        for _ in range(MAX_SAVE_ATTEMPTS):
+            updated = history + list(messages)
+            if max_messages:
+                updated = updated[-max_messages:]
+            if not self.backend:
+                self._remember(conversation_id, updated, None)
+                return
+            new_version = await self.backend.save(conversation_id, updated, version)
+            if new_version is not None:
+                self._remember(conversation_id, updated, new_version)
+                return
+            self.save_conflicts += 1
+            loaded = await self.backend.load(conversation_id)
+            history, version = loaded if loaded else ([], None)
+        raise RuntimeError(f"No se pudo guardar la conversación {conversation_id}: escrituras concurrentes")
+
+    async def delete(self, conversation_id: str) -> bool:
+        """Eliminar conversación; True si existía"""
+        existed = self._memory.pop(conversation_id, None) is not None
+        if self.backend:
+            existed = await self.backend.delete(conversation_id) or existed
+        return existed
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_memory": len(self._memory),
+            "max_conversations": self.max_conversations,
+            "idle_ttl": self.idle_ttl,
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "stale_reads": self.stale_reads,
+            "save_conflicts": self.save_conflicts
+        }
+
+
+def create_conversation_store() -> ConversationStore:
+    """
+    Crear el store según variables de entorno
+    CONVERSATION_BACKEND: memory (default), sqlite o mongo
+    """
+    backend_name = os.getenv("CONVERSATION_BACKEND", "memory").lower()
+    backend: Optional[ConversationBackend] = None
+
+    if backend_name == "sqlite":
+        backend = SQLiteConversationBackend(os.getenv("CONVERSATION_SQLITE_PATH", "conversations.db"))
+    elif backend_name == "mongo":
+        backend = MongoConversationBackend(
+            os.getenv("CONVERSATION_MONGO_URL", "mongodb://localhost:27017"),
+            os.getenv("CONVERSATION_MONGO_DB", "ai_orchestrator")
+        )
+
+    return ConversationStore(
+        max_conversations=int(os.getenv("CONVERSATION_MAX_IN_MEMORY", "1000")),
+        idle_ttl=float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", "3600")),
+        backend=backend
+    )
@@ -0,0 +1,153 @@
+"""
+Extraction Cache - Cache direccionado por contenido de extracciones multimodales
+La clave es el SHA-256 del archivo subido (calculado al recibirlo): un mismo PDF o captura subido de
+nuevo reutiliza el texto, tablas y metadatos sin volver a ejecutar
+Tesseract ni pdfplumber
+
+Dos niveles:
+- Memoria: LRU acotado por número de entradas
+- Disco (opcional): un JSON por entrada, acotado en MB (se descartan los
+  menos usados recientemente según mtime)
+"""
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import asyncio
+import json
+import os
+
+
+# Se incluye en la clave: cambiarla invalida extracciones de versiones anteriores del parser
+EXTRACTION_CACHE_VERSION = "1"
+
+
+class ExtractionCache:
+    """Cache LRU en memoria con un nivel opcional en disco"""
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None, disk_max_bytes: int = 200 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(kind: str, sha256: str, variant: str = "") -> str:
+        """Clave de contenido: tipo de extracción, opciones que cambian el resultado y SHA-256"""
+        parts = [kind, f"v{EXTRACTION_CACHE_VERSION}", variant, sha256]
+        return "-".join(part for part in parts if part)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ==================== DISCO (se ejecuta en un hilo) ====================
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Marcar como usado recientemente para la política de descarte
+            os.utime(path, None)
+            return value
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_disk(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, default=str)
+            # Reemplazo atómico: un lector nunca ve un JSON a medio escribir
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  No se pudo guardar la extracción en disco: {e}")
+            return
+        self._prune_disk()
+
+    def _disk_files(self):
+        try:
+            return [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")]
+        except OSError:
+            return []
+
+    def _prune_disk(self):
+        """Descartar los archivos usados hace más tiempo hasta quedar bajo el límite"""
+        files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._disk_files()]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # ==================== API ====================
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Extracción cacheada o None"""
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return value
+
+        if self.disk_dir:
+            value = await asyncio.to_thread(self._read_disk, key)
+            if value is not None:
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        """Guardar una extracción exitosa en ambos niveles"""
+        self._remember(key, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.memory_hits + self.disk_hits + self.misses
+        stats = {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / total, 4) if total else 0.0,
+            "disk_dir": self.disk_dir
+        }
+        if self.disk_dir:
+            files = self._disk_files()
+            stats["disk_entries"] = len(files)
+            stats["disk_bytes"] = sum(entry.stat().st_size for entry in files)
+            stats["disk_max_bytes"] = self.disk_max_bytes
+        return stats
+
+
+def create_extraction_cache() -> Optional[ExtractionCache]:
+    """
+    Crear el cache según variables de entorno (None si está deshabilitado)
+    EXTRACTION_CACHE_DIR vacío deja solo el nivel en memoria
+    """
+    if os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    return ExtractionCache(
+        max_entries=int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "256")),
+        disk_dir=os.getenv("EXTRACTION_CACHE_DIR", ".extraction_cache") or None,
+        disk_max_bytes=int(float(os.getenv("EXTRACTION_CACHE_DISK_MAX_MB", "200")) * 1024 * 1024)
+    )
@@ -1,31 +1,194 @@
 """
 LLM Adapters - Patrón Strategy para proveedores de IA
 Permite intercambiar entre Gemini, OpenAI, etc. sin cambiar lógica de negocio
+
+Las herramientas se declaran con el function calling nativo de cada proveedor
+(JSON Schema del catálogo del MCP Server). Las llamadas que devuelve el modelo
+se representan en la respuesta como líneas USE_TOOL:nombre:{json}, el formato
+que guardan el historial y el cache y que ejecuta MCPClient.
+
+Al reenviar el historial, cada respuesta con USE_TOOL seguida de su mensaje
+`tool` se vuelve a convertir en llamadas y resultados nativos (function_call /
+function_response en Gemini, tool_calls + mensajes `tool` en OpenAI/Groq).
+Los resultados ya resumidos por el ContextManager se envían como texto.
 """
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
 from enum import Enum
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+import asyncio
 import os
 import json
 
+from mcp_client import parse_tool_calls
+from response_cache import ResponseCache, create_response_cache
+from provider_router import ProviderRouter, create_provider_router
+
 
 class LLMProvider(Enum):
     GEMINI = "gemini"
     GROQ = "groq"
 
 
+TOOL_CALL_PREFIX = "USE_TOOL:"
+
+# Parámetros que agrega el orquestador (no se declaran al modelo)
+INJECTED_PARAMS = {"usuario_id"}
+
+# Pautas de uso; el catálogo viaja como declaraciones de funciones, no en el prompt
+TOOL_GUIDELINES = """Eres un asistente de turismo con acceso a las herramientas del sistema de reservas.
+- Usa las herramientas para buscar, consultar, crear o cancelar. NO inventes información.
+- "Quiero cancelar" o "mis reservas" sin ID: usa mis_reservas y muestra una lista numerada.
+- "Quiero reservar" sin destino: usa buscar_destinos y luego pregunta cuál le interesa.
+- "Cancela la 1" / "la primera": usa cancelar_reserva con reserva_id "1" (número del último listado).
+- Nunca pidas al usuario el ID técnico de una reserva."""
+
+
+def format_tool_call(name: str, args: Dict[str, Any]) -> str:
+    """Línea USE_TOOL:nombre:{json} para una llamada estructurada"""
+    return f"{TOOL_CALL_PREFIX}{name}:{json.dumps(args, ensure_ascii=False)}"
+
+
+def _format_raw_tool_call(name: str, arguments: str) -> str:
+    """Como format_tool_call pero con los argumentos como texto JSON del proveedor"""
+    try:
+        return format_tool_call(name, json.loads(arguments or "{}"))
+    except json.JSONDecodeError:
+        # Se conserva tal cual: MCPClient reporta el error de parámetros
+        return f"{TOOL_CALL_PREFIX}{name}:{arguments}"
+
+
+def _tool_exchange(
+    assistant: Dict[str, str], tool: Dict[str, str]
+) -> Optional[Tuple[str, List[Tuple[str, Dict[str, Any], Dict[str, Any]]]]]:
+    """
+    Si `assistant` pidió herramientas (líneas USE_TOOL) y `tool` trae sus
+    resultados: (texto sin las líneas USE_TOOL, [(nombre, argumentos, respuesta)])
+    None si no se pueden emparejar (p.ej. resultados resumidos o recortados)
+    """
+    if assistant.get("role") != "assistant" or tool.get("role") != "tool":
+        return None
+    content = assistant.get("content", "")
+    calls = parse_tool_calls(content)
+    try:
+        results = json.loads(tool.get("content", ""))
+        arguments = [json.loads(params) for _, params in calls]
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not calls or not isinstance(results, list) or len(results) != len(calls):
+        return None
+    
+    exchange = []
+    for (name, _), args, item in zip(calls, arguments, results):
+        if not isinstance(args, dict) or not isinstance(item, dict) or item.get("name") != name:
+            return None
+        response = {"error": item["error"]} if "error" in item else {"result": item.get("result")}
+        exchange.append((name, args, response))
+    text = "\n".join(
+        line for line in content.splitlines() if not line.lstrip().startswith(TOOL_CALL_PREFIX)
+    ).strip()
+    return text, exchange
+
+
+def tool_parameters_schema(tool: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON Schema de los parámetros de una herramienta
+    Usa `input_schema` del MCP Server; el catálogo local solo tiene
+    {"param": "descripción"} y se convierte a propiedades string
+    """
+    schema = tool.get("input_schema")
+    if not schema:
+        params = tool.get("parameters", {})
+        schema = {
+            "type": "object",
+            "properties": {name: {"type": "string", "description": desc} for name, desc in params.items()},
+            "required": [name for name, desc in params.items() if "opcional" not in desc]
+        }
+    properties = {
+        name: prop for name, prop in schema.get("properties", {}).items()
+        if name not in INJECTED_PARAMS
+    }
+    result: Dict[str, Any] = {"type": "object", "properties": properties}
+    required = [name for name in schema.get("required", []) if name in properties]
+    if required:
+        result["required"] = required
+    return result
+
+
+def _to_plain(value: Any) -> Any:
+    """Convertir argumentos proto de Gemini (MapComposite, RepeatedComposite) a JSON"""
+    if isinstance(value, Mapping):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, float) and value.is_integer():
+        # Struct de protobuf solo tiene números double
+        return int(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    return [_to_plain(item) for item in value]
+
+
 class LLMAdapter(ABC):
     """Interface abstracta para adaptadores LLM"""
     
+    # Límites por proveedor (se sobrescriben con _init_limits)
+    max_concurrency: int = 4
+    request_timeout: float = 60.0
+    _semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _init_limits(self, env_prefix: str):
+        """Leer {PREFIX}_MAX_CONCURRENCY y {PREFIX}_TIMEOUT_SECONDS del entorno"""
+        self.max_concurrency = int(os.getenv(f"{env_prefix}_MAX_CONCURRENCY", str(self.max_concurrency)))
+        self.request_timeout = float(os.getenv(f"{env_prefix}_TIMEOUT_SECONDS", str(self.request_timeout)))
+    
+    async def _run_limited(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar una llamada al proveedor sin bloquear el event loop:
+        como máximo max_concurrency llamadas simultáneas y timeout por petición
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(call(), timeout=self.request_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{type(self).__name__} no respondió en {self.request_timeout:.0f}s")
+    
+    async def _stream_limited(self, open_stream: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+        """
+        Como _run_limited pero para respuestas en streaming: el cupo del semáforo
+        se mantiene hasta terminar el stream y el timeout aplica a la apertura
+        y a la espera de cada fragmento
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            try:
+                stream = await asyncio.wait_for(open_stream(), timeout=self.request_timeout)
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=self.request_timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{type(self).__name__} dejó de responder durante {self.request_timeout:.0f}s")
+    
     @abstractmethod
     async def generate(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
         """Generar respuesta del modelo"""
         pass
     
-    @abstractmethod
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        """
+        Generar respuesta por fragmentos a medida que llegan del proveedor
+        Por defecto (adaptadores sin streaming) un único fragmento con la respuesta completa
+        """
+        yield await self.generate(messages, tools)
+    
     def wants_to_use_tool(self, response: str) -> bool:
         """Verificar si la respuesta indica uso de herramientas"""
-        pass
+        return TOOL_CALL_PREFIX in response
     
     @abstractmethod
     def is_configured(self) -> bool:
@@ -38,6 +201,7 @@ class GeminiAdapter(LLMAdapter):
     
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY", "")
+        self._init_limits("GEMINI")
         if self.api_key:
             import google.generativeai as genai
             genai.configure(api_key=self.api_key)
@@ -54,81 +218,221 @@ class GeminiAdapter(LLMAdapter):
             raise Exception("Gemini no está configurado. Configura GEMINI_API_KEY en .env")
         
         try:
-            # Convertir mensajes a formato Gemini
-            prompt = self._convert_messages_to_prompt(messages)
-            
-            # Agregar información de herramientas si están disponibles
-            if tools:
-                tools_desc = "\n\n🔧 HERRAMIENTAS DISPONIBLES (DEBES USARLAS SIEMPRE):\n"
-                for tool in tools:
-                    tools_desc += f"- {tool['name']}: {tool['description']}\n"
-                    tools_desc += f"  Parámetros: {tool.get('parameters', {})}\n"
-                
-                tools_desc += """
-⚠️ IMPORTANTE: Cuando el usuario pida buscar, consultar, crear o CANCELAR algo, DEBES usar las herramientas.
-NO inventes información. Solo usa los datos reales del sistema.
-
-Formato para usar herramientas:
-USE_TOOL:nombre_herramienta:{"parametro": "valor"}
-
-FLUJO INTELIGENTE:
-- Si el usuario dice "quiero cancelar una reserva" SIN dar ID → Primero usa mis_reservas para mostrarle sus reservas
-- Si el usuario dice "quiero reservar" SIN especificar destino → Primero usa buscar_destinos para mostrarle opciones
-- Si el usuario da el ID específico → Usa la herramienta directamente
-
-🧠 IMPORTANTE PARA CANCELAR:
-- Cuando muestres reservas, RECUERDA los IDs internamente
-- Si el usuario dice "cancelar la 1" o "la primera" → Usa el ID de la reserva #1 que mostraste
-- Si dice "cancelar la del tour Los Frailes" → Usa el ID de esa reserva
-- NUNCA pidas al usuario el ID técnico, usa el número o nombre del tour
-
-Ejemplos:
-- Usuario: "busca destinos de playa"
-  Tú: USE_TOOL:buscar_destinos:{"query": "playa", "categoria": "playa"}
-  
-- Usuario: "quiero hacer una reserva"
-  Tú: USE_TOOL:buscar_destinos:{"query": ""}
-  (Luego pregunta qué destino le interesa)
-
-- Usuario: "quiero cancelar mi reserva"
-  Tú: USE_TOOL:mis_reservas:{}
-  (Muestra lista numerada: 1. Tour X, 2. Tour Y)
-
-- Usuario: "cancela la 1" (después de ver lista)
-  Tú: USE_TOOL:cancelar_reserva:{"reserva_id": "[ID de la reserva #1]"}
-
-- Usuario: "cancela la del tour Los Frailes"
-  Tú: USE_TOOL:cancelar_reserva:{"reserva_id": "[ID de esa reserva]"}
-"""
-                prompt = tools_desc + "\n\n" + prompt
+            contents = self._to_contents(messages, tools)
             
-            # Generar respuesta
-            response = self.model.generate_content(prompt)
-            return response.text
+            # Generar respuesta (async: no bloquea el event loop)
+            response = await self._run_limited(
+                lambda: self._generate_content(contents, self._function_declarations(tools))
+            )
+            return "\n".join(self._parts_text(response))
             
         except Exception as e:
             raise Exception(f"Error en Gemini: {str(e)}")
     
-    def wants_to_use_tool(self, response: str) -> bool:
-        return "USE_TOOL:" in response
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise Exception("Gemini no está configurado. Configura GEMINI_API_KEY en .env")
+        if not hasattr(self.model, "generate_content_async"):
+            # SDK sin API async: sin streaming, un único fragmento
+            yield await self.generate(messages, tools)
+            return
+        
+        contents = self._to_contents(messages, tools)
+        declarations = self._function_declarations(tools)
+        try:
+            async for chunk in self._stream_limited(
+                lambda: self.model.generate_content_async(contents, tools=declarations, stream=True)
+            ):
+                for text in self._parts_text(chunk):
+                    yield text
+        except Exception as e:
+            raise Exception(f"Error en Gemini: {str(e)}")
+    
+    @staticmethod
+    def _function_declarations(tools: Optional[List[Dict]]) -> Optional[List[Dict[str, Any]]]:
+        """Catálogo MCP como function_declarations de Gemini"""
+        if not tools:
+            return None
+        declarations = []
+        for tool in tools:
+            declaration = {"name": tool["name"], "description": tool.get("description", "")}
+            parameters = tool_parameters_schema(tool)
+            # Gemini no acepta objetos sin propiedades
+            if parameters["properties"]:
+                declaration["parameters"] = parameters
+            declarations.append(declaration)
+        return [{"function_declarations": declarations}]
     
-    def _convert_messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
-        """Convertir lista de mensajes a prompt único"""
-        prompt_parts = []
-        for msg in messages:
+    @staticmethod
+    def _to_contents(messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> List[Dict[str, Any]]:
+        """
+        Historial en formato `contents` de Gemini (roles user/model)
+        Los mensajes consecutivos del mismo rol se agrupan: Gemini exige alternar
+        """
+        turns: List[Tuple[str, List[Any]]] = []
+        if tools:
+            turns.append(("user", [TOOL_GUIDELINES]))
+        i = 0
+        while i < len(messages):
+            msg = messages[i]
+            exchange = _tool_exchange(msg, messages[i + 1]) if i + 1 < len(messages) else None
+            if exchange:
+                # Llamadas y resultados como function_call / function_response
+                text, calls = exchange
+                turns.append(("model", ([text] if text else []) + [
+                    {"function_call": {"name": name, "args": args}} for name, args, _ in calls
+                ]))
+                turns.append(("user", [
+                    {"function_response": {"name": name, "response": response}} for name, _, response in calls
+                ]))
+                i += 2
+                continue
+            
             role = msg.get("role", "user")
             content = msg.get("content", "")
-            
-            if role == "user":
-                prompt_parts.append(f"Usuario: {content}")
-            elif role == "assistant":
-                prompt_parts.append(f"Asistente: {content}")
+            if role == "assistant":
+                turns.append(("model", [content]))
             elif role == "system":
-                prompt_parts.append(f"Sistema: {content}")
+                turns.append(("user", [f"Sistema: {content}"]))
             elif role == "tool":
-                prompt_parts.append(f"Herramienta: {content}")
+                turns.append(("user", [f"Resultado de herramientas: {content}"]))
+            else:
+                turns.append(("user", [content]))
+            i += 1
+        
+        if turns and turns[0][0] == "model":
+            # El historial recortado puede empezar con una respuesta del asistente
+            turns.insert(0, ("user", ["(continuación de la conversación)"]))
         
-        return "\n\n".join(prompt_parts)
+        contents: List[Dict[str, Any]] = []
+        for role, parts in turns:
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].extend(parts)
+            else:
+                contents.append({"role": role, "parts": list(parts)})
+        return contents
+    
+    @staticmethod
+    def _parts_text(response) -> List[str]:
+        """Texto de la respuesta; las function calls se convierten en líneas USE_TOOL"""
+        texts = []
+        for candidate in response.candidates[:1]:
+            for part in candidate.content.parts:
+                function_call = getattr(part, "function_call", None)
+                if function_call and function_call.name:
+                    texts.append(format_tool_call(function_call.name, _to_plain(function_call.args or {})) + "\n")
+                elif getattr(part, "text", ""):
+                    texts.append(part.text)
+        return texts
+    
+    async def embed(self, text: str) -> List[float]:
+        """Embedding del texto (usado por el nivel semántico del cache de respuestas)"""
+        import google.generativeai as genai
+        result = await self._run_limited(lambda: asyncio.to_thread(
+            genai.embed_content, model="models/text-embedding-004", content=text
+        ))
+        return result["embedding"]
+    
+    async def _generate_content(self, contents: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None):
+        """Usar la API async del SDK; en versiones sin ella, un hilo del executor"""
+        if hasattr(self.model, "generate_content_async"):
+            return await self.model.generate_content_async(contents, tools=tools)
+        return await asyncio.to_thread(self.model.generate_content, contents, tools=tools)
+
+
+def _chat_tools(tools: Optional[List[Dict]]) -> Optional[List[Dict[str, Any]]]:
+    """Catálogo MCP en formato `tools` de las APIs compatibles con OpenAI"""
+    if not tools:
+        return None
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool.get("description", ""),
+                "parameters": tool_parameters_schema(tool)
+            }
+        }
+        for tool in tools
+    ]
+
+
+def _chat_messages(messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> List[Dict[str, Any]]:
+    """
+    Historial en formato chat (system/user/assistant/tool) compatible con OpenAI
+    Las llamadas a herramientas y sus resultados van como tool_calls y mensajes
+    `tool` con su tool_call_id
+    """
+    formatted_messages: List[Dict[str, Any]] = []
+    if tools:
+        formatted_messages.append({"role": "system", "content": TOOL_GUIDELINES})
+    
+    i = 0
+    while i < len(messages):
+        msg = messages[i]
+        exchange = _tool_exchange(msg, messages[i + 1]) if i + 1 < len(messages) else None
+        if exchange:
+            text, calls = exchange
+            call_ids = [f"call_{i}_{k}" for k in range(len(calls))]
+            formatted_messages.append({
+                "role": "assistant",
+                "content": text or None,
+                "tool_calls": [
+                    {
+                        "id": call_id,
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}
+                    }
+                    for call_id, (name, args, _) in zip(call_ids, calls)
+                ]
+            })
+            formatted_messages.extend(
+                {"role": "tool", "tool_call_id": call_id, "content": json.dumps(response, ensure_ascii=False, default=str)}
+                for call_id, (_, _, response) in zip(call_ids, calls)
+            )
+            i += 2
+            continue
+        
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        
+        if role in ["system", "user", "assistant"]:
+            formatted_messages.append({"role": role, "content": content})
+        elif role == "tool":
+            formatted_messages.append({"role": "system", "content": f"Resultado de herramientas: {content}"})
+        i += 1
+    
+    return formatted_messages
+
+
+def _chat_response_text(content: Optional[str], tool_calls: List[Tuple[str, str]]) -> str:
+    """Texto del mensaje más una línea USE_TOOL por cada tool call (nombre, argumentos JSON)"""
+    lines = [content] if content else []
+    lines.extend(_format_raw_tool_call(name, arguments) for name, arguments in tool_calls)
+    return "\n".join(lines)
+
+
+async def _chat_stream_text(chunks: AsyncIterator[Any]) -> AsyncIterator[str]:
+    """
+    Fragmentos de texto de un stream de chat compatible con OpenAI
+    Los argumentos de las tool calls llegan por partes: se acumulan y
+    cada llamada se emite completa al final
+    """
+    tool_calls: Dict[int, Dict[str, str]] = {}
+    async for chunk in chunks:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            yield delta.content
+        for call in delta.tool_calls or []:
+            entry = tool_calls.setdefault(call.index, {"name": "", "arguments": ""})
+            if call.function and call.function.name:
+                entry["name"] = call.function.name
+            if call.function and call.function.arguments:
+                entry["arguments"] += call.function.arguments
+    for index in sorted(tool_calls):
+        yield "\n" + _format_raw_tool_call(tool_calls[index]["name"], tool_calls[index]["arguments"])
 
 
 class OpenAIAdapter(LLMAdapter):
@@ -137,6 +441,7 @@ class OpenAIAdapter(LLMAdapter):
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY", "")
         self.client = None
+        self._init_limits("OPENAI")
         if self.api_key:
             try:
                 from openai import AsyncOpenAI
@@ -147,46 +452,49 @@ class OpenAIAdapter(LLMAdapter):
     def is_configured(self) -> bool:
         return bool(self.api_key and self.client)
     
+    def _request(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]], stream: bool = False) -> Dict[str, Any]:
+        request = {
+            "model": "gpt-3.5-turbo",
+            "messages": _chat_messages(messages, tools),
+            "temperature": 0.7,
+            "max_tokens": 1000
+        }
+        if tools:
+            request["tools"] = _chat_tools(tools)
+        if stream:
+            request["stream"] = True
+        return request
+    
     async def generate(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
         if not self.is_configured():
             raise Exception("OpenAI no está configurado. Configura OPENAI_API_KEY en .env")
         
         try:
-            # Preparar mensajes
-            formatted_messages = []
-            for msg in messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                
-                # OpenAI usa 'system', 'user', 'assistant'
-                if role in ["system", "user", "assistant"]:
-                    formatted_messages.append({"role": role, "content": content})
-                elif role == "tool":
-                    formatted_messages.append({"role": "system", "content": f"Resultado de herramienta: {content}"})
-            
-            # Agregar información de herramientas
-            if tools:
-                tools_message = "Herramientas disponibles:\n"
-                for tool in tools:
-                    tools_message += f"- {tool['name']}: {tool['description']}\n"
-                tools_message += "\nPara usar una herramienta, responde con: USE_TOOL:{nombre_herramienta}:{parametros_json}"
-                formatted_messages.insert(0, {"role": "system", "content": tools_message})
+            request = self._request(messages, tools)
             
             # Llamar a OpenAI
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=formatted_messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            response = await self._run_limited(lambda: self.client.chat.completions.create(**request))
             
-            return response.choices[0].message.content
+            message = response.choices[0].message
+            return _chat_response_text(
+                message.content,
+                [(call.function.name, call.function.arguments) for call in message.tool_calls or []]
+            )
             
         except Exception as e:
             raise Exception(f"Error en OpenAI: {str(e)}")
     
-    def wants_to_use_tool(self, response: str) -> bool:
-        return "USE_TOOL:" in response
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise Exception("OpenAI no está configurado. Configura OPENAI_API_KEY en .env")
+        
+        request = self._request(messages, tools, stream=True)
+        try:
+            chunks = self._stream_limited(lambda: self.client.chat.completions.create(**request))
+            async for text in _chat_stream_text(chunks):
+                yield text
+        except Exception as e:
+            raise Exception(f"Error en OpenAI: {str(e)}")
 
 
 class GroqAdapter(LLMAdapter):
@@ -195,6 +503,7 @@ class GroqAdapter(LLMAdapter):
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY", "")
         self.client = None
+        self._init_limits("GROQ")
         if self.api_key:
             try:
                 from groq import AsyncGroq
@@ -206,96 +515,159 @@ class GroqAdapter(LLMAdapter):
     def is_configured(self) -> bool:
         return bool(self.api_key and self.client)
     
+    def _request(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]], stream: bool = False) -> Dict[str, Any]:
+        request = {
+            "model": "llama-3.3-70b-versatile",
+            "messages": _chat_messages(messages, tools),
+            "temperature": 0.5,
+            "max_tokens": 1000
+        }
+        if tools:
+            request["tools"] = _chat_tools(tools)
+        if stream:
+            request["stream"] = True
+        return request
+    
     async def generate(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
         if not self.is_configured():
             raise Exception("Groq no está configurado. Configura GROQ_API_KEY en .env")
         
         try:
-            # Preparar mensajes
-            formatted_messages = []
-            
-            # Agregar herramientas como system message
-            if tools:
-                tools_message = """🔧 ERES UN ASISTENTE DE TURISMO CON ACCESO A HERRAMIENTAS REALES.
-
-HERRAMIENTAS DISPONIBLES:
-"""
-                for tool in tools:
-                    tools_message += f"- {tool['name']}: {tool['description']}\n"
-                    tools_message += f"  Parámetros: {tool.get('parameters', {})}\n"
-                
-                tools_message += """
-🚨 REGLAS OBLIGATORIAS:
-1. Si el usuario quiere CREAR una reserva → USA: USE_TOOL:crear_reserva:{"destino_id": "...", "fecha": "YYYY-MM-DD", "personas": N}
-2. Si el usuario quiere BUSCAR destinos → USA: USE_TOOL:buscar_destinos:{"query": "..."}
-3. Si el usuario quiere VER una reserva → USA: USE_TOOL:ver_reserva:{"reserva_id": "..."}
-4. Si el usuario quiere BUSCAR guías → USA: USE_TOOL:buscar_guias:{"especialidad": "..."}
-5. Si el usuario quiere ESTADÍSTICAS → USA: USE_TOOL:estadisticas_ventas:{}
-6. Si el usuario quiere CANCELAR una reserva → USA: USE_TOOL:cancelar_reserva:{"reserva_id": "..."}
-7. Si el usuario dice "mis reservas" o "quiero cancelar" SIN ID → USA: USE_TOOL:mis_reservas:{}
-
-🧠 FLUJO INTELIGENTE:
-- "quiero cancelar mi reserva" (sin ID) → Primero usa mis_reservas, luego pregunta cuál cancelar
-- "quiero reservar" (sin destino) → Primero usa buscar_destinos, luego pregunta cuál elegir
-
-⛔ NUNCA digas "no puedo hacer eso" o "no tengo acceso". TÚ SÍ PUEDES porque tienes las herramientas.
-⛔ NUNCA inventes información. USA las herramientas para obtener datos REALES.
-
-✅ Responde SOLO con el formato: USE_TOOL:nombre:{"param": "valor"}
-"""
-                formatted_messages.append({"role": "system", "content": tools_message})
-            
-            for msg in messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                
-                if role in ["system", "user", "assistant"]:
-                    formatted_messages.append({"role": role, "content": content})
-                elif role == "tool":
-                    formatted_messages.append({"role": "system", "content": f"Resultado: {content}"})
+            request = self._request(messages, tools)
             
             # Llamar a Groq
-            if self.client == "httpx":
-                # Fallback con httpx
-                import httpx
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        "https://api.groq.com/openai/v1/chat/completions",
-                        headers={"Authorization": f"Bearer {self.api_key}"},
-                        json={
-                            "model": "llama-3.3-70b-versatile",
-                            "messages": formatted_messages,
-                            "temperature": 0.5,
-                            "max_tokens": 1000
-                        }
-                    )
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-            else:
-                # Usar SDK oficial
-                response = await self.client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=formatted_messages,
-                    temperature=0.5,
-                    max_tokens=1000
-                )
-                return response.choices[0].message.content
+            return await self._run_limited(lambda: self._chat_completion(request))
             
         except Exception as e:
             raise Exception(f"Error en Groq: {str(e)}")
     
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        if not self.is_configured():
+            raise Exception("Groq no está configurado. Configura GROQ_API_KEY en .env")
+        if self.client == "httpx":
+            # El fallback con httpx no hace streaming: un único fragmento
+            yield await self.generate(messages, tools)
+            return
+        
+        request = self._request(messages, tools, stream=True)
+        try:
+            chunks = self._stream_limited(lambda: self.client.chat.completions.create(**request))
+            async for text in _chat_stream_text(chunks):
+                yield text
+        except Exception as e:
+            raise Exception(f"Error en Groq: {str(e)}")
+    
+    async def _chat_completion(self, request: Dict[str, Any]) -> str:
+        """Llamada a la API de Groq (SDK oficial o httpx)"""
+        if self.client == "httpx":
+            # Fallback con httpx
+            import httpx
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    "https://api.groq.com/openai/v1/chat/completions",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json=request
+                )
+                message = response.json()["choices"][0]["message"]
+                return _chat_response_text(
+                    message.get("content"),
+                    [
+                        (call["function"]["name"], call["function"].get("arguments", "{}"))
+                        for call in message.get("tool_calls") or []
+                    ]
+                )
+        
+        # Usar SDK oficial
+        response = await self.client.chat.completions.create(**request)
+        message = response.choices[0].message
+        return _chat_response_text(
+            message.content,
+            [(call.function.name, call.function.arguments) for call in message.tool_calls or []]
+        )
+
+
+class CachedLLMAdapter(LLMAdapter):
+    """
+    Decorador de un adaptador con cache de respuestas
+    En un acierto no se llama al proveedor (ni se consume cuota)
+    """
+    
+    def __init__(self, provider: LLMProvider, adapter: LLMAdapter, cache: ResponseCache):
+        self.provider = provider
+        self.adapter = adapter
+        self.cache = cache
+    
+    def is_configured(self) -> bool:
+        return self.adapter.is_configured()
+    
     def wants_to_use_tool(self, response: str) -> bool:
-        return "USE_TOOL:" in response
+        return self.adapter.wants_to_use_tool(response)
+    
+    async def generate(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
+        cached = await self.cache.get(self.provider.value, messages, tools)
+        if cached is not None:
+            return cached
+        response = await self.adapter.generate(messages, tools)
+        await self.cache.put(self.provider.value, messages, tools, response)
+        return response
+    
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        cached = await self.cache.get(self.provider.value, messages, tools)
+        if cached is not None:
+            yield cached
+            return
+        response = ""
+        async for chunk in self.adapter.generate_stream(messages, tools):
+            response += chunk
+            yield chunk
+        await self.cache.put(self.provider.value, messages, tools, response)
+
+
+class RoutedLLMAdapter(LLMAdapter):
+    """
+    Adaptador que delega en el ProviderRouter: `provider` es el preferido,
+    pero ante errores, lentitud o rate limit responde otro proveedor
+    """
+    
+    def __init__(self, provider: LLMProvider, router: ProviderRouter):
+        self.provider = provider
+        self.router = router
+    
+    def is_configured(self) -> bool:
+        return any(adapter.is_configured() for adapter in self.router.adapters.values())
+    
+    async def generate(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
+        return await self.router.generate(self.provider.value, messages, tools)
+    
+    async def generate_stream(self, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        async for chunk in self.router.generate_stream(self.provider.value, messages, tools):
+            yield chunk
 
 
 class LLMAdapterFactory:
     """Factory para crear adaptadores LLM"""
     
     def __init__(self):
-        self._adapters = {
-            LLMProvider.GEMINI: GeminiAdapter(),
+        gemini = GeminiAdapter()
+        self._providers: Dict[LLMProvider, LLMAdapter] = {
+            LLMProvider.GEMINI: gemini,
             LLMProvider.GROQ: GroqAdapter()
         }
+        
+        # Router con failover/hedging entre proveedores (el cache va por fuera:
+        # un acierto no consume rate limit ni afecta las latencias medidas)
+        self.router = create_provider_router(
+            {provider.value: adapter for provider, adapter in self._providers.items()}
+        )
+        
+        # Cache de respuestas por proveedor (embeddings de Gemini para el nivel semántico)
+        embed = gemini.embed if gemini.is_configured() else None
+        self._adapters: Dict[LLMProvider, LLMAdapter] = {}
+        for provider, adapter in self._providers.items():
+            if self.router:
+                adapter = RoutedLLMAdapter(provider, self.router)
+            cache = create_response_cache(embed)
+            self._adapters[provider] = CachedLLMAdapter(provider, adapter, cache) if cache else adapter
     
     def get_adapter(self, provider: LLMProvider) -> LLMAdapter:
         """Obtener adaptador según proveedor"""
@@ -306,5 +678,14 @@ class LLMAdapterFactory:
     
     def is_provider_configured(self, provider: LLMProvider) -> bool:
         """Verificar si un proveedor está configurado"""
-        adapter = self._adapters.get(provider)
+        adapter = self._providers.get(provider)
         return adapter.is_configured() if adapter else False
+    
+    def routing_stats(self, provider: LLMProvider) -> Optional[Dict[str, Any]]:
+        """Latencias p50/p95, tasa de error y rate limit del proveedor (None sin router)"""
+        return self.router.provider_stats(provider.value) if self.router else None
+    
+    def cache_stats(self, provider: LLMProvider) -> Optional[Dict[str, Any]]:
+        """Estadísticas del cache de respuestas del proveedor (None si está deshabilitado)"""
+        adapter = self._adapters.get(provider)
+        return adapter.cache.stats() if isinstance(adapter, CachedLLMAdapter) else None
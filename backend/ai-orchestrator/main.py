@@ -4,22 +4,54 @@ Orquesta interacciones con modelos de lenguaje y procesamiento multimodal
 """
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 from llm_adapters import LLMAdapterFactory, LLMProvider
-from multimodal_processor import MultimodalProcessor
+from multimodal_processor import MultimodalProcessor, parse_page_range
 from mcp_client import MCPClient
+from conversation_store import create_conversation_store
+from context_manager import create_context_manager
+from upload_limits import RequestSizeLimitMiddleware, spooled_upload, IMAGE_TYPES, PDF_TYPES
+import asyncio
 import json
 import uvicorn
 
 # Cargar variables de entorno
 load_dotenv()
 
-app = FastAPI(title="AI Orchestrator", version="1.0.0")
+# Inicializar componentes
+llm_factory = LLMAdapterFactory()
+multimodal_processor = MultimodalProcessor()
+mcp_client = MCPClient()
+conversation_store = create_conversation_store()
+context_manager = create_context_manager()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Catálogo de herramientas con JSON Schema (function calling nativo)
+    await mcp_client.get_tools()
+    yield
+    # Cerrar el pool de conexiones hacia el MCP Server
+    await mcp_client.close()
+    # Terminar los workers de extracción (OCR/PDF)
+    multimodal_processor.shutdown()
+
+app = FastAPI(title="AI Orchestrator", version="1.0.0", lifespan=lifespan)
 
-# CORS
+# Tamaño máximo por archivo subido; las peticiones multipart cuyo Content-Length
+# ya excede el de dos archivos (imagen + PDF) se rechazan antes de leer el cuerpo
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    max_bytes=2 * MAX_UPLOAD_BYTES + 1024 * 1024,
+    paths=("/chat/image", "/chat/pdf", "/chat/multimodal")
+)
+
+# CORS (se agrega al final para envolver también las respuestas 413)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://localhost:3000"],
@@ -28,11 +60,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar componentes
-llm_factory = LLMAdapterFactory()
-multimodal_processor = MultimodalProcessor()
-mcp_client = MCPClient()
-
 # Modelos
 class ChatRequest(BaseModel):
     message: str
@@ -47,8 +74,24 @@ class ChatResponse(BaseModel):
     tools_used: List[str] = []
     provider: str
 
-# Estado de conversaciones (en producción usar Redis)
-conversations: Dict[str, List[Dict]] = {}
+# Máximo de mensajes que se conservan por conversación; lo que se envía al
+# LLM se ajusta además al presupuesto de tokens del proveedor (context_manager)
+MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "40"))
+
+def fit_history(history: List[Dict[str, str]], provider: str) -> List[Dict[str, str]]:
+    """Historial compactado al presupuesto de tokens del proveedor"""
+    messages, stats = context_manager.compact(history, provider)
+    if stats["tokens_after"] < stats["tokens_before"]:
+        print(f"🗜️  Historial compactado: {stats['tokens_before']} → {stats['tokens_after']} tokens "
+              f"(ratio {stats['compaction_ratio']})")
+    return messages
+
+def _page_range_or_400(pages: Optional[str]) -> Optional[List[int]]:
+    """Rango de páginas del formulario ("1-3,7") o 400 si no es válido"""
+    try:
+        return parse_page_range(pages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Parámetro pages inválido: {e}")
 
 @app.get("/")
 async def root():
@@ -58,11 +101,13 @@ async def root():
         "version": "1.0.0",
         "endpoints": [
             "/chat/text",
+            "/chat/text/stream",
             "/chat/image",
             "/chat/pdf",
             "/chat/multimodal",
             "/providers",
-            "/tools"
+            "/tools",
+            "/extraction"
         ]
     }
 
@@ -88,8 +133,9 @@ async def chat_text(request: ChatRequest):
         print(f"🔑 Configurado: {llm_adapter.is_configured()}")
         
         # Obtener historial de conversación
-        conv_id = request.conversation_id or f"conv_{len(conversations)}"
-        history = conversations.get(conv_id, [])
+        conv_id = request.conversation_id or conversation_store.new_id()
+        history = await conversation_store.get(conv_id)
+        stored = len(history)
         
         # Agregar mensaje del usuario
         history.append({"role": "user", "content": request.message})
@@ -97,14 +143,14 @@ async def chat_text(request: ChatRequest):
         # Obtener herramientas MCP si están habilitadas
         tools = []
         if request.use_tools:
-            tools = mcp_client.get_available_tools()
+            tools = await mcp_client.get_tools()
         
         print(f"🛠️  Herramientas disponibles: {len(tools)}")
         print(f"👤 Usuario ID: {request.usuario_id}")
         
         # Generar respuesta
         response_text = await llm_adapter.generate(
-            messages=history,
+            messages=fit_history(history, request.provider),
             tools=tools if tools else None
         )
         
@@ -122,12 +168,12 @@ async def chat_text(request: ChatRequest):
             history.append({"role": "assistant", "content": response_text})
             history.append({"role": "tool", "content": json.dumps(tool_results)})
             print(f"🔄 Generando respuesta final con resultados...")
-            response_text = await llm_adapter.generate(messages=history)
+            response_text = await llm_adapter.generate(messages=fit_history(history, request.provider))
             print(f"✅ Respuesta final: {response_text[:100]}...")
         
         # Agregar respuesta al historial
         history.append({"role": "assistant", "content": response_text})
-        conversations[conv_id] = history[-10:]  # Mantener últimos 10 mensajes
+        await conversation_store.append(conv_id, history[stored:], max_messages=MAX_HISTORY_MESSAGES)
         
         return ChatResponse(
             response=response_text,
@@ -142,6 +188,119 @@ async def chat_text(request: ChatRequest):
         print(error_msg)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Marcador con el que el LLM pide ejecutar herramientas (no se reenvía al cliente)
+TOOL_MARKER = "USE_TOOL:"
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _emittable_length(text: str) -> int:
+    """
+    Cuántos caracteres del texto acumulado se pueden enviar al cliente:
+    todo lo anterior a un USE_TOOL: (o a un posible USE_TOOL: aún incompleto)
+    """
+    idx = text.find(TOOL_MARKER)
+    if idx != -1:
+        return idx
+    for k in range(min(len(TOOL_MARKER) - 1, len(text)), 0, -1):
+        if TOOL_MARKER.startswith(text[-k:]):
+            return len(text) - k
+    return len(text)
+
+@app.post("/chat/text/stream")
+async def chat_text_stream(request: ChatRequest):
+    """
+    Chat de texto con streaming (Server-Sent Events)
+    
+    Eventos:
+    - start: {conversation_id, provider}
+    - token: {text} fragmento de la respuesta a medida que lo genera el LLM
+    - tool_start / tool_end: {name, ...} ejecución de cada herramienta MCP
+    - done: {conversation_id, tools_used, provider}
+    - error: {detail}
+    """
+    provider_map = {
+        "gemini": LLMProvider.GEMINI,
+        "groq": LLMProvider.GROQ
+    }
+    llm_adapter = llm_factory.get_adapter(
+        provider_map.get(request.provider, LLMProvider.GEMINI)
+    )
+    conv_id = request.conversation_id or conversation_store.new_id()
+    
+    async def event_stream():
+        try:
+            yield _sse("start", {"conversation_id": conv_id, "provider": request.provider})
+            
+            history = await conversation_store.get(conv_id)
+            
+            stored = len(history)
+            history.append({"role": "user", "content": request.message})
+            tools = await mcp_client.get_tools() if request.use_tools else []
+            
+            # Primera generación: se reenvían los tokens salvo las líneas USE_TOOL
+            response_text = ""
+            sent = 0
+            async for chunk in llm_adapter.generate_stream(
+                messages=fit_history(history, request.provider), tools=tools or None
+            ):
+                response_text += chunk
+                emittable = _emittable_length(response_text)
+                if emittable > sent:
+                    yield _sse("token", {"text": response_text[sent:emittable]})
+                    sent = emittable
+            
+            tools_used = []
+            if request.use_tools and llm_adapter.wants_to_use_tool(response_text):
+                # Ejecutar herramientas reenviando sus eventos de inicio/fin
+                events: asyncio.Queue = asyncio.Queue()
+                
+                async def run_tools():
+                    try:
+                        return await mcp_client.execute_tools(
+                            response_text,
+                            usuario_id=request.usuario_id,
+                            on_event=lambda event, data: events.put_nowait((event, data))
+                        )
+                    finally:
+                        events.put_nowait(None)
+                
+                tools_task = asyncio.create_task(run_tools())
+                while (item := await events.get()) is not None:
+                    yield _sse(*item)
+                tool_results = await tools_task
+                tools_used = [tool["name"] for tool in tool_results]
+                
+                # Respuesta final con los resultados, en streaming
+                history.append({"role": "assistant", "content": response_text})
+                history.append({"role": "tool", "content": json.dumps(tool_results)})
+                response_text = ""
+                async for chunk in llm_adapter.generate_stream(messages=fit_history(history, request.provider)):
+                    response_text += chunk
+                    yield _sse("token", {"text": chunk})
+            elif sent < len(response_text):
+                yield _sse("token", {"text": response_text[sent:]})
+            
+            history.append({"role": "assistant", "content": response_text})
+            await conversation_store.append(conv_id, history[stored:], max_messages=MAX_HISTORY_MESSAGES)
+            
+            yield _sse("done", {
+                "conversation_id": conv_id,
+                "tools_used": tools_used,
+                "provider": request.provider
+            })
+            
+        except Exception as e:
+            print(f"❌ ERROR en streaming: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/chat/image")
 async def chat_image(
     image: UploadFile = File(...),
@@ -153,15 +312,10 @@ async def chat_image(
     Endpoint para procesar imágenes con OCR y análisis
     """
     try:
-        # Validar tipo de archivo
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
-        
-        # Leer imagen
-        image_data = await image.read()
-        
-        # Procesar imagen (OCR, análisis)
-        extracted_text = await multimodal_processor.process_image(image_data)
+        # Recibir por bloques (límite de tamaño y tipo real por magic bytes) y procesar (OCR)
+        async with spooled_upload(image, IMAGE_TYPES, MAX_UPLOAD_BYTES) as upload:
+            extracted_image = await multimodal_processor.process_image(upload)
+        extracted_text = extracted_image["text"]
         
         # Obtener adaptador LLM
         llm_adapter = llm_factory.get_adapter(
@@ -169,24 +323,28 @@ async def chat_image(
         )
         
         # Preparar prompt con contexto de la imagen
-        conv_id = conversation_id or f"conv_{len(conversations)}"
-        history = conversations.get(conv_id, [])
+        conv_id = conversation_id or conversation_store.new_id()
+        history = await conversation_store.get(conv_id)
+        stored = len(history)
         
         combined_message = f"{message}\n\nTexto extraído de la imagen:\n{extracted_text}"
         history.append({"role": "user", "content": combined_message})
         
         # Generar respuesta
-        response_text = await llm_adapter.generate(messages=history)
+        response_text = await llm_adapter.generate(messages=fit_history(history, provider))
         history.append({"role": "assistant", "content": response_text})
-        conversations[conv_id] = history[-10:]
+        await conversation_store.append(conv_id, history[stored:], max_messages=MAX_HISTORY_MESSAGES)
         
         return {
             "response": response_text,
             "conversation_id": conv_id,
             "extracted_text": extracted_text,
+            "ocr": extracted_image["ocr"],
             "provider": provider
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -195,21 +353,20 @@ async def chat_pdf(
     pdf: UploadFile = File(...),
     message: str = Form(...),
     provider: str = Form("gemini"),
-    conversation_id: Optional[str] = Form(None)
+    conversation_id: Optional[str] = Form(None),
+    pages: Optional[str] = Form(None)
 ):
     """
     Endpoint para procesar PDFs y extraer información
+    `pages` ("1-3,7") limita la extracción a esas páginas; sin él se eligen
+    las páginas que coinciden con la pregunta hasta el presupuesto de caracteres
     """
     try:
-        # Validar tipo de archivo
-        if not pdf.content_type == "application/pdf":
-            raise HTTPException(status_code=400, detail="El archivo debe ser un PDF")
-        
-        # Leer PDF
-        pdf_data = await pdf.read()
-        
-        # Procesar PDF
-        extracted_data = await multimodal_processor.process_pdf(pdf_data)
+        page_range = _page_range_or_400(pages)
+
+        # Recibir por bloques (límite de tamaño y tipo real por magic bytes) y procesar
+        async with spooled_upload(pdf, PDF_TYPES, MAX_UPLOAD_BYTES) as upload:
+            extracted_data = await multimodal_processor.process_pdf(upload, pages=page_range, question=message)
         
         # Obtener adaptador LLM
         llm_adapter = llm_factory.get_adapter(
@@ -217,16 +374,17 @@ async def chat_pdf(
         )
         
         # Preparar prompt con contexto del PDF
-        conv_id = conversation_id or f"conv_{len(conversations)}"
-        history = conversations.get(conv_id, [])
+        conv_id = conversation_id or conversation_store.new_id()
+        history = await conversation_store.get(conv_id)
+        stored = len(history)
         
         combined_message = f"{message}\n\nContenido extraído del PDF:\n{extracted_data['text']}\n\nMetadatos: {json.dumps(extracted_data['metadata'])}"
         history.append({"role": "user", "content": combined_message})
         
         # Generar respuesta
-        response_text = await llm_adapter.generate(messages=history)
+        response_text = await llm_adapter.generate(messages=fit_history(history, provider))
         history.append({"role": "assistant", "content": response_text})
-        conversations[conv_id] = history[-10:]
+        await conversation_store.append(conv_id, history[stored:], max_messages=MAX_HISTORY_MESSAGES)
         
         return {
             "response": response_text,
@@ -235,6 +393,8 @@ async def chat_pdf(
             "provider": provider
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -244,25 +404,31 @@ async def chat_multimodal(
     provider: str = Form("gemini"),
     conversation_id: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    pdf: Optional[UploadFile] = File(None)
+    pdf: Optional[UploadFile] = File(None),
+    pages: Optional[str] = Form(None)
 ):
     """
     Endpoint unificado para procesamiento multimodal
     """
     try:
+        page_range = _page_range_or_400(pages)
         extracted_content = []
+        image_ocr = None
+        pdf_extraction = None
         
         # Procesar imagen si existe
         if image:
-            image_data = await image.read()
-            text = await multimodal_processor.process_image(image_data)
-            extracted_content.append(f"Imagen: {text}")
+            async with spooled_upload(image, IMAGE_TYPES, MAX_UPLOAD_BYTES) as upload:
+                extracted_image = await multimodal_processor.process_image(upload)
+            extracted_content.append(f"Imagen: {extracted_image['text']}")
+            image_ocr = extracted_image["ocr"]
         
         # Procesar PDF si existe
         if pdf:
-            pdf_data = await pdf.read()
-            data = await multimodal_processor.process_pdf(pdf_data)
+            async with spooled_upload(pdf, PDF_TYPES, MAX_UPLOAD_BYTES) as upload:
+                data = await multimodal_processor.process_pdf(upload, pages=page_range, question=message)
             extracted_content.append(f"PDF: {data['text']}")
+            pdf_extraction = data.get("extraction")
         
         # Obtener adaptador LLM
         llm_adapter = llm_factory.get_adapter(
@@ -270,8 +436,9 @@ async def chat_multimodal(
         )
         
         # Preparar mensaje completo
-        conv_id = conversation_id or f"conv_{len(conversations)}"
-        history = conversations.get(conv_id, [])
+        conv_id = conversation_id or conversation_store.new_id()
+        history = await conversation_store.get(conv_id)
+        stored = len(history)
         
         full_message = message
         if extracted_content:
@@ -280,17 +447,21 @@ async def chat_multimodal(
         history.append({"role": "user", "content": full_message})
         
         # Generar respuesta
-        response_text = await llm_adapter.generate(messages=history)
+        response_text = await llm_adapter.generate(messages=fit_history(history, provider))
         history.append({"role": "assistant", "content": response_text})
-        conversations[conv_id] = history[-10:]
+        await conversation_store.append(conv_id, history[stored:], max_messages=MAX_HISTORY_MESSAGES)
         
         return {
             "response": response_text,
             "conversation_id": conv_id,
             "extracted_content": extracted_content,
+            "image_ocr": image_ocr,
+            "pdf_extraction": pdf_extraction,
             "provider": provider
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -304,14 +475,20 @@ async def get_providers():
             {
                 "id": "gemini",
                 "name": "Google Gemini",
-                "available": llm_factory.is_provider_configured(LLMProvider.GEMINI)
+                "available": llm_factory.is_provider_configured(LLMProvider.GEMINI),
+                "cache": llm_factory.cache_stats(LLMProvider.GEMINI),
+                "routing": llm_factory.routing_stats(LLMProvider.GEMINI)
             },
             {
-                "id": "openai",
-                "name": "OpenAI GPT",
-                "available": llm_factory.is_provider_configured(LLMProvider.OPENAI)
+                "id": "groq",
+                "name": "Groq",
+                "available": llm_factory.is_provider_configured(LLMProvider.GROQ),
+                "cache": llm_factory.cache_stats(LLMProvider.GROQ),
+                "routing": llm_factory.routing_stats(LLMProvider.GROQ)
             }
-        ]
+        ],
+        "routing": llm_factory.router.stats_summary() if llm_factory.router else None,
+        "context": context_manager.stats()
     }
 
 @app.get("/tools")
@@ -320,21 +497,28 @@ async def get_tools():
     Listar herramientas MCP disponibles
     """
     try:
-        tools = mcp_client.get_available_tools()
+        tools = await mcp_client.get_tools()
         return {
             "tools": tools,
-            "count": len(tools)
+            "count": len(tools),
+            "cache": mcp_client.tool_cache.stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/extraction")
+async def get_extraction_stats():
+    """
+    Estado de la extracción multimodal (pool de procesos y cache por contenido)
+    """
+    return multimodal_processor.stats()
+
 @app.delete("/conversation/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """
     Eliminar historial de conversación
     """
-    if conversation_id in conversations:
-        del conversations[conversation_id]
+    if await conversation_store.delete(conversation_id):
         return {"message": "Conversación eliminada"}
     raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
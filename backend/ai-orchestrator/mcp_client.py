@@ -2,15 +2,43 @@
 Cliente MCP - Conexión con MCP Server
 Permite al LLM ejecutar herramientas de negocio
 """
+import asyncio
 import httpx
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import os
 import json
 import re
+import time
 
+from tool_cache import create_tool_cache, INVALIDATING_TOOLS
 
-# Cache global para reservas del usuario (para resolver "cancelar la 1")
-_reservas_cache: Dict[str, List[Dict]] = {}
+# Herramientas con efectos: se ejecutan solas y en orden (nunca en paralelo)
+ACTION_TOOLS = {"crear_reserva", "cancelar_reserva"}
+
+# Segundos entre reintentos de descarga del catálogo si el MCP Server no respondió
+TOOLS_RETRY_SECONDS = 60
+
+
+def parse_tool_calls(llm_response: str) -> List[Tuple[str, str]]:
+    """
+    Extraer las llamadas USE_TOOL:nombre:{json} de una respuesta
+    El JSON se lee con un decodificador real (admite objetos anidados);
+    si es inválido se retorna el resto de la línea para reportar el error
+    """
+    decoder = json.JSONDecoder()
+    calls = []
+    for match in re.finditer(r'USE_TOOL:(\w+):', llm_response):
+        start = match.end()
+        while start < len(llm_response) and llm_response[start] in " \t":
+            start += 1
+        try:
+            _, end = decoder.raw_decode(llm_response, start)
+            calls.append((match.group(1), llm_response[start:end]))
+        except json.JSONDecodeError:
+            line_end = llm_response.find("\n", start)
+            calls.append((match.group(1), llm_response[start:line_end if line_end != -1 else None]))
+    return calls
 
 
 class MCPClient:
@@ -19,21 +47,53 @@ class MCPClient:
     def __init__(self):
         self.mcp_base_url = os.getenv("MCP_SERVER_URL", "http://localhost:8005")
         self.timeout = 30.0
+        self.max_parallel_tools = int(os.getenv("MCP_MAX_PARALLEL_TOOLS", "4"))
+        self.max_connections = int(os.getenv("MCP_MAX_CONNECTIONS", "20"))
+        # Varias consultas en un turno se envían juntas a POST /tools/batch
+        self.batch_enabled = os.getenv("MCP_BATCH_ENABLED", "true").lower() == "true"
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # Resultados de herramientas por usuario (cache de rendimiento, con TTL)
+        self.tool_cache = create_tool_cache()
+        # Último listado de mis_reservas mostrado a cada usuario: resuelve
+        # "cancelar la 1" hasta el siguiente listado. No se invalida al crear o
+        # cancelar (los números siguen siendo los que vio el usuario); LRU con
+        # tope TOOL_CACHE_MAX_ENTRIES y se descarta tras LAST_LISTING_IDLE_SECONDS sin uso
+        self._last_reservas: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self.last_listing_max_entries = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000"))
+        self.last_listing_idle_seconds = float(os.getenv("LAST_LISTING_IDLE_SECONDS", "1800"))
+        # Catálogo (con JSON Schema) descargado una vez del MCP Server
+        self._tools: Optional[List[Dict[str, Any]]] = None
+        self._tools_attempt = 0.0
+    
+    async def get_tools(self) -> List[Dict[str, Any]]:
+        """
+        Catálogo de herramientas del MCP Server (GET /tools), descargado una
+        sola vez; mientras no esté disponible se usa get_available_tools()
+        """
+        if self._tools is None and time.time() - self._tools_attempt > TOOLS_RETRY_SECONDS:
+            self._tools_attempt = time.time()
+            try:
+                response = await self._get_http_client().get(f"{self.mcp_base_url}/tools")
+                response.raise_for_status()
+                self._tools = response.json()["tools"]
+                print(f"🛠️  Catálogo MCP cargado: {len(self._tools)} herramientas")
+            except Exception as e:
+                print(f"⚠️  No se pudo obtener /tools del MCP Server: {e}, usando catálogo local")
+        return self._tools or self.get_available_tools()
     
     def get_available_tools(self) -> List[Dict[str, Any]]:
         """
-        Obtener lista de herramientas disponibles del MCP Server
+        Catálogo local de respaldo (cuando el MCP Server no responde)
         """
         try:
-            # Por ahora retornamos herramientas hardcoded
-            # En producción, esto vendría del MCP Server
             return [
                 {
                     "name": "buscar_destinos",
                     "description": "Busca destinos turísticos disponibles por ubicación, categoría o nombre",
                     "parameters": {
                         "query": "texto de búsqueda",
-                        "categoria": "playa, montaña, ciudad, etc. (opcional)"
+                        "categoria": "playa, montaña, ciudad, etc. (opcional)",
+                        "provincia": "provincia de Ecuador (opcional)"
                     }
                 },
                 {
@@ -85,100 +145,290 @@ class MCPClient:
             print(f"Error obteniendo herramientas: {e}")
             return []
     
-    async def execute_tools(self, llm_response: str, usuario_id: str = None) -> List[Dict[str, Any]]:
+    async def execute_tools(
+        self,
+        llm_response: str,
+        usuario_id: str = None,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Ejecutar herramientas basadas en la respuesta del LLM
         Formato esperado: USE_TOOL:nombre_herramienta:{"param": "value"}
-        """
-        global _reservas_cache
-        results = []
         
+        Las herramientas de consulta consecutivas se ejecutan en paralelo (en un
+        solo lote al MCP Server o, sin lotes, como máximo max_parallel_tools a
+        la vez); las de acción (ACTION_TOOLS) actúan
+        como barrera y se ejecutan solas y en el orden pedido, así una consulta
+        posterior ve su efecto. Los resultados se retornan en el orden original.
+        
+        on_event (opcional) recibe ("tool_start" | "tool_end", datos) por cada
+        herramienta, p.ej. para notificar al cliente en el chat con streaming
+        """
         # Buscar patrones de uso de herramientas
-        tool_pattern = r'USE_TOOL:(\w+):(\{.*?\})'
-        matches = re.findall(tool_pattern, llm_response)
+        matches = parse_tool_calls(llm_response)
         
-        for tool_name, params_json in matches:
-            try:
-                params = json.loads(params_json)
-                
-                # Agregar usuario_id a herramientas que lo necesitan
-                if tool_name == "crear_reserva" and usuario_id:
-                    params["usuario_id"] = usuario_id
-                
-                # Para mis_reservas, agregar usuario_id
-                if tool_name == "mis_reservas" and usuario_id:
-                    params["usuario_id"] = usuario_id
-                
-                # Para cancelar_reserva, resolver ID si no se proporcionó
-                if tool_name == "cancelar_reserva":
-                    reserva_id = params.get("reserva_id", "")
-                    
-                    # Si el ID está vacío o es un número (1, 2, 3), resolver desde cache
-                    if not reserva_id or reserva_id.isdigit():
-                        cache_key = usuario_id or "default"
-                        cached_reservas = _reservas_cache.get(cache_key, [])
-                        
-                        if cached_reservas:
-                            # Si es número, usar como índice
-                            if reserva_id.isdigit():
-                                idx = int(reserva_id) - 1  # "1" → índice 0
-                                if 0 <= idx < len(cached_reservas):
-                                    params["reserva_id"] = cached_reservas[idx].get("id")
-                                    print(f"🔄 Resuelto 'reserva {reserva_id}' → ID: {params['reserva_id']}")
-                            else:
-                                # Si está vacío y hay solo 1 reserva, usar esa
-                                if len(cached_reservas) == 1:
-                                    params["reserva_id"] = cached_reservas[0].get("id")
-                                    print(f"🔄 Solo 1 reserva, usando ID: {params['reserva_id']}")
-                
-                result = await self._execute_single_tool(tool_name, params)
-                
-                # Si es mis_reservas, guardar en cache
-                if tool_name == "mis_reservas" and result:
-                    try:
-                        data = result.get("data", {})
-                        reservas = data.get("reservas", [])
-                        cache_key = usuario_id or "default"
-                        _reservas_cache[cache_key] = reservas
-                        print(f"💾 Cacheadas {len(reservas)} reservas para usuario {cache_key}")
-                    except:
-                        pass
+        # Agrupar en fases: consultas consecutivas juntas, cada acción aparte
+        phases: List[List[int]] = []
+        for index, (tool_name, _) in enumerate(matches):
+            if tool_name in ACTION_TOOLS or not phases or matches[phases[-1][0]][0] in ACTION_TOOLS:
+                phases.append([index])
+            else:
+                phases[-1].append(index)
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(matches)
+        semaphore = asyncio.Semaphore(self.max_parallel_tools)
+        
+        async def run(index: int):
+            async with semaphore:
+                tool_name, params_json = matches[index]
+                results[index] = await self._run_tool_call(tool_name, params_json, usuario_id, on_event)
+        
+        for phase in phases:
+            if self.batch_enabled and len(phase) > 1:
+                # Varias consultas en el mismo turno: una sola petición al MCP Server
+                phase_results = await self._run_tool_batch([matches[index] for index in phase], usuario_id, on_event)
+                for index, result in zip(phase, phase_results):
+                    results[index] = result
+            else:
+                await asyncio.gather(*(run(index) for index in phase))
+        
+        return results
+    
+    def _prepare_params(self, tool_name: str, params_json: str, usuario_id: Optional[str]) -> Dict[str, Any]:
+        """Parámetros de la llamada con el usuario inyectado y la reserva resuelta"""
+        params = json.loads(params_json)
+        
+        # Agregar usuario_id a herramientas que lo necesitan
+        if tool_name == "crear_reserva" and usuario_id:
+            params["usuario_id"] = usuario_id
+        
+        # Para mis_reservas, agregar usuario_id
+        if tool_name == "mis_reservas" and usuario_id:
+            params["usuario_id"] = usuario_id
+        
+        # Para cancelar_reserva, resolver ID si no se proporcionó
+        if tool_name == "cancelar_reserva":
+            # El proveedor puede enviar el número como entero
+            reserva_id = str(params.get("reserva_id") or "").strip()
+            
+            # Si el ID está vacío o es un número (1, 2, 3), resolver desde
+            # el último listado de mis_reservas que vio el usuario
+            if not reserva_id or reserva_id.isdigit():
+                cached_reservas = self._last_listing(usuario_id)
                 
-                results.append({
+                if cached_reservas:
+                    # Si es número, usar como índice
+                    if reserva_id.isdigit():
+                        idx = int(reserva_id) - 1  # "1" → índice 0
+                        if 0 <= idx < len(cached_reservas):
+                            params["reserva_id"] = cached_reservas[idx].get("id")
+                            print(f"🔄 Resuelto 'reserva {reserva_id}' → ID: {params['reserva_id']}")
+                    else:
+                        # Si está vacío y hay solo 1 reserva, usar esa
+                        if len(cached_reservas) == 1:
+                            params["reserva_id"] = cached_reservas[0].get("id")
+                            print(f"🔄 Solo 1 reserva, usando ID: {params['reserva_id']}")
+        
+        return params
+    
+    def _remember_listing(self, tool_name: str, usuario_id: Optional[str], result: Any):
+        """Guardar el listado de mis_reservas que se le muestra al usuario"""
+        if tool_name != "mis_reservas" or not isinstance(result, dict):
+            return
+        reservas = (result.get("data") or {}).get("reservas")
+        if not isinstance(reservas, list):
+            return
+        key = usuario_id or "default"
+        self._last_reservas[key] = (time.monotonic(), reservas)
+        self._last_reservas.move_to_end(key)
+        while len(self._last_reservas) > self.last_listing_max_entries:
+            self._last_reservas.popitem(last=False)
+    
+    def _last_listing(self, usuario_id: Optional[str]) -> List[Dict]:
+        """Último listado de mis_reservas del usuario ([] si no hay o expiró por inactividad)"""
+        key = usuario_id or "default"
+        entry = self._last_reservas.get(key)
+        if entry is None:
+            return []
+        used_at, reservas = entry
+        now = time.monotonic()
+        if now - used_at > self.last_listing_idle_seconds:
+            del self._last_reservas[key]
+            return []
+        self._last_reservas[key] = (now, reservas)
+        self._last_reservas.move_to_end(key)
+        return reservas
+    
+    def _store_result(self, tool_name: str, params: Dict[str, Any], usuario_id: Optional[str], result: Any):
+        """Actualizar el cache de resultados tras ejecutar una herramienta"""
+        self._remember_listing(tool_name, usuario_id, result)
+        if tool_name in INVALIDATING_TOOLS:
+            # Las reservas del usuario cambiaron: descartar su cache
+            self.tool_cache.invalidate_user(usuario_id)
+        else:
+            self.tool_cache.put(usuario_id, tool_name, params, result)
+    
+    async def _run_tool_call(
+        self,
+        tool_name: str,
+        params_json: str,
+        usuario_id: Optional[str],
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]]
+    ) -> Dict[str, Any]:
+        """Preparar parámetros, ejecutar una herramienta y actualizar el cache de reservas"""
+        def notify(event: str, data: Dict[str, Any]):
+            if on_event:
+                on_event(event, data)
+        
+        try:
+            params = self._prepare_params(tool_name, params_json, usuario_id)
+            
+            notify("tool_start", {"name": tool_name, "params": params})
+            
+            # Acierto en cache: no se consulta al MCP Server
+            result = self.tool_cache.get(usuario_id, tool_name, params)
+            if result is not None:
+                print(f"💾 Resultado de {tool_name} servido desde cache")
+                self._remember_listing(tool_name, usuario_id, result)
+                notify("tool_end", {"name": tool_name, "success": True, "cached": True})
+                return {
                     "name": tool_name,
                     "params": params,
                     "result": result
-                })
+                }
+            
+            result = await self._execute_single_tool(tool_name, params)
+            notify("tool_end", {"name": tool_name, "success": True})
+            self._store_result(tool_name, params, usuario_id, result)
+            
+            return {
+                "name": tool_name,
+                "params": params,
+                "result": result
+            }
+        except Exception as e:
+            notify("tool_end", {"name": tool_name, "success": False, "error": str(e)})
+            return {
+                "name": tool_name,
+                "params": params_json,
+                "error": str(e)
+            }
+    
+    async def _run_tool_batch(
+        self,
+        calls: List[Tuple[str, str]],
+        usuario_id: Optional[str],
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecutar varias herramientas de consulta con una sola petición a
+        POST /tools/batch (los aciertos de cache no se envían). Si el MCP
+        Server no admite lotes se ejecutan por separado en paralelo
+        """
+        def notify(event: str, data: Dict[str, Any]):
+            if on_event:
+                on_event(event, data)
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+        pending: List[Tuple[int, str, Dict[str, Any]]] = []
+        for index, (tool_name, params_json) in enumerate(calls):
+            try:
+                params = self._prepare_params(tool_name, params_json, usuario_id)
             except Exception as e:
-                results.append({
-                    "name": tool_name,
-                    "params": params_json,
-                    "error": str(e)
-                })
+                notify("tool_end", {"name": tool_name, "success": False, "error": str(e)})
+                results[index] = {"name": tool_name, "params": params_json, "error": str(e)}
+                continue
+            
+            notify("tool_start", {"name": tool_name, "params": params})
+            cached = self.tool_cache.get(usuario_id, tool_name, params)
+            if cached is not None:
+                print(f"💾 Resultado de {tool_name} servido desde cache")
+                self._remember_listing(tool_name, usuario_id, cached)
+                notify("tool_end", {"name": tool_name, "success": True, "cached": True})
+                results[index] = {"name": tool_name, "params": params, "result": cached}
+            else:
+                pending.append((index, tool_name, params))
+        
+        batch_results = None
+        if len(pending) > 1:
+            batch_results = await self._execute_batch([(tool_name, params) for _, tool_name, params in pending])
+        if batch_results is None:
+            semaphore = asyncio.Semaphore(self.max_parallel_tools)
+            
+            async def run_single(tool_name: str, params: Dict[str, Any]) -> Any:
+                async with semaphore:
+                    return await self._execute_single_tool(tool_name, params)
+            
+            batch_results = await asyncio.gather(*(run_single(tool_name, params) for _, tool_name, params in pending))
+        
+        for (index, tool_name, params), result in zip(pending, batch_results):
+            notify("tool_end", {"name": tool_name, "success": True})
+            self._store_result(tool_name, params, usuario_id, result)
+            results[index] = {"name": tool_name, "params": params, "result": result}
         
         return results
     
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP persistente con pool de conexiones hacia el MCP Server"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._http_client
+    
+    async def close(self):
+        """Cerrar el cliente HTTP (al apagar el servicio)"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+    
+    async def _execute_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> Optional[List[Any]]:
+        """
+        Ejecutar varias herramientas en una petición (POST /tools/batch)
+        None si el MCP Server no respondió al lote (el llamador ejecuta por separado)
+        """
+        try:
+            response = await self._get_http_client().post(
+                f"{self.mcp_base_url}/tools/batch",
+                json={"calls": [{"tool": tool_name, "params": params} for tool_name, params in calls]}
+            )
+            if response.status_code != 200:
+                print(f"⚠️  Lote no disponible ({response.status_code}), ejecutando por separado")
+                return None
+            body = response.json()
+            results = body.get("results")
+            if not isinstance(results, list) or len(results) != len(calls):
+                return None
+            print(f"📡 MCP Server respondió el lote: {body.get('stats')}")
+            return results
+        except Exception as e:
+            print(f"⚠️  Error en el lote: {str(e)}, ejecutando por separado")
+            return None
+    
     async def _execute_single_tool(self, tool_name: str, params: Dict[str, Any]) -> Any:
         """
         Ejecutar una herramienta específica
         """
         try:
             # Intentar conectar al MCP Server real
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # El MCP Server espera formato: {"params": {...}}
-                response = await client.post(
-                    f"{self.mcp_base_url}/tools/{tool_name}",
-                    json={"params": params},
-                    follow_redirects=True
-                )
-                
-                print(f"📡 MCP Server respondió: {response.status_code}")
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"⚠️  Error {response.status_code}, usando datos simulados")
-                    return await self._simulate_tool_execution(tool_name, params)
+            # El MCP Server espera formato: {"params": {...}}
+            response = await self._get_http_client().post(
+                f"{self.mcp_base_url}/tools/{tool_name}",
+                json={"params": params}
+            )
+            
+            print(f"📡 MCP Server respondió: {response.status_code}")
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"⚠️  Error {response.status_code}, usando datos simulados")
+                return await self._simulate_tool_execution(tool_name, params)
                     
         except Exception as e:
             print(f"❌ Error conectando a MCP Server: {str(e)}, usando datos simulados")
@@ -1,119 +1,476 @@
 """
 Procesador Multimodal
 Maneja diferentes tipos de entrada: imágenes (OCR), PDFs, etc.
+
+La extracción (OCR y parseo de PDF) es CPU intensiva: se ejecuta en procesos
+worker (como máximo EXTRACTION_WORKERS), fuera del event loop, con timeout por
+trabajo. Cada trabajo ocupa un worker propio: si excede el timeout se termina
+solo ese proceso, sin afectar las extracciones de otros usuarios.
+Los archivos llegan ya en disco (ver upload_limits): los workers los abren
+por ruta en lugar de recibir los bytes serializados
 """
-from typing import Dict, Any
-import io
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
-from PIL import Image
-import pytesseract
-import PyPDF2
+import re
+import time
+import unicodedata
 import pdfplumber
+from extraction_cache import ExtractionCache, create_extraction_cache
+from ocr_pipeline import ocr_image
+from upload_limits import SpooledUpload
+
+
+class ExtractionTimeoutError(Exception):
+    """La extracción superó el timeout por trabajo"""
+    pass
+
+
+class WorkerCrashedError(Exception):
+    """El proceso worker murió durante el trabajo (p. ej. sin memoria)"""
+    pass
+
+
+# ==================== WORKERS ====================
+
+def _worker_loop(conn):
+    """Bucle del proceso worker: recibe (trabajo, args) y responde (ok, resultado | excepción)"""
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        job, args = task
+        try:
+            reply = (True, job(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Resultado o excepción no serializable
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class ExtractionWorker:
+    """
+    Un proceso worker propio (multiprocessing.Process) que ejecuta trabajos de
+    a uno. Al ser dueños del proceso se lo puede terminar si excede el timeout
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context()
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(self, job: Callable[..., Any], *args) -> Any:
+        """Ejecutar un trabajo y esperar su resultado (bloqueante: se llama desde un hilo)"""
+        try:
+            self._conn.send((job, args))
+            ok, value = self._conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerCrashedError(f"El proceso worker {self.process.pid} terminó inesperadamente") from e
+        if ok:
+            return value
+        raise value
+
+    def terminate(self):
+        """Terminar el proceso aunque tenga un trabajo en curso"""
+        self.process.terminate()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            print(f"⚠️ El worker {self.process.pid} no terminó con SIGTERM: se fuerza con SIGKILL")
+            self.process.kill()
+            self.process.join(timeout=5)
+        self._conn.close()
+
+    def close(self):
+        """Cerrar un worker libre (termina su bucle)"""
+        try:
+            self._conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._conn.close()
+
+
+# ==================== TRABAJOS (se ejecutan en los procesos worker) ====================
+
+# Palabras que no sirven para elegir páginas relevantes
+STOPWORDS = {
+    "para", "como", "este", "esta", "estos", "estas", "cual", "cuales", "cuanto", "cuanta",
+    "donde", "cuando", "quiero", "quisiera", "puedes", "podrias", "sobre", "tiene", "tienen",
+    "unos", "unas", "documento", "archivo", "pagina", "paginas", "dime", "informacion", "what", "which", "about"
+}
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas y sin tildes (para comparar palabras clave)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def extract_keywords(message: str, limit: int = 10) -> List[str]:
+    """Palabras clave de la pregunta del usuario para elegir páginas relevantes"""
+    keywords: List[str] = []
+    for word in re.findall(r"\w+", fold_text(message or "")):
+        if len(word) >= 4 and word not in STOPWORDS and not word.isdigit() and word not in keywords:
+            keywords.append(word)
+    return keywords[:limit]
+
+
+MAX_PAGE_RANGE = 10000
+
+
+def parse_page_range(spec: Optional[str]) -> Optional[List[int]]:
+    """
+    "1-3,7" -> [1, 2, 3, 7] (páginas desde 1, sin repetir, en orden)
+    ValueError si el formato no es válido
+    """
+    if not spec or not spec.strip():
+        return None
+    pages = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (int(n) for n in part.split("-", 1))
+        else:
+            first = last = int(part)
+        if first < 1 or last < first:
+            raise ValueError(f"Rango de páginas inválido: {part}")
+        if last - first >= MAX_PAGE_RANGE or len(pages) >= MAX_PAGE_RANGE:
+            raise ValueError("Rango de páginas demasiado grande")
+        pages.update(range(first, last + 1))
+    return sorted(pages) or None
+
+
+def _scan_page_texts(path: str) -> Optional[List[str]]:
+    """
+    Texto crudo de cada página con pdfium (sin análisis de layout, mucho más
+    rápido que pdfplumber) solo para puntuar relevancia. None si no está disponible
+    """
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+    pdf = pdfium.PdfDocument(path)
+    try:
+        texts = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        pdf.close()
+
+
+def _select_pages(path: str, total: int, page_range: Optional[List[int]], keywords: Optional[List[str]]):
+    """
+    Orden en que se extraen las páginas y modo de selección:
+    - range: las páginas pedidas
+    - relevance: las que contienen las palabras clave, de mayor a menor coincidencia
+    - sequential: desde el inicio
+    """
+    if page_range:
+        return [n for n in page_range if n <= total], "range"
+    if keywords:
+        texts = _scan_page_texts(path)
+        if texts:
+            scores = []
+            for page_num, text in enumerate(texts, 1):
+                folded = fold_text(text)
+                score = sum(folded.count(keyword) for keyword in keywords)
+                if score:
+                    scores.append((-score, page_num))
+            if scores:
+                return [page_num for _, page_num in sorted(scores)], "relevance"
+    return list(range(1, total + 1)), "sequential"
+
 
-# Configurar ruta de Tesseract en Windows
-if os.name == 'nt':
-    tesseract_paths = [
-        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-        r"C:\Users\DESKTOP\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
-    ]
-    for path in tesseract_paths:
-        if os.path.exists(path):
-            pytesseract.pytesseract.tesseract_cmd = path
-            break
+def _extract_pdf(
+    path: str,
+    max_pages: int,
+    max_chars: int,
+    page_range: Optional[List[int]] = None,
+    keywords: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Una sola pasada con pdfplumber: metadatos, texto y tablas de cada página
+    Se detiene al alcanzar el presupuesto de caracteres (`max_chars`) o de
+    páginas (`max_pages`); las páginas no seleccionadas no se parsean
+    """
+    started = time.perf_counter()
+    result = {
+        "text": "",
+        "metadata": {},
+        "pages": 0,
+        "pages_processed": 0,
+        "tables": []
+    }
+
+    with pdfplumber.open(path) as pdf:
+        metadata = pdf.metadata or {}
+        result["pages"] = len(pdf.pages)
+        result["metadata"] = {
+            "title": metadata.get("Title", "N/A"),
+            "author": metadata.get("Author", "N/A"),
+            "creator": metadata.get("Creator", "N/A"),
+        }
+
+        selected, mode = _select_pages(path, result["pages"], page_range, keywords)
+        text_parts: Dict[int, str] = {}
+        chars = 0
+        stopped_by = "end"
+        for index, page_num in enumerate(selected):
+            if chars >= max_chars:
+                stopped_by = "char_budget"
+                break
+            if index >= max_pages:
+                stopped_by = "page_budget"
+                break
+            page = pdf.pages[page_num - 1]
+            text = page.extract_text() or ""
+            if text.strip():
+                text_parts[page_num] = f"--- Página {page_num} ---\n{text}"
+                chars += len(text)
+
+            tables = page.extract_tables()
+            if tables:
+                result["tables"].extend([
+                    {"page": page_num, "data": table}
+                    for table in tables
+                ])
+
+            # Liberar los objetos parseados de la página
+            page.flush_cache()
+            result["pages_processed"] = index + 1
+
+    # El texto se presenta en orden de documento aunque se haya extraído por relevancia
+    parts = [text_parts[n] for n in sorted(text_parts)]
+    result["text"] = "\n\n".join(parts) if parts else "No se pudo extraer texto del PDF"
+    if result["pages"] > result["pages_processed"]:
+        result["text"] += f"\n\n[... solo se procesaron {result['pages_processed']} de {result['pages']} páginas ...]"
+    result["tables"].sort(key=lambda table: table["page"])
+
+    # Costo de la extracción
+    result["extraction"] = {
+        "mode": mode,
+        "pages_extracted": sorted(selected[:result["pages_processed"]]),
+        "chars_extracted": chars,
+        "stopped_by": stopped_by,
+        "keywords": keywords if mode == "relevance" else None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000)
+    }
+    return result
 
 
 class MultimodalProcessor:
     """Procesador de diferentes tipos de contenido"""
-    
-    async def process_image(self, image_data: bytes) -> str:
+
+    def __init__(self):
+        # Límites de extracción
+        self.max_workers = int(os.getenv("EXTRACTION_WORKERS", "2"))
+        self.timeout = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "30"))
+        self.max_pages = int(os.getenv("PDF_MAX_PAGES", "50"))
+        self.max_chars = int(os.getenv("PDF_MAX_CHARS", "4000"))
+        # Preprocesamiento de imágenes para OCR (ver ocr_pipeline)
+        self.ocr_options = {
+            "target_dpi": int(os.getenv("OCR_TARGET_DPI", "300")),
+            "max_side": int(os.getenv("OCR_MAX_SIDE", "2000")),
+            "binarize": os.getenv("OCR_BINARIZE", "true").lower() == "true",
+            "crop": os.getenv("OCR_CROP", "true").lower() == "true",
+            # Idiomas candidatos de Tesseract; el primero es el principal
+            "languages": [lang.strip() for lang in os.getenv("OCR_LANGUAGES", "spa,eng").split(",") if lang.strip()]
+        }
+        # Workers de un solo proceso: libres para reutilizar / todos los creados
+        self._idle: List[ExtractionWorker] = []
+        self._workers: Set[ExtractionWorker] = set()
+        # Como máximo max_workers trabajos a la vez: el timeout mide ejecución, no cola
+        self._slots = asyncio.Semaphore(self.max_workers)
+        # Extracciones previas por contenido (SHA-256 del archivo)
+        self.cache: Optional[ExtractionCache] = create_extraction_cache()
+
+    def _acquire_worker(self) -> ExtractionWorker:
+        """Un worker libre (el proceso queda cargado entre trabajos) o uno nuevo"""
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.is_alive():
+                return worker
+            # Murió mientras estaba libre
+            self._discard_worker(worker)
+        worker = ExtractionWorker()
+        self._workers.add(worker)
+        return worker
+
+    def _discard_worker(self, worker: ExtractionWorker):
+        """
+        Un trabajo en ejecución no se puede cancelar: se termina el proceso de
+        ese worker (los demás trabajos siguen en sus propios procesos)
+        """
+        self._workers.discard(worker)
+        worker.terminate()
+
+    def shutdown(self):
+        """Cerrar los workers (al apagar el servicio)"""
+        for worker in list(self._workers):
+            if worker in self._idle:
+                worker.close()
+            else:
+                worker.terminate()
+        self._workers.clear()
+        self._idle.clear()
+
+    async def _run(self, job: Callable[..., Any], *args) -> Any:
+        """Ejecutar un trabajo en un worker propio con timeout"""
+        async with self._slots:
+            worker = self._acquire_worker()
+            try:
+                # El hilo solo espera la respuesta del proceso; al terminarlo se libera
+                result = await asyncio.wait_for(asyncio.to_thread(worker.run, job, *args), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._discard_worker(worker)
+                raise ExtractionTimeoutError(
+                    f"La extracción superó el tiempo máximo ({self.timeout:.0f}s)"
+                )
+            except (WorkerCrashedError, asyncio.CancelledError):
+                # El proceso murió (p. ej. sin memoria) o la petición se canceló
+                # con el trabajo aún en curso: no reutilizar ese worker
+                self._discard_worker(worker)
+                raise
+            except Exception:
+                # Error del propio trabajo: el proceso sigue sano
+                self._idle.append(worker)
+                raise
+            self._idle.append(worker)
+            return result
+
+    async def _extract(
+        self,
+        kind: str,
+        variant: str,
+        upload: SpooledUpload,
+        job: Callable[..., Any],
+        *args
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Ejecutar la extracción salvo que el mismo contenido ya se haya procesado
+        Retorna (resultado, si vino del cache)
+        """
+        if self.cache is None:
+            return await self._run(job, upload.path, *args), False
+        key = ExtractionCache.key(kind, upload.sha256, variant)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        # Solo se cachean extracciones exitosas (los errores se propagan)
+        result = await self._run(job, upload.path, *args)
+        await self.cache.put(key, result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "workers_started": len(self._workers),
+            "timeout": self.timeout,
+            "pdf_max_pages": self.max_pages,
+            "pdf_max_chars": self.max_chars,
+            "ocr": self.ocr_options,
+            "cache": self.cache.stats() if self.cache else None
+        }
+
+    @staticmethod
+    def _variant(options: Dict[str, Any]) -> str:
+        """Parte de la clave del cache que depende de las opciones de extracción"""
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    async def process_image(self, upload: SpooledUpload) -> Dict[str, Any]:
         """
         Procesar imagen con OCR
         Extrae texto de imágenes
+
+        Retorna {"text": texto para el LLM, "ocr": preprocesamiento, idioma y tiempos por etapa}
         """
         try:
-            # Abrir imagen
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Aplicar OCR
-            text = pytesseract.image_to_string(image, lang='spa+eng')
-            
-            # Obtener información adicional
-            width, height = image.size
-            format_img = image.format
-            
+            ocr, cached = await self._extract(
+                "image", self._variant(self.ocr_options), upload, ocr_image, self.timeout, self.ocr_options
+            )
+            text = ocr["text"]
+
             result = f"""
-Dimensiones: {width}x{height}
-Formato: {format_img}
+Dimensiones: {ocr['width']}x{ocr['height']}
+Formato: {ocr['format']}
 
 Texto extraído:
 {text}
             """.strip()
-            
-            return result if text.strip() else "No se detectó texto en la imagen"
-            
+
+            details = {key: value for key, value in ocr.items() if key != "text"}
+            details["cached"] = cached
+            return {
+                "text": result if text.strip() else "No se detectó texto en la imagen",
+                "ocr": details
+            }
+
         except Exception as e:
-            return f"Error procesando imagen: {str(e)}"
-    
-    async def process_pdf(self, pdf_data: bytes) -> Dict[str, Any]:
+            return {"text": f"Error procesando imagen: {str(e)}", "ocr": None}
+
+    async def process_pdf(
+        self,
+        upload: SpooledUpload,
+        pages: Optional[List[int]] = None,
+        question: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Procesar PDF y extraer contenido
-        Extrae texto, metadatos, tablas, etc.
+        Extrae texto, metadatos, tablas, etc. hasta el presupuesto de caracteres/páginas
+
+        Args:
+            pages: páginas a extraer (desde 1); tiene prioridad sobre `question`
+            question: pregunta del usuario; sus palabras clave eligen las páginas relevantes
         """
         try:
-            result = {
-                "text": "",
-                "metadata": {},
-                "pages": 0,
-                "tables": []
-            }
-            
-            # Método 1: PyPDF2 para metadatos y texto básico
-            pdf_file = io.BytesIO(pdf_data)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            result["pages"] = len(pdf_reader.pages)
-            result["metadata"] = {
-                "title": pdf_reader.metadata.get("/Title", "N/A") if pdf_reader.metadata else "N/A",
-                "author": pdf_reader.metadata.get("/Author", "N/A") if pdf_reader.metadata else "N/A",
-                "creator": pdf_reader.metadata.get("/Creator", "N/A") if pdf_reader.metadata else "N/A",
-            }
-            
-            # Extraer texto de todas las páginas
-            text_parts = []
-            for page_num, page in enumerate(pdf_reader.pages, 1):
-                text = page.extract_text()
-                if text.strip():
-                    text_parts.append(f"--- Página {page_num} ---\n{text}")
-            
-            # Método 2: pdfplumber para extracción más detallada
-            pdf_file.seek(0)  # Reiniciar buffer
-            with pdfplumber.open(pdf_file) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    # Extraer tablas
-                    tables = page.extract_tables()
-                    if tables:
-                        result["tables"].extend([
-                            {"page": page_num, "data": table}
-                            for table in tables
-                        ])
-            
-            result["text"] = "\n\n".join(text_parts) if text_parts else "No se pudo extraer texto del PDF"
-            
+            keywords = None if pages else extract_keywords(question or "") or None
+            options = {"max_pages": self.max_pages, "max_chars": self.max_chars, "pages": pages, "keywords": keywords}
+            result, cached = await self._extract(
+                "pdf", self._variant(options), upload, _extract_pdf,
+                self.max_pages, self.max_chars, pages, keywords
+            )
+
+            # Copia: el resultado puede ser el objeto guardado en el cache
+            result = dict(result)
+            result["extraction"] = {**result.get("extraction", {}), "cached": cached}
+
             # Limitar longitud del texto para no saturar el LLM
-            if len(result["text"]) > 4000:
-                result["text"] = result["text"][:4000] + "\n\n[... texto truncado ...]"
-            
+            if len(result["text"]) > self.max_chars:
+                result["text"] = result["text"][:self.max_chars] + "\n\n[... texto truncado ...]"
+
             return result
-            
+
         except Exception as e:
             return {
                 "text": f"Error procesando PDF: {str(e)}",
                 "metadata": {},
                 "pages": 0,
+                "pages_processed": 0,
                 "tables": []
             }
-    
+
     async def process_audio(self, audio_data: bytes) -> str:
         """
         Procesar audio (bonus - implementación futura)
@@ -0,0 +1,195 @@
+"""
+OCR Pipeline - Preprocesamiento de imágenes antes de Tesseract
+Las fotos de celular (12 MP o más) hacen el OCR muy lento; antes de pasarlas
+a Tesseract se aplican estas etapas (cada una con su tiempo medido):
+
+1. Reducción: los JPEG se decodifican directamente a escala reducida (draft)
+   y la imagen se ajusta al DPI objetivo / lado máximo
+2. Escala de grises y binarización (umbral de Otsu)
+3. Recorte a la región con texto
+4. OCR con un solo idioma: primero el principal y, si el texto reconocido
+   parece de otro idioma candidato, se repite con ese idioma
+   (un solo modelo es bastante más rápido que "spa+eng")
+
+Se ejecuta dentro del pool de procesos del MultimodalProcessor
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import os
+import re
+import time
+from PIL import Image, ImageFilter, ImageOps
+import pytesseract
+
+# Configurar ruta de Tesseract en Windows (aquí y no en el proceso principal:
+# los workers del pool solo importan este módulo)
+if os.name == 'nt':
+    tesseract_paths = [
+        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+        r"C:\Users\DESKTOP\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
+    ]
+    for path in tesseract_paths:
+        if os.path.exists(path):
+            pytesseract.pytesseract.tesseract_cmd = path
+            break
+
+
+# Palabras frecuentes para distinguir el idioma del texto reconocido
+LANGUAGE_HINTS = {
+    "spa": {"de", "la", "el", "que", "y", "en", "los", "las", "del", "por", "para", "con", "una", "es", "al", "su"},
+    "eng": {"the", "and", "of", "to", "in", "for", "with", "is", "on", "your", "from", "at", "this", "are", "you"},
+}
+
+# Margen alrededor de la región con texto (fracción del lado)
+CROP_MARGIN = 0.02
+
+# Tag EXIF Orientation; los valores 5-8 indican una imagen guardada girada 90°
+# (p.ej. fotos verticales de móvil, guardadas en horizontal)
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _target_size(size: Tuple[int, int], dpi: Optional[float], target_dpi: int, max_side: int) -> Tuple[int, int]:
+    """Tamaño final: DPI objetivo (si la imagen declara uno mayor) y lado máximo"""
+    width, height = size
+    scale = 1.0
+    if dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    scale = min(scale, max_side / max(width, height))
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    """Umbral que maximiza la varianza entre clases del histograma"""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = 0.0
+    weight_background = 0
+    best_variance = 0.0
+    threshold = 127
+    for value, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += value * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            threshold = value
+    return threshold
+
+
+def _text_bbox(binary: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """Caja que contiene los píxeles oscuros (texto), ignorando puntos aislados"""
+    inverted = ImageOps.invert(binary).filter(ImageFilter.MedianFilter(3))
+    bbox = inverted.getbbox()
+    if not bbox:
+        return None
+    width, height = binary.size
+    margin_x, margin_y = int(width * CROP_MARGIN), int(height * CROP_MARGIN)
+    left, top, right, bottom = bbox
+    return (
+        max(left - margin_x, 0),
+        max(top - margin_y, 0),
+        min(right + margin_x, width),
+        min(bottom + margin_y, height)
+    )
+
+
+def detect_language(text: str, candidates: List[str]) -> Optional[str]:
+    """Idioma candidato con más palabras frecuentes en el texto (None si no hay suficientes)"""
+    words = re.findall(r"\w+", text.lower())
+    scores = {
+        lang: sum(1 for word in words if word in LANGUAGE_HINTS.get(lang, ()))
+        for lang in candidates
+    }
+    if not scores:
+        return None
+    best = max(scores, key=scores.get)
+    others = max((score for lang, score in scores.items() if lang != best), default=0)
+    # Decidir solo con evidencia clara
+    if scores[best] >= 3 and scores[best] >= 2 * others:
+        return best
+    return None
+
+
+def ocr_image(path: str, timeout: float, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Preprocesar y reconocer el texto de una imagen
+
+    options: target_dpi, max_side, binarize, crop, languages (el primero es el principal)
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def mark(stage: str):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = round((now - started) * 1000, 1)
+        started = now
+
+    with Image.open(path) as original:
+        image_format = original.format
+        width, height = original.size
+        dpi = (original.info.get("dpi") or (0,))[0]
+        target = _target_size(original.size, dpi, options["target_dpi"], options["max_side"])
+        rotated = original.getexif().get(EXIF_ORIENTATION, 1) in ROTATED_ORIENTATIONS
+
+        # 1. Reducción (los JPEG se decodifican ya reducidos y en gris)
+        original.draft("L", target)
+        image = ImageOps.exif_transpose(original).convert("L")
+        if rotated:
+            # El tamaño objetivo se calculó sobre la imagen guardada, antes de girarla
+            target = (target[1], target[0])
+        if image.width > target[0] or image.height > target[1]:
+            image.thumbnail(target, Image.LANCZOS)
+        mark("downscale")
+
+    # 2. Binarización
+    if options["binarize"]:
+        threshold = _otsu_threshold(image)
+        image = image.point(lambda p: 255 if p > threshold else 0)
+        mark("binarize")
+
+    # 3. Recorte a la región con texto (solo si reduce el área de forma apreciable)
+    cropped = False
+    if options["crop"]:
+        bbox = _text_bbox(image if options["binarize"] else image.point(lambda p: 255 if p > 127 else 0))
+        if bbox:
+            left, top, right, bottom = bbox
+            if (right - left) * (bottom - top) < 0.9 * image.width * image.height:
+                image = image.crop(bbox)
+                cropped = True
+        mark("crop")
+
+    # 4. OCR con el idioma principal y, si corresponde, con el detectado
+    languages = options["languages"]
+    deadline = time.monotonic() + timeout
+    language = languages[0]
+    text = pytesseract.image_to_string(image, lang=language, timeout=timeout)
+    mark("ocr")
+    detected = detect_language(text, languages) if len(languages) > 1 else None
+    if detected and detected != language:
+        language = detected
+        remaining = max(deadline - time.monotonic(), 1.0)
+        text = pytesseract.image_to_string(image, lang=language, timeout=remaining)
+        mark("ocr_retry")
+
+    timings["total"] = round(sum(timings.values()), 1)
+    return {
+        "text": text,
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "processed_width": image.width,
+        "processed_height": image.height,
+        "cropped": cropped,
+        "language": language,
+        "timings_ms": timings
+    }
@@ -0,0 +1,267 @@
+"""
+Provider Router - Enrutamiento entre proveedores LLM
+- Latencia p50/p95 y tasa de error por proveedor (ventana móvil)
+- Failover automático al siguiente proveedor sano si uno falla
+- Hedging opcional: si el primero tarda más de LLM_HEDGE_AFTER_MS se lanza
+  el siguiente y se usa la primera respuesta exitosa
+- Rate limit por proveedor con token bucket (peticiones por minuto)
+
+Trabaja sobre adaptadores por nombre de proveedor ("gemini", "groq") con la
+interfaz de LLMAdapter (generate, generate_stream, is_configured)
+"""
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import os
+import time
+
+
+class RateLimitedError(Exception):
+    """El proveedor no tiene cupo disponible en su token bucket"""
+    pass
+
+
+class TokenBucket:
+    """Token bucket: `rate_per_minute` peticiones por minuto con ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or max(rate_per_minute / 6.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def available(self) -> float:
+        self._refill()
+        return round(self.tokens, 2)
+
+
+class ProviderStats:
+    """Ventana móvil de latencias y resultados de un proveedor"""
+
+    def __init__(self, window: int = 100):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.last_error_at = 0.0
+        self.last_error: Optional[str] = None
+
+    def record(self, latency: float, ok: bool, error: Optional[str] = None):
+        self.latencies.append(latency)
+        self.outcomes.append(ok)
+        if not ok:
+            self.last_error_at = time.monotonic()
+            self.last_error = error
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "samples": len(self.outcomes),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "last_error": self.last_error
+        }
+
+
+class ProviderRouter:
+    """
+    Elige el orden de proveedores para cada petición: primero el pedido si
+    está sano, luego el resto de los sanos por p95 y al final los no sanos
+    """
+
+    def __init__(
+        self,
+        adapters: Dict[str, Any],
+        rate_limits: Optional[Dict[str, float]] = None,
+        hedge_after: Optional[float] = None,
+        max_error_rate: float = 0.5,
+        min_samples: int = 5,
+        cooldown: float = 30.0
+    ):
+        self.adapters = adapters
+        self.hedge_after = hedge_after
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.stats = {name: ProviderStats() for name in adapters}
+        self.buckets = {
+            name: TokenBucket(rate) for name, rate in (rate_limits or {}).items()
+            if name in adapters and rate > 0
+        }
+        self.failovers = 0
+        self.hedges = 0
+
+    def is_healthy(self, name: str) -> bool:
+        """Configurado y sin una racha de errores reciente"""
+        if not self.adapters[name].is_configured():
+            return False
+        stats = self.stats[name]
+        if len(stats.outcomes) >= self.min_samples and stats.error_rate() > self.max_error_rate:
+            # Tras el cooldown se vuelve a probar (medio abierto)
+            return time.monotonic() - stats.last_error_at > self.cooldown
+        return True
+
+    def candidates(self, preferred: str) -> List[str]:
+        healthy = [name for name in self.adapters if self.is_healthy(name)]
+        others = sorted(
+            (name for name in healthy if name != preferred),
+            key=lambda name: self.stats[name].percentile(95) or 0.0
+        )
+        ordered = ([preferred] if preferred in healthy else []) + others
+        # Último recurso: los configurados aunque no estén sanos
+        ordered += [
+            name for name in self.adapters
+            if name not in ordered and self.adapters[name].is_configured()
+        ]
+        # Sin ninguno configurado se deja el pedido para que reporte su error
+        return ordered or [preferred]
+
+    def _acquire(self, name: str):
+        bucket = self.buckets.get(name)
+        if bucket and not bucket.try_acquire():
+            raise RateLimitedError(f"{name}: límite de peticiones por minuto alcanzado")
+
+    async def _call(self, name: str, messages: List[Dict[str, str]], tools: Optional[List[Dict]]) -> str:
+        self._acquire(name)
+        start = time.monotonic()
+        try:
+            response = await self.adapters[name].generate(messages, tools)
+        except asyncio.CancelledError:
+            # Perdió el hedging: no es un error, pero su latencia (cota inferior)
+            # cuenta para que el p95 refleje que es lento
+            self.stats[name].record(time.monotonic() - start, True)
+            raise
+        except Exception as e:
+            self.stats[name].record(time.monotonic() - start, False, str(e))
+            raise
+        self.stats[name].record(time.monotonic() - start, True)
+        return response
+
+    async def generate(self, preferred: str, messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> str:
+        candidates = self.candidates(preferred)
+        pending: Dict[asyncio.Task, str] = {}
+        errors: List[str] = []
+        launch = True
+        try:
+            while True:
+                if launch and candidates:
+                    name = candidates.pop(0)
+                    if pending:
+                        self.hedges += 1
+                    elif errors:
+                        self.failovers += 1
+                    pending[asyncio.create_task(self._call(name, messages, tools))] = name
+                if not pending:
+                    break
+
+                # Con hedging y otro candidato disponible, esperar como máximo hedge_after
+                timeout = self.hedge_after if self.hedge_after and candidates and len(pending) < 2 else None
+                done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch = True
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{name}: {task.exception()}")
+                # Failover solo si no queda otra petición en curso
+                launch = not pending
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise Exception("Ningún proveedor LLM respondió. " + " | ".join(errors))
+
+    async def generate_stream(
+        self,
+        preferred: str,
+        messages: List[Dict[str, str]],
+        tools: Optional[List[Dict]] = None
+    ) -> AsyncIterator[str]:
+        """Streaming con failover mientras no se haya enviado ningún fragmento (sin hedging)"""
+        errors: List[str] = []
+        for name in self.candidates(preferred):
+            try:
+                self._acquire(name)
+            except RateLimitedError as e:
+                errors.append(str(e))
+                continue
+            if errors:
+                self.failovers += 1
+
+            start = time.monotonic()
+            started = False
+            try:
+                async for chunk in self.adapters[name].generate_stream(messages, tools):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self.stats[name].record(time.monotonic() - start, False, str(e))
+                if started:
+                    raise
+                errors.append(f"{name}: {e}")
+                continue
+            self.stats[name].record(time.monotonic() - start, True)
+            return
+
+        raise Exception("Ningún proveedor LLM respondió. " + " | ".join(errors))
+
+    def provider_stats(self, name: str) -> Dict[str, Any]:
+        stats = self.stats[name].snapshot()
+        stats["healthy"] = self.is_healthy(name)
+        bucket = self.buckets.get(name)
+        stats["rate_limit_tokens"] = bucket.available() if bucket else None
+        return stats
+
+    def stats_summary(self) -> Dict[str, Any]:
+        return {
+            "hedge_after_ms": round(self.hedge_after * 1000) if self.hedge_after else None,
+            "failovers": self.failovers,
+            "hedges": self.hedges
+        }
+
+
+def create_provider_router(adapters: Dict[str, Any]) -> Optional[ProviderRouter]:
+    """
+    Crear el router según variables de entorno (None si está deshabilitado)
+    <PROVEEDOR>_RATE_LIMIT_PER_MINUTE: token bucket por proveedor (0 = sin límite)
+    LLM_HEDGE_AFTER_MS: umbral de hedging (0 = deshabilitado)
+    """
+    if os.getenv("LLM_ROUTING_ENABLED", "true").lower() != "true":
+        return None
+    hedge_ms = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+    return ProviderRouter(
+        adapters,
+        rate_limits={
+            name: float(os.getenv(f"{name.upper()}_RATE_LIMIT_PER_MINUTE", "0"))
+            for name in adapters
+        },
+        hedge_after=hedge_ms / 1000 if hedge_ms > 0 else None,
+        max_error_rate=float(os.getenv("LLM_MAX_ERROR_RATE", "0.5")),
+        cooldown=float(os.getenv("LLM_UNHEALTHY_COOLDOWN_SECONDS", "30"))
+    )
@@ -0,0 +1,206 @@
+"""
+Response Cache - Cache de respuestas del LLM
+Evita repetir llamadas a Gemini/Groq para las mismas preguntas de catálogo
+
+- Nivel exacto: clave = proveedor + herramientas + historial normalizado (LRU + TTL)
+- Nivel semántico (opcional): preguntas casi idénticas al inicio de una
+  conversación se resuelven por similitud de embeddings
+- Nunca se cachean respuestas que dependen de datos del usuario
+  (reservas propias, creación o cancelación)
+"""
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+import hashlib
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+
+
+# Herramientas cuyos resultados o invocación dependen del usuario
+USER_SPECIFIC_TOOLS = {"mis_reservas", "ver_reserva", "crear_reserva", "cancelar_reserva"}
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, unicode NFKC y espacios colapsados"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    Cache de respuestas de un proveedor LLM
+
+    `embed` (opcional) es una función async texto → embedding; si se indica
+    se activa el nivel semántico con umbral `similarity_threshold`
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 500,
+        ttl: float = 600,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        similarity_threshold: float = 0.92
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._exact: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # (expira, contexto, embedding, respuesta)
+        self._semantic: List[Tuple[float, str, List[float], str]] = []
+        # Último embedding calculado: get() y put() de la misma pregunta lo comparten
+        self._last_embedding: Optional[Tuple[str, List[float]]] = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    # ------------------------------------------------------------------
+    # Claves y reglas de cacheabilidad
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _context(provider: str, tools: Optional[List[Dict]]) -> str:
+        tool_names = sorted(tool.get("name", "") for tool in tools or [])
+        return f"{provider}|{','.join(tool_names)}"
+
+    def _key(self, provider: str, messages: List[Dict[str, str]], tools: Optional[List[Dict]]) -> str:
+        normalized = [
+            [msg.get("role", "user"), normalize_text(msg.get("content", ""))]
+            for msg in messages
+        ]
+        raw = json.dumps([self._context(provider, tools), normalized], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_cacheable_request(messages: List[Dict[str, str]]) -> bool:
+        """No cachear si el historial incluye resultados de herramientas del usuario"""
+        for msg in messages:
+            if msg.get("role") == "tool":
+                content = msg.get("content", "")
+                if any(name in content for name in USER_SPECIFIC_TOOLS):
+                    return False
+        return True
+
+    @staticmethod
+    def is_cacheable_response(response: str) -> bool:
+        """No cachear respuestas que invocan herramientas del usuario"""
+        return not any(f"USE_TOOL:{name}" in response for name in USER_SPECIFIC_TOOLS)
+
+    @staticmethod
+    def _semantic_question(messages: List[Dict[str, str]]) -> Optional[str]:
+        """El nivel semántico solo aplica a la primera pregunta de una conversación"""
+        if len(messages) == 1 and messages[0].get("role") == "user":
+            return normalize_text(messages[0].get("content", ""))
+        return None
+
+    async def _embedding(self, question: str) -> Optional[List[float]]:
+        if self._last_embedding and self._last_embedding[0] == question:
+            return self._last_embedding[1]
+        try:
+            embedding = await self.embed(question)
+        except Exception as e:
+            print(f"⚠️  Error calculando embedding para cache: {e}")
+            return None
+        self._last_embedding = (question, embedding)
+        return embedding
+
+    # ------------------------------------------------------------------
+    # Lectura / escritura
+    # ------------------------------------------------------------------
+
+    async def get(self, provider: str, messages: List[Dict[str, str]], tools: Optional[List[Dict]]) -> Optional[str]:
+        """Respuesta cacheada o None"""
+        if not self.is_cacheable_request(messages):
+            self.skipped += 1
+            return None
+
+        now = time.time()
+        key = self._key(provider, messages, tools)
+        entry = self._exact.get(key)
+        if entry and entry[0] > now:
+            self._exact.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self._exact[key]
+
+        question = self._semantic_question(messages)
+        if self.embed and question:
+            context = self._context(provider, tools)
+            self._semantic = [e for e in self._semantic if e[0] > now]
+            embedding = await self._embedding(question)
+            if embedding:
+                best, best_score = None, 0.0
+                for expires, entry_context, entry_embedding, response in self._semantic:
+                    if entry_context != context:
+                        continue
+                    score = _cosine(embedding, entry_embedding)
+                    if score > best_score:
+                        best, best_score = response, score
+                if best is not None and best_score >= self.similarity_threshold:
+                    self.semantic_hits += 1
+                    return best
+
+        self.misses += 1
+        return None
+
+    async def put(self, provider: str, messages: List[Dict[str, str]], tools: Optional[List[Dict]], response: str):
+        """Guardar una respuesta si es cacheable"""
+        if not response or not self.is_cacheable_request(messages) or not self.is_cacheable_response(response):
+            return
+
+        expires = time.time() + self.ttl
+        key = self._key(provider, messages, tools)
+        self._exact[key] = (expires, response)
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+
+        question = self._semantic_question(messages)
+        if self.embed and question:
+            embedding = await self._embedding(question)
+            if not embedding:
+                return
+            self._semantic.append((expires, self._context(provider, tools), embedding, response))
+            if len(self._semantic) > self.max_entries:
+                self._semantic = self._semantic[-self.max_entries:]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._exact),
+            "semantic_entries": len(self._semantic),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round((self.hits + self.semantic_hits) / total, 4) if total else 0.0
+        }
+
+
+def create_response_cache(embed: Optional[Callable[[str], Awaitable[List[float]]]] = None) -> Optional[ResponseCache]:
+    """
+    Crear el cache según variables de entorno (None si está deshabilitado)
+    LLM_CACHE_SEMANTIC=true activa el nivel semántico si hay función de embeddings
+    """
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    semantic = os.getenv("LLM_CACHE_SEMANTIC", "false").lower() == "true"
+    return ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500")),
+        ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "600")),
+        embed=embed if semantic else None,
+        similarity_threshold=float(os.getenv("LLM_CACHE_SIMILARITY", "0.92"))
+    )
@@ -0,0 +1,96 @@
+"""
+Tool Cache - Cache por usuario de resultados de herramientas MCP
+Un acierto evita la llamada al MCP Server; crear o cancelar una reserva
+invalida todo lo cacheado del usuario
+"""
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import json
+import os
+import time
+
+
+# Herramientas de consulta cuyos resultados se pueden reutilizar
+CACHEABLE_TOOLS = {"mis_reservas", "ver_reserva", "buscar_destinos", "buscar_guias", "estadisticas_ventas"}
+
+# Herramientas que modifican las reservas del usuario (invalidan su cache)
+INVALIDATING_TOOLS = {"crear_reserva", "cancelar_reserva"}
+
+
+class ToolResultCache:
+    """
+    Cache LRU + TTL de resultados de herramientas
+    Clave: (usuario, herramienta, parámetros normalizados)
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 120):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(usuario_id: Optional[str], tool_name: str, params: Dict[str, Any]) -> Tuple[str, str, str]:
+        normalized = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return (usuario_id or "default", tool_name, normalized)
+
+    def get(self, usuario_id: Optional[str], tool_name: str, params: Dict[str, Any]) -> Optional[Any]:
+        """Resultado cacheado vigente o None"""
+        if tool_name not in CACHEABLE_TOOLS:
+            return None
+        key = self._key(usuario_id, tool_name, params)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.time():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, usuario_id: Optional[str], tool_name: str, params: Dict[str, Any], result: Any):
+        """Guardar el resultado si la herramienta es cacheable y la llamada fue exitosa"""
+        if tool_name not in CACHEABLE_TOOLS:
+            return
+        # Solo respuestas reales del MCP Server (no errores ni datos simulados;
+        # el MCP Server marca sus fallbacks con data.simulated)
+        if not isinstance(result, dict) or not result.get("success"):
+            return
+        data = result.get("data")
+        if isinstance(data, dict) and data.get("simulated"):
+            return
+        key = self._key(usuario_id, tool_name, params)
+        self._entries[key] = (time.time() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, usuario_id: Optional[str]):
+        """Descartar todos los resultados cacheados del usuario"""
+        user_key = usuario_id or "default"
+        for key in [key for key in self._entries if key[0] == user_key]:
+            del self._entries[key]
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def create_tool_cache() -> ToolResultCache:
+    """Crear el cache según variables de entorno"""
+    return ToolResultCache(
+        max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1000")),
+        ttl=float(os.getenv("TOOL_CACHE_TTL_SECONDS", "120"))
+    )
@@ -0,0 +1,137 @@
+"""
+Upload Limits - Recepción de archivos por streaming con límite de tamaño
+- El middleware rechaza con 413 las peticiones cuyo Content-Length ya excede
+  el límite, antes de que se parsee el multipart
+- `spooled_upload` lee el archivo por bloques hacia un temporal en disco,
+  aborta en cuanto se supera el límite y valida el tipo real por los magic
+  bytes del primer bloque (no por la extensión ni el Content-Type)
+- El SHA-256 se calcula mientras se lee (clave del cache de extracciones)
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional
+import asyncio
+import hashlib
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+
+
+CHUNK_SIZE = 256 * 1024
+
+# Tipos aceptados por el procesador multimodal
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp", "image/tiff"}
+PDF_TYPES = {"application/pdf"}
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """Tipo MIME según los magic bytes del inicio del archivo"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    # Algunos generadores anteponen bytes antes de la cabecera %PDF-
+    if b"%PDF-" in head[:1024]:
+        return "application/pdf"
+    return None
+
+
+@dataclass
+class SpooledUpload:
+    """Archivo recibido en disco (se elimina al salir de `spooled_upload`)"""
+    path: str
+    size: int
+    content_type: str
+    sha256: str
+    filename: Optional[str] = None
+
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile, allowed_types: Iterable[str], max_bytes: int) -> AsyncIterator[SpooledUpload]:
+    """
+    Copiar el archivo a un temporal por bloques
+    400 si el tipo no es uno de `allowed_types`, 413 si excede `max_bytes`
+    """
+    allowed_types = set(allowed_types)
+    fd, path = tempfile.mkstemp(prefix="upload-")
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff_type(chunk)
+                    if content_type not in allowed_types:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Tipo de archivo no soportado. Se aceptan: {', '.join(sorted(allowed_types))}"
+                        )
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"El archivo excede el tamaño máximo ({max_bytes // (1024 * 1024)}MB)"
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(tmp.write, chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="El archivo está vacío")
+
+        yield SpooledUpload(
+            path=path,
+            size=size,
+            content_type=content_type,
+            sha256=digest.hexdigest(),
+            filename=file.filename
+        )
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Middleware ASGI: 413 inmediato si el Content-Length de una petición a
+    `paths` excede `max_bytes` (el cuerpo no llega a leerse)
+    """
+
+    def __init__(self, app, max_bytes: int, paths: Iterable[str] = ("/",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            length = dict(scope["headers"]).get(b"content-length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                body = (
+                    f'{{"detail": "La petición excede el tamaño máximo '
+                    f'({self.max_bytes // (1024 * 1024)}MB)"}}'
+                ).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 413,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")
+                    ]
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
@@ -11,7 +11,9 @@ class Settings(BaseSettings):
     
     # JWT
     JWT_SECRET_KEY: str
-    JWT_ALGORITHM: str = "HS256"
+    JWT_ALGORITHM: str = "HS256"  # HS256 (secreto compartido), RS256 o EdDSA (JWKS)
+    JWT_KEYS_DIR: str = "keys"  # Claves privadas PEM para RS256/EdDSA
+    JWT_ACTIVE_KID: str = ""  # kid de la clave que firma tokens nuevos
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 480  # 8 horas
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
@@ -1,13 +1,44 @@
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set
+import asyncio
+import uuid
 import jwt
 import bcrypt
+from beanie.operators import In, Or, Set as SetOp
 from config import get_settings
 from models import User, RefreshToken, RevokedToken
+from key_manager import is_asymmetric, get_key_manager
 
 settings = get_settings()
 
 
+class RevocationNotifier:
+    """
+    Despierta a los long-polls del feed de revocaciones
+    
+    Cada revocación activa el evento actual y lo reemplaza por uno nuevo,
+    así todos los que esperaban se despiertan una sola vez.
+    """
+    
+    def __init__(self):
+        self._event = asyncio.Event()
+    
+    def notify(self):
+        self._event.set()
+        self._event = asyncio.Event()
+    
+    async def wait(self, timeout: float) -> bool:
+        """Espera una revocación nueva; retorna False si venció el timeout"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+revocation_notifier = RevocationNotifier()
+
+
 class JWTService:
     """Servicio para manejo de JWT (Access y Refresh tokens)"""
     
@@ -25,6 +56,41 @@ class JWTService:
             hashed_password.encode('utf-8')
         )
     
+    @staticmethod
+    def _encode(payload: Dict[str, Any]) -> str:
+        """
+        Firma un payload con el algoritmo configurado
+        
+        En modo RS256/EdDSA firma con la clave activa e incluye su `kid`
+        en el header para que los validadores la busquen en el JWKS.
+        """
+        if is_asymmetric(settings.JWT_ALGORITHM):
+            key_manager = get_key_manager()
+            return jwt.encode(
+                payload,
+                key_manager.signing_key,
+                algorithm=settings.JWT_ALGORITHM,
+                headers={"kid": key_manager.active_kid}
+            )
+        
+        return jwt.encode(
+            payload,
+            settings.JWT_SECRET_KEY,
+            algorithm=settings.JWT_ALGORITHM
+        )
+    
+    @staticmethod
+    def _verification_key(token: str):
+        """Clave para verificar un token (pública por kid o secreto compartido)"""
+        if not is_asymmetric(settings.JWT_ALGORITHM):
+            return settings.JWT_SECRET_KEY
+        
+        kid = jwt.get_unverified_header(token).get("kid")
+        public_key = get_key_manager().get_public_key(kid)
+        if public_key is None:
+            raise jwt.InvalidTokenError("kid desconocido")
+        return public_key
+    
     @staticmethod
     def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         """
@@ -47,24 +113,20 @@ class JWTService:
         to_encode.update({
             "exp": expire,
             "iat": datetime.utcnow(),
+            "jti": uuid.uuid4().hex,
             "type": "access"
         })
         
-        encoded_jwt = jwt.encode(
-            to_encode,
-            settings.JWT_SECRET_KEY,
-            algorithm=settings.JWT_ALGORITHM
-        )
-        
-        return encoded_jwt
+        return JWTService._encode(to_encode)
     
     @staticmethod
-    def create_refresh_token(data: Dict[str, Any]) -> str:
+    def create_refresh_token(data: Dict[str, Any], family_id: Optional[str] = None) -> str:
         """
         Crea un refresh token JWT de larga duración
         
         Args:
             data: Datos a incluir en el token (user_id)
+            family_id: Familia a la que pertenece (None = nueva sesión)
         
         Returns:
             Refresh token JWT firmado
@@ -75,16 +137,12 @@ class JWTService:
         to_encode.update({
             "exp": expire,
             "iat": datetime.utcnow(),
+            "jti": uuid.uuid4().hex,
+            "fam": family_id or uuid.uuid4().hex,
             "type": "refresh"
         })
         
-        encoded_jwt = jwt.encode(
-            to_encode,
-            settings.JWT_SECRET_KEY,
-            algorithm=settings.JWT_ALGORITHM
-        )
-        
-        return encoded_jwt
+        return JWTService._encode(to_encode)
     
     @staticmethod
     def decode_token(token: str) -> Dict[str, Any]:
@@ -104,7 +162,7 @@ class JWTService:
         try:
             payload = jwt.decode(
                 token,
-                settings.JWT_SECRET_KEY,
+                JWTService._verification_key(token),
                 algorithms=[settings.JWT_ALGORITHM]
             )
             return payload
@@ -140,25 +198,76 @@ class JWTService:
         try:
             # Decodificar para obtener expiración
             payload = JWTService.decode_token(token)
-            expires_at = datetime.fromtimestamp(payload['exp'])
+            expires_at = datetime.utcfromtimestamp(payload['exp'])
             
             # Crear entrada en blacklist
             revoked_token = RevokedToken(
                 token=token,
+                jti=payload.get("jti"),
                 user_id=user_id,
                 expires_at=expires_at,
                 reason=reason
             )
             await revoked_token.insert()
+            revocation_notifier.notify()
             
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
             # Si el token ya expiró, no es necesario agregarlo a blacklist
             pass
     
+    @staticmethod
+    async def get_revoked_set(jtis: List[str], tokens: List[str]) -> Set[str]:
+        """
+        Verifica en lote qué tokens/jti están en la blacklist
+        
+        Resuelve todo con una sola consulta `$in` (por jti y, para tokens
+        emitidos antes de incluir jti, por el token completo).
+        
+        Args:
+            jtis: IDs de token a verificar
+            tokens: Tokens completos sin jti a verificar
+        
+        Returns:
+            Conjunto con los jti y tokens que están revocados
+        """
+        if not jtis and not tokens:
+            return set()
+        
+        revoked = await RevokedToken.find(
+            Or(In(RevokedToken.jti, jtis), In(RevokedToken.token, tokens))
+        ).to_list()
+        
+        result = set()
+        for doc in revoked:
+            if doc.jti:
+                result.add(doc.jti)
+            result.add(doc.token)
+        return result
+    
+    @staticmethod
+    async def get_revocations_since(since: datetime, limit: int = 500) -> List[RevokedToken]:
+        """
+        Revocaciones posteriores a `since` que aún no expiraron
+        
+        Args:
+            since: Cursor (revoked_at de la última revocación conocida)
+            limit: Máximo de revocaciones a retornar
+        
+        Returns:
+            Lista ordenada por revoked_at
+        """
+        return await RevokedToken.find(
+            RevokedToken.revoked_at > since,
+            RevokedToken.expires_at > datetime.utcnow()
+        ).sort(+RevokedToken.revoked_at).limit(limit).to_list()
+    
     @staticmethod
     async def save_refresh_token(user_id: str, token: str):
         """
-        Guarda un refresh token en la base de datos
+        Guarda el primer refresh token de una familia (login/registro)
+        
+        Las rotaciones posteriores actualizan este mismo documento
+        (ver rotate_refresh_token), no insertan uno nuevo.
         
         Args:
             user_id: ID del usuario
@@ -166,31 +275,54 @@ class JWTService:
         """
         try:
             payload = JWTService.decode_token(token)
-            expires_at = datetime.fromtimestamp(payload['exp'])
             
             refresh_token = RefreshToken(
                 user_id=user_id,
+                family_id=payload.get("fam"),
+                jti=payload.get("jti"),
                 token=token,
-                expires_at=expires_at
+                expires_at=datetime.utcfromtimestamp(payload['exp'])
             )
             await refresh_token.insert()
             
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as e:
             raise ValueError(f"Error al guardar refresh token: {str(e)}")
     
+    @staticmethod
+    async def _find_refresh_family(token: str) -> Optional[RefreshToken]:
+        """Busca el documento de la familia de un refresh token (índice user_id + family_id)"""
+        try:
+            payload = JWTService.decode_token(token)
+        except jwt.InvalidTokenError:
+            return None
+        
+        if payload.get("type") != "refresh":
+            return None
+        
+        if payload.get("fam"):
+            return await RefreshToken.find_one(
+                RefreshToken.user_id == payload.get("user_id"),
+                RefreshToken.family_id == payload["fam"]
+            )
+        
+        # Tokens emitidos antes de la rotación: buscar por token
+        return await RefreshToken.find_one(RefreshToken.token == token)
+    
     @staticmethod
     async def validate_refresh_token(token: str) -> Optional[RefreshToken]:
         """
         Valida un refresh token
         
+        Si el token pertenece a una familia pero ya no es el vigente
+        (fue rotado), se trata como robado: se revoca toda la familia.
+        
         Args:
             token: Refresh token a validar
         
         Returns:
             RefreshToken si es válido, None si no
         """
-        # Buscar en la base de datos
-        refresh_token = await RefreshToken.find_one(RefreshToken.token == token)
+        refresh_token = await JWTService._find_refresh_family(token)
         
         if not refresh_token:
             return None
@@ -203,8 +335,81 @@ class JWTService:
         if refresh_token.expires_at < datetime.utcnow():
             return None
         
+        # Detección de reutilización: el token presentado no es el vigente
+        if refresh_token.token != token:
+            await RefreshToken.find_one(RefreshToken.id == refresh_token.id).update(
+                SetOp({RefreshToken.is_revoked: True})
+            )
+            return None
+        
         return refresh_token
     
+    @staticmethod
+    async def rotate_refresh_token(refresh_token: RefreshToken) -> Optional[str]:
+        """
+        Emite un nuevo refresh token de la misma familia y reemplaza al anterior
+        
+        La actualización es condicional sobre el token vigente, así dos
+        /refresh concurrentes con el mismo token no rotan ambos.
+        
+        Args:
+            refresh_token: Documento de la familia ya validado
+        
+        Returns:
+            Nuevo refresh token, o None si otra petición ya lo rotó
+        """
+        family_id = refresh_token.family_id or str(refresh_token.id)
+        new_token = JWTService.create_refresh_token(
+            data={"user_id": refresh_token.user_id},
+            family_id=family_id
+        )
+        payload = JWTService.decode_token(new_token)
+        
+        result = await RefreshToken.find_one(
+            RefreshToken.id == refresh_token.id,
+            RefreshToken.token == refresh_token.token,
+            RefreshToken.is_revoked == False
+        ).update(SetOp({
+            RefreshToken.family_id: family_id,
+            RefreshToken.jti: payload["jti"],
+            RefreshToken.token: new_token,
+            RefreshToken.expires_at: datetime.utcfromtimestamp(payload["exp"]),
+            RefreshToken.rotated_at: datetime.utcnow()
+        }))
+        
+        return new_token if result.modified_count else None
+    
+    @staticmethod
+    async def revoke_refresh_token(token: str):
+        """
+        Revoca la familia (sesión) a la que pertenece un refresh token
+        
+        Args:
+            token: Refresh token de la sesión
+        """
+        refresh_token = await JWTService._find_refresh_family(token)
+        if refresh_token:
+            await RefreshToken.find_one(RefreshToken.id == refresh_token.id).update(
+                SetOp({RefreshToken.is_revoked: True})
+            )
+    
+    @staticmethod
+    async def revoke_all_refresh_tokens(user_id: str) -> int:
+        """
+        Revoca todas las sesiones de un usuario con un solo update_many
+        
+        Args:
+            user_id: ID del usuario
+        
+        Returns:
+            Cantidad de familias revocadas
+        """
+        result = await RefreshToken.find(
+            RefreshToken.user_id == user_id,
+            RefreshToken.is_revoked == False
+        ).update(SetOp({RefreshToken.is_revoked: True}))
+        return result.modified_count
+    
     @staticmethod
     async def cleanup_expired_tokens():
         """
@@ -0,0 +1,144 @@
+"""
+Gestión de claves asimétricas para firmar JWT (RS256 / EdDSA)
+
+Las claves privadas se guardan como archivos PEM en JWT_KEYS_DIR, uno por
+clave, y el nombre del archivo (sin extensión) es su `kid`. La clave indicada
+por JWT_ACTIVE_KID firma los tokens nuevos; todas las claves del directorio
+se publican en /.well-known/jwks.json para que los tokens firmados con una
+clave anterior sigan validándose hasta expirar.
+
+ROTACIÓN:
+1. Generar una clave nueva:  python key_manager.py <nuevo_kid>
+2. Cambiar JWT_ACTIVE_KID al nuevo kid y reiniciar el Auth Service
+3. Borrar la clave anterior cuando hayan expirado sus refresh tokens
+
+Los servicios que validan con JWKS descubren la clave nueva solos (por `kid`),
+sin redeploy coordinado.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+from jwt.algorithms import RSAAlgorithm, OKPAlgorithm
+
+from config import get_settings
+
+settings = get_settings()
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "EdDSA"}
+
+
+def is_asymmetric(algorithm: str) -> bool:
+    """Indica si el algoritmo usa par de claves (JWKS) en lugar de secreto compartido"""
+    return algorithm in ASYMMETRIC_ALGORITHMS
+
+
+def generate_private_key(algorithm: str):
+    """Genera una clave privada nueva para el algoritmo indicado"""
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Algoritmo no asimétrico: {algorithm}")
+
+
+def save_private_key(private_key, keys_dir: str, kid: str) -> str:
+    """Guarda una clave privada en formato PEM y retorna la ruta"""
+    os.makedirs(keys_dir, exist_ok=True)
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    with open(path, "wb") as f:
+        f.write(pem)
+    return path
+
+
+class KeyManager:
+    """Carga las claves de firma y expone el JWKS público"""
+
+    def __init__(self, algorithm: str, keys_dir: str, active_kid: Optional[str] = None):
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self._private_keys: Dict[str, Any] = {}
+        self._load_keys()
+
+        if not self._private_keys:
+            # Primer arranque en desarrollo: generar una clave para poder firmar
+            kid = active_kid or datetime.utcnow().strftime("key-%Y%m%d")
+            save_private_key(generate_private_key(algorithm), keys_dir, kid)
+            print(f"🔑 Clave {algorithm} generada: {kid} ({keys_dir})")
+            self._load_keys()
+
+        self.active_kid = active_kid or sorted(self._private_keys)[-1]
+        if self.active_kid not in self._private_keys:
+            raise ValueError(f"JWT_ACTIVE_KID '{self.active_kid}' no existe en {keys_dir}")
+
+    def _load_keys(self):
+        """Lee todas las claves PEM del directorio"""
+        if not os.path.isdir(self.keys_dir):
+            return
+        for filename in os.listdir(self.keys_dir):
+            if not filename.endswith(".pem"):
+                continue
+            with open(os.path.join(self.keys_dir, filename), "rb") as f:
+                key = serialization.load_pem_private_key(f.read(), password=None)
+            self._private_keys[filename[:-4]] = key
+
+    @property
+    def signing_key(self):
+        """Clave privada activa para firmar tokens nuevos"""
+        return self._private_keys[self.active_kid]
+
+    def get_public_key(self, kid: Optional[str]):
+        """Clave pública por kid (None si no existe)"""
+        private_key = self._private_keys.get(kid)
+        return private_key.public_key() if private_key else None
+
+    def jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+        """JWK Set con todas las claves públicas vigentes"""
+        keys = []
+        for kid, private_key in sorted(self._private_keys.items()):
+            public_key = private_key.public_key()
+            if isinstance(public_key, rsa.RSAPublicKey):
+                jwk = RSAAlgorithm.to_jwk(public_key, as_dict=True)
+            else:
+                jwk = OKPAlgorithm.to_jwk(public_key, as_dict=True)
+            jwk.update({"kid": kid, "alg": self.algorithm, "use": "sig"})
+            keys.append(jwk)
+        return {"keys": keys}
+
+
+_key_manager: Optional[KeyManager] = None
+
+
+def get_key_manager() -> KeyManager:
+    """Retorna instancia singleton del KeyManager (solo modo asimétrico)"""
+    global _key_manager
+    if _key_manager is None:
+        _key_manager = KeyManager(
+            algorithm=settings.JWT_ALGORITHM,
+            keys_dir=settings.JWT_KEYS_DIR,
+            active_kid=settings.JWT_ACTIVE_KID or None
+        )
+    return _key_manager
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2 or not is_asymmetric(settings.JWT_ALGORITHM):
+        print("Uso: python key_manager.py <kid>  (requiere JWT_ALGORITHM=RS256 o EdDSA)")
+        sys.exit(1)
+
+    path = save_private_key(
+        generate_private_key(settings.JWT_ALGORITHM),
+        settings.JWT_KEYS_DIR,
+        sys.argv[1]
+    )
+    print(f"✅ Clave generada en {path}. Configura JWT_ACTIVE_KID={sys.argv[1]} para activarla.")
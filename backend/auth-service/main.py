@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import motor.motor_asyncio
@@ -7,6 +7,7 @@ from beanie import init_beanie
 from config import get_settings
 from models import User, RefreshToken, RevokedToken
 from routes import auth_router
+from key_manager import is_asymmetric, get_key_manager
 
 settings = get_settings()
 
@@ -25,6 +26,11 @@ async def lifespan(app: FastAPI):
     
     print(f"✅ Conectado a MongoDB - Base de datos: {settings.DB_NAME}")
     
+    # Cargar claves de firma (modo RS256/EdDSA)
+    if is_asymmetric(settings.JWT_ALGORITHM):
+        key_manager = get_key_manager()
+        print(f"🔑 Firmando JWT con {settings.JWT_ALGORITHM} - kid activo: {key_manager.active_kid}")
+    
     yield
     
     # Shutdown: Cerrar conexión
@@ -65,11 +71,31 @@ async def root():
             "login": "POST /auth/login",
             "refresh": "POST /auth/refresh",
             "logout": "POST /auth/logout",
-            "validate": "POST /auth/validate"
+            "logout_all": "POST /auth/logout-all",
+            "validate": "POST /auth/validate",
+            "validate_batch": "POST /auth/validate-batch",
+            "revocations": "GET /auth/revocations",
+            "jwks": "GET /.well-known/jwks.json"
         }
     }
 
 
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    """
+    Claves públicas para validar tokens localmente (RS256/EdDSA)
+    
+    Los validadores cachean este JWK Set y lo vuelven a pedir solo
+    cuando ven un `kid` desconocido (rotación de claves).
+    """
+    if not is_asymmetric(settings.JWT_ALGORITHM):
+        raise HTTPException(
+            status_code=404,
+            detail="JWKS no disponible: el servicio firma con HS256"
+        )
+    return get_key_manager().jwks()
+
+
 @app.get("/health")
 async def health_check():
     """Endpoint de health check"""
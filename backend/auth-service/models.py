@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Optional
 from beanie import Document
 from pydantic import EmailStr, Field
+from pymongo import IndexModel, ASCENDING
 from enum import Enum
 
 
@@ -42,19 +43,27 @@ class User(Document):
 
 
 class RefreshToken(Document):
-    """Modelo para almacenar refresh tokens"""
+    """
+    Modelo para almacenar refresh tokens
+    
+    Un documento por familia (sesión): cada /refresh rota el token y
+    actualiza este mismo documento en lugar de insertar uno nuevo.
+    """
     
     user_id: str = Field(..., description="ID del usuario")
-    token: str = Field(..., description="Refresh token")
+    family_id: Optional[str] = Field(None, description="ID de la familia de tokens (sesión)")
+    jti: Optional[str] = Field(None, description="jti del refresh token vigente de la familia")
+    token: str = Field(..., description="Refresh token vigente")
     expires_at: datetime = Field(..., description="Fecha de expiración")
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    is_revoked: bool = Field(default=False, description="Indica si el token fue revocado")
+    rotated_at: Optional[datetime] = Field(None, description="Última rotación")
+    is_revoked: bool = Field(default=False, description="Indica si la familia fue revocada")
     
     class Settings:
         name = "refresh_tokens"
         indexes = [
-            "token",  # Índice único para token
-            "user_id",
+            IndexModel([("user_id", ASCENDING), ("family_id", ASCENDING)]),  # Búsqueda por familia y logout-all
+            "token",  # Tokens emitidos antes de la rotación (sin familia)
             "expires_at",
         ]
     
@@ -62,6 +71,8 @@ class RefreshToken(Document):
         json_schema_extra = {
             "example": {
                 "user_id": "507f1f77bcf86cd799439011",
+                "family_id": "9b1f0c2d7e3a4f5b8c6d1e2f3a4b5c6d",
+                "jti": "3f2b9c0e8d4a4c1b9a7e6f5d4c3b2a19",
                 "token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
                 "expires_at": "2026-01-25T10:00:00",
                 "is_revoked": False
@@ -73,6 +84,7 @@ class RevokedToken(Document):
     """Modelo para blacklist de tokens revocados"""
     
     token: str = Field(..., description="Token revocado (JWT)")
+    jti: Optional[str] = Field(None, description="ID único del token (claim jti)")
     user_id: str = Field(..., description="ID del usuario")
     revoked_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime = Field(..., description="Fecha de expiración original del token")
@@ -82,6 +94,8 @@ class RevokedToken(Document):
         name = "revoked_tokens"
         indexes = [
             "token",  # Índice único para token
+            "jti",  # Consultas por lote ($in) de validadores
+            "revoked_at",  # Feed de revocaciones ordenado
             "expires_at",  # Para limpiar tokens expirados
         ]
     
@@ -89,6 +103,7 @@ class RevokedToken(Document):
         json_schema_extra = {
             "example": {
                 "token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
+                "jti": "3f2b9c0e8d4a4c1b9a7e6f5d4c3b2a19",
                 "user_id": "507f1f77bcf86cd799439011",
                 "revoked_at": "2026-01-18T10:00:00",
                 "expires_at": "2026-01-18T10:15:00",
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request, Query
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Optional
 import jwt
 
-from models import User, RefreshToken
+from models import User
 from schemas import (
     RegisterRequest,
     LoginRequest,
@@ -13,9 +14,14 @@ from schemas import (
     ValidateTokenRequest,
     AuthResponse,
     UserResponse,
-    TokenValidationResponse
+    TokenValidationResponse,
+    ValidateBatchRequest,
+    ValidateBatchResponse,
+    BatchTokenStatus,
+    RevocationEntry,
+    RevocationFeedResponse
 )
-from jwt_service import JWTService
+from jwt_service import JWTService, revocation_notifier
 from config import get_settings
 
 settings = get_settings()
@@ -157,7 +163,8 @@ async def refresh_access_token(request: RefreshTokenRequest):
     
     - Valida refresh token
     - Genera nuevo access token
-    - El refresh token sigue siendo válido
+    - Rota el refresh token: el anterior deja de ser válido
+    - Reutilizar un refresh token ya rotado revoca toda la sesión
     """
     # Validar refresh token
     refresh_token_doc = await JWTService.validate_refresh_token(request.refresh_token)
@@ -175,6 +182,14 @@ async def refresh_access_token(request: RefreshTokenRequest):
             detail="Usuario no encontrado o inactivo"
         )
     
+    # Rotar refresh token (actualiza el documento de la familia)
+    new_refresh_token = await JWTService.rotate_refresh_token(refresh_token_doc)
+    if not new_refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token ya utilizado"
+        )
+    
     # Generar nuevo access token
     access_token = JWTService.create_access_token(
         data={
@@ -186,7 +201,7 @@ async def refresh_access_token(request: RefreshTokenRequest):
     
     return AuthResponse(
         access_token=access_token,
-        refresh_token=request.refresh_token,  # El mismo refresh token sigue válido
+        refresh_token=new_refresh_token,
         token_type="bearer",
         expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
         user=UserResponse(
@@ -205,7 +220,7 @@ async def logout(request: LogoutRequest):
     Cerrar sesión
     
     - Revoca access token
-    - Opcionalmente revoca refresh token
+    - Opcionalmente revoca la sesión del refresh token
     - Agrega tokens a blacklist
     """
     try:
@@ -220,15 +235,9 @@ async def logout(request: LogoutRequest):
             reason="User logout"
         )
         
-        # Revocar refresh token si se proporciona
+        # Revocar la familia del refresh token si se proporciona
         if request.refresh_token:
-            # Marcar refresh token como revocado en la BD
-            refresh_token_doc = await RefreshToken.find_one(
-                RefreshToken.token == request.refresh_token
-            )
-            if refresh_token_doc:
-                refresh_token_doc.is_revoked = True
-                await refresh_token_doc.save()
+            await JWTService.revoke_refresh_token(request.refresh_token)
         
         return {"message": "Sesión cerrada exitosamente"}
         
@@ -239,6 +248,34 @@ async def logout(request: LogoutRequest):
         )
 
 
+@auth_router.post("/logout-all", status_code=status.HTTP_200_OK)
+async def logout_all(request: LogoutRequest):
+    """
+    Cerrar todas las sesiones del usuario
+    
+    - Revoca el access token actual
+    - Revoca todas las familias de refresh tokens con un solo update_many
+    """
+    try:
+        payload = JWTService.decode_token(request.access_token)
+        user_id = payload.get("user_id")
+        
+        await JWTService.revoke_token(
+            request.access_token,
+            user_id,
+            reason="User logout all"
+        )
+        revoked = await JWTService.revoke_all_refresh_tokens(user_id)
+        
+        return {"message": "Todas las sesiones cerradas", "sessions_revoked": revoked}
+        
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token inválido"
+        )
+
+
 @auth_router.post("/validate", response_model=TokenValidationResponse)
 async def validate_token(request: ValidateTokenRequest):
     """
@@ -282,6 +319,96 @@ async def validate_token(request: ValidateTokenRequest):
         )
 
 
+@auth_router.post("/validate-batch", response_model=ValidateBatchResponse)
+async def validate_batch(request: ValidateBatchRequest):
+    """
+    Validar varios tokens y/o jti en una sola llamada
+    
+    - Los tokens se verifican localmente (firma y expiración)
+    - La blacklist se consulta con una sola query `$in` para todo el lote
+    - Resultados en el mismo orden: primero `tokens`, luego `jtis`
+    """
+    decoded = []
+    for token in request.tokens:
+        try:
+            decoded.append((token, JWTService.decode_token(token), None))
+        except jwt.ExpiredSignatureError:
+            decoded.append((token, None, "Token expirado"))
+        except jwt.InvalidTokenError:
+            decoded.append((token, None, "Token inválido"))
+    
+    # Tokens con jti se buscan por jti; los emitidos antes de jti, por token
+    lookup_jtis = list(request.jtis)
+    legacy_tokens = []
+    for token, payload, _ in decoded:
+        if payload is None:
+            continue
+        if payload.get("jti"):
+            lookup_jtis.append(payload["jti"])
+        else:
+            legacy_tokens.append(token)
+    
+    revoked = await JWTService.get_revoked_set(lookup_jtis, legacy_tokens)
+    
+    results = []
+    for token, payload, error in decoded:
+        if payload is None:
+            results.append(BatchTokenStatus(valid=False, error=error))
+            continue
+        jti = payload.get("jti")
+        is_revoked = (jti or token) in revoked
+        results.append(BatchTokenStatus(
+            jti=jti,
+            valid=not is_revoked,
+            revoked=is_revoked,
+            user_id=None if is_revoked else payload.get("user_id"),
+            error="Token revocado" if is_revoked else None
+        ))
+    
+    for jti in request.jtis:
+        is_revoked = jti in revoked
+        results.append(BatchTokenStatus(
+            jti=jti,
+            valid=not is_revoked,
+            revoked=is_revoked,
+            error="Token revocado" if is_revoked else None
+        ))
+    
+    return ValidateBatchResponse(results=results)
+
+
+@auth_router.get("/revocations", response_model=RevocationFeedResponse)
+async def revocation_feed(
+    since: Optional[datetime] = Query(None, description="Cursor retornado por la consulta anterior"),
+    timeout: float = Query(25, ge=0, le=60, description="Segundos máximos de espera (long-poll)")
+):
+    """
+    Feed de revocaciones (long-poll)
+    
+    - Sin `since`: retorna todas las revocaciones vigentes (sincronización inicial)
+    - Con `since`: espera hasta `timeout` segundos a que haya revocaciones nuevas
+    
+    Los validadores mantienen así un set local de jti revocados sin
+    consultar al Auth Service en cada petición.
+    """
+    since = since or datetime(1970, 1, 1)
+    
+    revocations = await JWTService.get_revocations_since(since)
+    if not revocations and timeout > 0:
+        await revocation_notifier.wait(timeout)
+        # Volver a consultar también si venció el timeout (revocaciones de otros workers)
+        revocations = await JWTService.get_revocations_since(since)
+    
+    return RevocationFeedResponse(
+        revocations=[
+            RevocationEntry(jti=r.jti, revoked_at=r.revoked_at, expires_at=r.expires_at)
+            for r in revocations
+            if r.jti
+        ],
+        cursor=revocations[-1].revoked_at if revocations else since
+    )
+
+
 @auth_router.get("/me", response_model=UserResponse)
 async def get_current_user(request: Request):
     """
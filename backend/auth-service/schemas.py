@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional
+from typing import Optional, List
+from datetime import datetime
 from models import UserRole
 
 
@@ -151,3 +152,44 @@ class TokenValidationResponse(BaseModel):
                 "error": None
             }
         }
+
+
+class ValidateBatchRequest(BaseModel):
+    """Schema para validar varios tokens o jti en una sola llamada"""
+    tokens: List[str] = Field(default_factory=list, max_length=500, description="Tokens JWT a validar")
+    jtis: List[str] = Field(default_factory=list, max_length=500, description="IDs de token (jti) a verificar en blacklist")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "tokens": ["eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."],
+                "jtis": ["3f2b9c0e8d4a4c1b9a7e6f5d4c3b2a19"]
+            }
+        }
+
+
+class BatchTokenStatus(BaseModel):
+    """Estado de un token dentro de una validación por lote"""
+    jti: Optional[str] = Field(None, description="ID del token")
+    valid: bool = Field(..., description="Firma/expiración válidas y no revocado")
+    revoked: bool = Field(default=False, description="Indica si está en blacklist")
+    user_id: Optional[str] = Field(None, description="ID del usuario (si es válido)")
+    error: Optional[str] = Field(None, description="Mensaje de error (si es inválido)")
+
+
+class ValidateBatchResponse(BaseModel):
+    """Schema de respuesta de validación por lote (mismo orden que la petición: tokens y luego jtis)"""
+    results: List[BatchTokenStatus] = Field(..., description="Estado de cada token/jti")
+
+
+class RevocationEntry(BaseModel):
+    """Revocación publicada en el feed"""
+    jti: Optional[str] = Field(None, description="ID del token revocado")
+    revoked_at: datetime = Field(..., description="Fecha de revocación")
+    expires_at: datetime = Field(..., description="Hasta cuándo debe mantenerse en el set local")
+
+
+class RevocationFeedResponse(BaseModel):
+    """Schema de respuesta del feed de revocaciones (long-poll)"""
+    revocations: List[RevocationEntry] = Field(..., description="Revocaciones posteriores al cursor")
+    cursor: datetime = Field(..., description="Cursor para la siguiente consulta (parámetro since)")
@@ -7,11 +7,95 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from urllib.parse import quote
+import asyncio
 import httpx
+import json
 import os
 import uvicorn
+from tool_cache import create_tool_cache
 
-app = FastAPI(title="MCP Server", version="1.0.0")
+# Cliente HTTP compartido hacia el REST API (conexiones keep-alive reutilizadas entre tools)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente de la app; se crea en el lifespan (o al primer uso si no hubo startup)
+    Dentro de un lote retorna su BatchHTTPClient (GET deduplicados)
+    """
+    batch_client = _batch_client.get()
+    if batch_client is not None:
+        return batch_client
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=float(os.getenv("REST_TIMEOUT_SECONDS", "10")),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("REST_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("REST_MAX_KEEPALIVE_CONNECTIONS", "20")),
+                keepalive_expiry=float(os.getenv("REST_KEEPALIVE_EXPIRY_SECONDS", "30"))
+            )
+        )
+    return _http_client
+
+
+class BatchHTTPClient:
+    """
+    Cliente usado por las tools dentro de un lote (POST /tools/batch):
+    los GET idénticos comparten una sola petición al REST API.
+    El resto de métodos se delega al cliente compartido
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self._client = client
+        self._gets: Dict[Any, asyncio.Task] = {}
+        self.rest_gets = 0
+        self.deduplicated = 0
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> httpx.Response:
+        key = (url, json.dumps(params, sort_keys=True, default=str), json.dumps(kwargs, sort_keys=True, default=str))
+        task = self._gets.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._client.get(url, params=params, **kwargs))
+            self._gets[key] = task
+            self.rest_gets += 1
+        else:
+            self.deduplicated += 1
+        # shield: si una tool se cancela no cancela la petición que comparten las demás
+        return await asyncio.shield(task)
+
+    def forget_reads(self):
+        """Tras una escritura las lecturas anteriores ya no sirven"""
+        self._gets.clear()
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+# Cliente del lote en curso (None fuera de POST /tools/batch)
+_batch_client: ContextVar[Optional[BatchHTTPClient]] = ContextVar("batch_client", default=None)
+
+
+# Cache de tools de consulta (política por tool en tool_cache.TOOL_CACHE_POLICIES)
+tool_cache = create_tool_cache()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _http_client
+    get_http_client()
+    yield
+    # Cerrar las conexiones del pool
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+app = FastAPI(title="MCP Server", version="1.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -44,7 +128,9 @@ async def root():
         "tools": [
             "buscar_destinos",
             "ver_reserva",
+            "mis_reservas",
             "crear_reserva",
+            "cancelar_reserva",
             "buscar_guias",
             "estadisticas_ventas"
         ]
@@ -52,7 +138,11 @@ async def root():
 
 @app.get("/tools")
 async def list_tools():
-    """Listar todas las herramientas disponibles"""
+    """
+    Listar todas las herramientas disponibles
+    `input_schema` (JSON Schema) es lo que el orquestador declara a los LLM
+    en su modo nativo de function calling
+    """
     return {
         "tools": [
             {
@@ -61,7 +151,16 @@ async def list_tools():
                 "description": "Busca destinos turísticos disponibles por ubicación, categoría o nombre",
                 "parameters": {
                     "query": "texto de búsqueda",
-                    "categoria": "playa, montaña, ciudad, etc. (opcional)"
+                    "categoria": "playa, montaña, ciudad, etc. (opcional)",
+                    "provincia": "provincia de Ecuador (opcional)"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Texto de búsqueda (vacío para listar todos)"},
+                        "categoria": {"type": "string", "description": "playa, montaña, ciudad, etc."},
+                        "provincia": {"type": "string", "description": "Provincia de Ecuador"}
+                    }
                 }
             },
             {
@@ -70,6 +169,23 @@ async def list_tools():
                 "description": "Consulta información de una reserva específica por ID",
                 "parameters": {
                     "reserva_id": "ID de la reserva"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "reserva_id": {"type": "string", "description": "ID de la reserva"}
+                    },
+                    "required": ["reserva_id"]
+                }
+            },
+            {
+                "name": "mis_reservas",
+                "type": "consulta",
+                "description": "Muestra todas las reservas del usuario actual. Usar cuando el usuario diga 'mis reservas', 'quiero cancelar' sin dar ID, o 'ver mis reservas'",
+                "parameters": {},
+                "input_schema": {
+                    "type": "object",
+                    "properties": {}
                 }
             },
             {
@@ -81,6 +197,31 @@ async def list_tools():
                     "fecha": "fecha en formato YYYY-MM-DD",
                     "personas": "número de personas",
                     "usuario_id": "ID del usuario (opcional)"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "destino_id": {"type": "string", "description": "ID del destino o tour"},
+                        "fecha": {"type": "string", "description": "Fecha en formato YYYY-MM-DD"},
+                        "personas": {"type": "integer", "description": "Número de personas"},
+                        "usuario_id": {"type": "string", "description": "ID del usuario (lo agrega el orquestador)"}
+                    },
+                    "required": ["destino_id", "fecha", "personas"]
+                }
+            },
+            {
+                "name": "cancelar_reserva",
+                "type": "accion",
+                "description": "Cancela una reserva existente por su ID (o por su número en el último listado de mis_reservas)",
+                "parameters": {
+                    "reserva_id": "ID de la reserva a cancelar"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "reserva_id": {"type": "string", "description": "ID de la reserva, o su número (\"1\", \"2\"...) en el último listado"}
+                    },
+                    "required": ["reserva_id"]
                 }
             },
             {
@@ -90,6 +231,13 @@ async def list_tools():
                 "parameters": {
                     "especialidad": "tipo de tour (opcional)",
                     "ubicacion": "ciudad o región (opcional)"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "especialidad": {"type": "string", "description": "Tipo de tour"},
+                        "ubicacion": {"type": "string", "description": "Ciudad o región"}
+                    }
                 }
             },
             {
@@ -99,6 +247,13 @@ async def list_tools():
                 "parameters": {
                     "fecha_inicio": "fecha inicio (opcional)",
                     "fecha_fin": "fecha fin (opcional)"
+                },
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "fecha_inicio": {"type": "string", "description": "Fecha inicio YYYY-MM-DD"},
+                        "fecha_fin": {"type": "string", "description": "Fecha fin YYYY-MM-DD"}
+                    }
                 }
             }
         ]
@@ -108,6 +263,7 @@ async def list_tools():
 # ==================== TOOLS DE CONSULTA ====================
 
 @app.post("/tools/buscar_destinos")
+@tool_cache.cached("buscar_destinos")
 async def buscar_destinos(request: ToolRequest):
     """
     Tool de consulta: Buscar destinos turísticos
@@ -116,36 +272,41 @@ async def buscar_destinos(request: ToolRequest):
         params = request.params
         query = params.get("query", "")
         categoria = params.get("categoria")
+        provincia = params.get("provincia")
         
-        # Llamar a REST API
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            url = f"{REST_API_URL}/destinos/"
-            filters = {}
-            if query:
-                filters["search"] = query
-            if categoria:
-                filters["categoria"] = categoria
-            
-            response = await client.get(url, params=filters)
+        # Llamar al índice de búsqueda del REST API (sin tildes, por prefijo, con facetas)
+        client = get_http_client()
+        url = f"{REST_API_URL}/search"
+        filters = {"tipo": "destinos", "limit": 10}  # Limitar a 10 resultados
+        if query:
+            filters["q"] = query
+        if categoria:
+            filters["categoria"] = categoria
+        if provincia:
+            filters["provincia"] = provincia
+        
+        response = await client.get(url, params=filters)
+        
+        if response.status_code == 200:
+            result = response.json()
+            return ToolResponse(
+                success=True,
+                data={
+                    "destinos": result["results"],
+                    "total": result["total"],
+                    "facets": result["facets"],
+                    "query": query,
+                    "categoria": categoria,
+                    "provincia": provincia
+                }
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al buscar destinos: {response.status_code}"
+            )
             
-            if response.status_code == 200:
-                destinos = response.json()
-                return ToolResponse(
-                    success=True,
-                    data={
-                        "destinos": destinos[:10],  # Limitar a 10 resultados
-                        "total": len(destinos),
-                        "query": query,
-                        "categoria": categoria
-                    }
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al buscar destinos: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         # Simular respuesta si el servicio no está disponible
         return ToolResponse(
@@ -205,25 +366,25 @@ async def ver_reserva(request: ToolRequest):
             )
         
         # Llamar a REST API
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            response = await client.get(f"{REST_API_URL}/reservas/{reserva_id}")
+        client = get_http_client()
+        response = await client.get(f"{REST_API_URL}/reservas/{reserva_id}")
+        
+        if response.status_code == 200:
+            reserva = response.json()
+            return ToolResponse(success=True, data=reserva)
+        elif response.status_code == 404:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Reserva {reserva_id} no encontrada"
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al consultar reserva: {response.status_code}"
+            )
             
-            if response.status_code == 200:
-                reserva = response.json()
-                return ToolResponse(success=True, data=reserva)
-            elif response.status_code == 404:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Reserva {reserva_id} no encontrada"
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al consultar reserva: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         # Simular respuesta
         return ToolResponse(
@@ -254,65 +415,58 @@ async def mis_reservas(request: ToolRequest):
         
         print(f"📝 mis_reservas params: {params}")
         
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            # Obtener todas las reservas
-            response = await client.get(f"{REST_API_URL}/reservas/")
+        if not usuario_id:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error="Se requiere usuario_id (inicia sesión para ver tus reservas)"
+            )
+        
+        client = get_http_client()
+        # Reservas del usuario con el nombre del tour ya resuelto por el REST API
+        response = await client.get(f"{REST_API_URL}/reservas/usuario/{quote(str(usuario_id), safe='')}")
+        
+        if response.status_code == 200:
+            reservas = response.json()
             
-            if response.status_code == 200:
-                todas_reservas = response.json()
-                
-                # Filtrar por usuario si se proporcionó
-                if usuario_id:
-                    reservas = [r for r in todas_reservas if r.get("usuario_id") == usuario_id]
-                else:
-                    reservas = todas_reservas
-                
-                # Obtener nombres de tours para cada reserva
-                tours_response = await client.get(f"{REST_API_URL}/tours/")
-                tours_map = {}
-                if tours_response.status_code == 200:
-                    tours = tours_response.json()
-                    tours_map = {t.get("id"): t.get("nombre", "Tour") for t in tours}
-                
-                # Formatear reservas con nombres legibles y números para el usuario
-                reservas_formateadas = []
-                for i, r in enumerate(reservas, 1):
-                    tour_nombre = tours_map.get(r.get("tour_id"), "Tour desconocido")
-                    reservas_formateadas.append({
-                        "numero": i,  # Número amigable para el usuario
-                        "id": r.get("id"),
-                        "tour": tour_nombre,
-                        "fecha": r.get("fecha_reserva", "")[:10],
-                        "personas": r.get("cantidad_personas"),
-                        "estado": r.get("estado"),
-                        "precio": r.get("precio_total")
-                    })
-                
-                if not reservas_formateadas:
-                    return ToolResponse(
-                        success=True,
-                        data={
-                            "mensaje": "No tienes reservas activas",
-                            "reservas": []
-                        }
-                    )
-                
-                # Mensaje con instrucciones claras para el usuario
+            # Formatear reservas con nombres legibles y números para el usuario
+            reservas_formateadas = []
+            for i, r in enumerate(reservas, 1):
+                reservas_formateadas.append({
+                    "numero": i,  # Número amigable para el usuario
+                    "id": r.get("id"),
+                    "tour": r.get("tour_nombre") or "Tour desconocido",
+                    "fecha": r.get("fecha_reserva", "")[:10],
+                    "personas": r.get("cantidad_personas"),
+                    "estado": r.get("estado"),
+                    "precio": r.get("precio_total")
+                })
+            
+            if not reservas_formateadas:
                 return ToolResponse(
                     success=True,
                     data={
-                        "reservas": reservas_formateadas,
-                        "total": len(reservas_formateadas),
-                        "mensaje": f"Tienes {len(reservas_formateadas)} reserva(s). Para cancelar, di 'cancelar la reserva 1' o 'cancelar la del tour [nombre]'"
+                        "mensaje": "No tienes reservas activas",
+                        "reservas": []
                     }
                 )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al obtener reservas: {response.status_code}"
-                )
-                
+            
+            # Mensaje con instrucciones claras para el usuario
+            return ToolResponse(
+                success=True,
+                data={
+                    "reservas": reservas_formateadas,
+                    "total": len(reservas_formateadas),
+                    "mensaje": f"Tienes {len(reservas_formateadas)} reserva(s). Para cancelar, di 'cancelar la reserva 1' o 'cancelar la del tour [nombre]'"
+                }
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al obtener reservas: {response.status_code}"
+            )
+            
     except httpx.ConnectError:
         return ToolResponse(
             success=False,
@@ -324,6 +478,7 @@ async def mis_reservas(request: ToolRequest):
 
 
 @app.post("/tools/buscar_guias")
+@tool_cache.cached("buscar_guias")
 async def buscar_guias(request: ToolRequest):
     """
     Tool de consulta: Buscar guías turísticos
@@ -334,31 +489,31 @@ async def buscar_guias(request: ToolRequest):
         ubicacion = params.get("ubicacion")
         
         # Llamar a REST API
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            filters = {}
-            if especialidad:
-                filters["especialidad"] = especialidad
-            if ubicacion:
-                filters["ubicacion"] = ubicacion
-            
-            response = await client.get(f"{REST_API_URL}/guias/", params=filters)
+        client = get_http_client()
+        filters = {}
+        if especialidad:
+            filters["especialidad"] = especialidad
+        if ubicacion:
+            filters["ubicacion"] = ubicacion
+        
+        response = await client.get(f"{REST_API_URL}/guias/", params=filters)
+        
+        if response.status_code == 200:
+            guias = response.json()
+            return ToolResponse(
+                success=True,
+                data={
+                    "guias": guias[:10],
+                    "total": len(guias)
+                }
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al buscar guías: {response.status_code}"
+            )
             
-            if response.status_code == 200:
-                guias = response.json()
-                return ToolResponse(
-                    success=True,
-                    data={
-                        "guias": guias[:10],
-                        "total": len(guias)
-                    }
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al buscar guías: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         # Simular respuesta
         return ToolResponse(
@@ -433,60 +588,61 @@ async def crear_reserva(request: ToolRequest):
         except (ValueError, TypeError):
             personas_int = 1
             
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            # Primero buscar el tour asociado al destino
-            tours_response = await client.get(f"{REST_API_URL}/tours/")
-            tour_id = destino_id  # Fallback al destino_id
-            precio_tour = 50.0  # Precio por defecto
-            nombre_tour = "Tour"
-            
-            if tours_response.status_code == 200:
-                tours = tours_response.json()
-                # Buscar tour que tenga este destino_id
-                for tour in tours:
-                    if tour.get("destino_id") == destino_id:
-                        tour_id = tour.get("id")
-                        precio_tour = float(tour.get("precio", 50.0))
-                        nombre_tour = tour.get("nombre", "Tour")
-                        print(f"✅ Tour encontrado: {nombre_tour} (ID: {tour_id})")
-                        break
-            
-            # El modelo Reserva espera: tour_id, cantidad_personas, fecha_reserva
-            payload = {
-                "tour_id": tour_id,
-                "cantidad_personas": personas_int,
-                "fecha_reserva": f"{fecha}T00:00:00",
-                "usuario_id": str(usuario_id),
-                "estado": "pendiente",
-                "precio_total": float(personas_int * precio_tour)
-            }
-            
-            print(f"📤 Enviando a REST API: {payload}")
-            
-            response = await client.post(
-                f"{REST_API_URL}/reservas/",
-                json=payload
+        client = get_http_client()
+        # Primero buscar el tour asociado al destino
+        tours_response = await client.get(f"{REST_API_URL}/tours/")
+        tour_id = destino_id  # Fallback al destino_id
+        precio_tour = 50.0  # Precio por defecto
+        nombre_tour = "Tour"
+        
+        if tours_response.status_code == 200:
+            tours = tours_response.json()
+            # Buscar tour que tenga este destino_id
+            for tour in tours:
+                if tour.get("destino_id") == destino_id:
+                    tour_id = tour.get("id")
+                    precio_tour = float(tour.get("precio", 50.0))
+                    nombre_tour = tour.get("nombre", "Tour")
+                    print(f"✅ Tour encontrado: {nombre_tour} (ID: {tour_id})")
+                    break
+        
+        # El modelo Reserva espera: tour_id, cantidad_personas, fecha_reserva
+        payload = {
+            "tour_id": tour_id,
+            "cantidad_personas": personas_int,
+            "fecha_reserva": f"{fecha}T00:00:00",
+            "usuario_id": str(usuario_id),
+            "estado": "pendiente",
+            "precio_total": float(personas_int * precio_tour)
+        }
+        
+        print(f"📤 Enviando a REST API: {payload}")
+        
+        response = await client.post(
+            f"{REST_API_URL}/reservas/",
+            json=payload
+        )
+        
+        print(f"📥 REST API respuesta: {response.status_code} - {response.text}")
+        
+        if response.status_code in [200, 201]:
+            reserva = response.json()
+            tool_cache.invalidate("reservas")
+            return ToolResponse(
+                success=True,
+                data={
+                    "reserva": reserva,
+                    "tour_nombre": nombre_tour,
+                    "mensaje": f"Reserva creada exitosamente para {nombre_tour}"
+                }
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al crear reserva: {response.status_code}"
             )
             
-            print(f"📥 REST API respuesta: {response.status_code} - {response.text}")
-            
-            if response.status_code in [200, 201]:
-                reserva = response.json()
-                return ToolResponse(
-                    success=True,
-                    data={
-                        "reserva": reserva,
-                        "tour_nombre": nombre_tour,
-                        "mensaje": f"Reserva creada exitosamente para {nombre_tour}"
-                    }
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al crear reserva: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         # Simular respuesta
         reserva_id = f"RES-{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -528,39 +684,40 @@ async def cancelar_reserva(request: ToolRequest):
                 error="Se requiere reserva_id"
             )
         
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            # Actualizar estado de la reserva a 'cancelada'
-            payload = {"estado": "cancelada"}
-            
-            response = await client.put(
-                f"{REST_API_URL}/reservas/{reserva_id}",
-                json=payload
+        client = get_http_client()
+        # Actualizar estado de la reserva a 'cancelada'
+        payload = {"estado": "cancelada"}
+        
+        response = await client.put(
+            f"{REST_API_URL}/reservas/{reserva_id}",
+            json=payload
+        )
+        
+        print(f"📥 REST API respuesta: {response.status_code}")
+        
+        if response.status_code == 200:
+            reserva = response.json()
+            tool_cache.invalidate("reservas")
+            return ToolResponse(
+                success=True,
+                data={
+                    "reserva": reserva,
+                    "mensaje": f"Reserva {reserva_id} cancelada exitosamente"
+                }
+            )
+        elif response.status_code == 404:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Reserva {reserva_id} no encontrada"
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al cancelar reserva: {response.status_code}"
             )
             
-            print(f"📥 REST API respuesta: {response.status_code}")
-            
-            if response.status_code == 200:
-                reserva = response.json()
-                return ToolResponse(
-                    success=True,
-                    data={
-                        "reserva": reserva,
-                        "mensaje": f"Reserva {reserva_id} cancelada exitosamente"
-                    }
-                )
-            elif response.status_code == 404:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Reserva {reserva_id} no encontrada"
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al cancelar reserva: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         return ToolResponse(
             success=False,
@@ -574,6 +731,7 @@ async def cancelar_reserva(request: ToolRequest):
 # ==================== TOOLS DE REPORTE ====================
 
 @app.post("/tools/estadisticas_ventas")
+@tool_cache.cached("estadisticas_ventas")
 async def estadisticas_ventas(request: ToolRequest):
     """
     Tool de reporte: Generar estadísticas de ventas basadas en reservas reales
@@ -584,48 +742,48 @@ async def estadisticas_ventas(request: ToolRequest):
         fecha_fin = params.get("fecha_fin", datetime.now().strftime("%Y-%m-%d"))
         
         # Obtener todas las reservas del sistema
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            response = await client.get(f"{REST_API_URL}/reservas/")
+        client = get_http_client()
+        response = await client.get(f"{REST_API_URL}/reservas/")
+        
+        if response.status_code == 200:
+            reservas = response.json()
+            
+            # Calcular estadísticas reales
+            total_reservas = len(reservas)
+            total_ingresos = sum(float(r.get("precio_total", 0)) for r in reservas)
+            total_personas = sum(int(r.get("cantidad_personas", 0)) for r in reservas)
+            promedio = total_ingresos / total_reservas if total_reservas > 0 else 0
+            
+            # Agrupar por estado
+            estados = {}
+            for r in reservas:
+                estado = r.get("estado", "desconocido")
+                estados[estado] = estados.get(estado, 0) + 1
+            
+            return ToolResponse(
+                success=True,
+                data={
+                    "periodo": {
+                        "fecha_inicio": fecha_inicio,
+                        "fecha_fin": fecha_fin
+                    },
+                    "resumen": {
+                        "total_reservas": total_reservas,
+                        "ingresos_totales": round(total_ingresos, 2),
+                        "promedio_por_reserva": round(promedio, 2),
+                        "total_personas": total_personas
+                    },
+                    "reservas_por_estado": estados,
+                    "ultimas_reservas": reservas[-5:] if len(reservas) > 5 else reservas
+                }
+            )
+        else:
+            return ToolResponse(
+                success=False,
+                data=None,
+                error=f"Error al obtener reservas: {response.status_code}"
+            )
             
-            if response.status_code == 200:
-                reservas = response.json()
-                
-                # Calcular estadísticas reales
-                total_reservas = len(reservas)
-                total_ingresos = sum(float(r.get("precio_total", 0)) for r in reservas)
-                total_personas = sum(int(r.get("cantidad_personas", 0)) for r in reservas)
-                promedio = total_ingresos / total_reservas if total_reservas > 0 else 0
-                
-                # Agrupar por estado
-                estados = {}
-                for r in reservas:
-                    estado = r.get("estado", "desconocido")
-                    estados[estado] = estados.get(estado, 0) + 1
-                
-                return ToolResponse(
-                    success=True,
-                    data={
-                        "periodo": {
-                            "fecha_inicio": fecha_inicio,
-                            "fecha_fin": fecha_fin
-                        },
-                        "resumen": {
-                            "total_reservas": total_reservas,
-                            "ingresos_totales": round(total_ingresos, 2),
-                            "promedio_por_reserva": round(promedio, 2),
-                            "total_personas": total_personas
-                        },
-                        "reservas_por_estado": estados,
-                        "ultimas_reservas": reservas[-5:] if len(reservas) > 5 else reservas
-                    }
-                )
-            else:
-                return ToolResponse(
-                    success=False,
-                    data=None,
-                    error=f"Error al obtener reservas: {response.status_code}"
-                )
-                
     except httpx.ConnectError:
         # Simular respuesta
         return ToolResponse(
@@ -659,10 +817,105 @@ async def estadisticas_ventas(request: ToolRequest):
         return ToolResponse(success=False, data=None, error=str(e))
 
 
+# ==================== LOTES ====================
+
+# Tools invocables en lote; las de acción se ejecutan solas y en orden
+TOOL_HANDLERS = {
+    "buscar_destinos": buscar_destinos,
+    "ver_reserva": ver_reserva,
+    "mis_reservas": mis_reservas,
+    "buscar_guias": buscar_guias,
+    "crear_reserva": crear_reserva,
+    "cancelar_reserva": cancelar_reserva,
+    "estadisticas_ventas": estadisticas_ventas,
+}
+ACTION_TOOLS = {"crear_reserva", "cancelar_reserva"}
+MAX_BATCH_SIZE = int(os.getenv("MCP_MAX_BATCH_SIZE", "20"))
+
+
+class ToolCall(BaseModel):
+    tool: str
+    params: Dict[str, Any] = {}
+
+
+class BatchRequest(BaseModel):
+    calls: List[ToolCall]
+
+
+async def _run_tool(call: ToolCall) -> ToolResponse:
+    handler = TOOL_HANDLERS.get(call.tool)
+    if handler is None:
+        return ToolResponse(success=False, data=None, error=f"Herramienta desconocida: {call.tool}")
+    try:
+        return await handler(ToolRequest(params=call.params))
+    except Exception as e:
+        return ToolResponse(success=False, data=None, error=str(e))
+
+
+@app.post("/tools/batch")
+async def tools_batch(request: BatchRequest):
+    """
+    Ejecutar varias tools en una sola petición
+    - Las consultas consecutivas se ejecutan en paralelo
+    - Cada tool de acción se ejecuta sola y en orden (las consultas posteriores ven su efecto)
+    - Los GET idénticos al REST API dentro del lote se hacen una sola vez
+    Los resultados se retornan en el orden de `calls`
+    """
+    if len(request.calls) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BATCH_SIZE} herramientas por lote")
+
+    # Fases: consultas consecutivas juntas, cada acción aparte
+    phases: List[List[int]] = []
+    for index, call in enumerate(request.calls):
+        if call.tool in ACTION_TOOLS or not phases or request.calls[phases[-1][0]].tool in ACTION_TOOLS:
+            phases.append([index])
+        else:
+            phases[-1].append(index)
+
+    batch_client = BatchHTTPClient(get_http_client())
+    token = _batch_client.set(batch_client)
+    try:
+        results: List[Optional[ToolResponse]] = [None] * len(request.calls)
+        for phase in phases:
+            responses = await asyncio.gather(*(_run_tool(request.calls[index]) for index in phase))
+            for index, response in zip(phase, responses):
+                results[index] = response
+            if request.calls[phase[0]].tool in ACTION_TOOLS:
+                batch_client.forget_reads()
+    finally:
+        _batch_client.reset(token)
+
+    return {
+        "results": results,
+        "stats": {
+            "calls": len(request.calls),
+            "phases": len(phases),
+            "rest_gets": batch_client.rest_gets,
+            "deduplicated": batch_client.deduplicated
+        }
+    }
+
+
+# ==================== CACHE ====================
+
+class CacheInvalidation(BaseModel):
+    resource: str
+
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(event: CacheInvalidation):
+    """
+    Evento de escritura del REST API: descarta los resultados cacheados
+    de las tools que dependen del recurso (destinos, guias, reservas, tours...)
+    """
+    removed = tool_cache.invalidate(event.resource)
+    return {"resource": event.resource, "removed": removed}
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "MCP Server"}
+    return {"status": "healthy", "service": "MCP Server", "tool_cache": tool_cache.stats()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+"""
+Cache de resultados de tools de consulta del MCP Server
+Cada tool cacheable declara su política: TTL y recursos del REST API de los
+que depende. Una escritura en esos recursos (evento enviado por el REST API a
+POST /cache/invalidate, o una tool de acción de este servidor) descarta sus
+entradas. Almacenamiento LRU acotado en memoria
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+import json
+import os
+import time
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Política de cache de una tool"""
+    ttl: float
+    # Recursos del REST API cuyo cambio invalida los resultados
+    depends_on: Tuple[str, ...]
+
+
+TOOL_CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "buscar_destinos": CachePolicy(ttl=300, depends_on=("destinos",)),
+    "buscar_guias": CachePolicy(ttl=300, depends_on=("guias",)),
+    "estadisticas_ventas": CachePolicy(ttl=60, depends_on=("reservas", "tours")),
+}
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """
+    Clave estable de los parámetros: sin valores vacíos, textos sin espacios
+    extremos y en minúsculas, claves ordenadas
+    """
+    normalized = {}
+    for key, value in params.items():
+        if isinstance(value, str):
+            value = " ".join(value.split()).lower()
+        if value is None or value == "":
+            continue
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ToolCache:
+    """Cache LRU + TTL por (tool, parámetros normalizados)"""
+
+    def __init__(self, policies: Dict[str, CachePolicy], max_entries: int = 500, enabled: bool = True):
+        self.policies = policies
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self.hits: Dict[str, int] = {tool: 0 for tool in policies}
+        self.misses: Dict[str, int] = {tool: 0 for tool in policies}
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, tool: str, params: Dict[str, Any]) -> Optional[Any]:
+        key = (tool, normalize_params(params))
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits[tool] += 1
+            return entry[1]
+        if entry:
+            del self._entries[key]
+        self.misses[tool] += 1
+        return None
+
+    def put(self, tool: str, params: Dict[str, Any], value: Any):
+        key = (tool, normalize_params(params))
+        self._entries[key] = (time.monotonic() + self.policies[tool].ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, resource: str) -> int:
+        """Descartar las entradas de las tools que dependen del recurso"""
+        tools = {tool for tool, policy in self.policies.items() if resource in policy.depends_on}
+        keys = [key for key in self._entries if key[0] in tools]
+        for key in keys:
+            del self._entries[key]
+        self.invalidations += 1
+        return len(keys)
+
+    def cached(self, tool: str) -> Callable:
+        """
+        Decorador para el endpoint de la tool (recibe un ToolRequest)
+        Solo se cachean respuestas exitosas con datos reales (no simulados)
+        """
+        def decorator(handler: Callable) -> Callable:
+            @wraps(handler)
+            async def wrapper(request):
+                if not self.enabled or tool not in self.policies:
+                    return await handler(request)
+                cached = self.get(tool, request.params)
+                if cached is not None:
+                    return cached
+                response = await handler(request)
+                data = getattr(response, "data", None)
+                if getattr(response, "success", False) and not (isinstance(data, dict) and data.get("simulated")):
+                    self.put(tool, request.params, response)
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "tools": {
+                tool: {
+                    "ttl": policy.ttl,
+                    "depends_on": list(policy.depends_on),
+                    "hits": self.hits[tool],
+                    "misses": self.misses[tool]
+                }
+                for tool, policy in self.policies.items()
+            }
+        }
+
+
+def create_tool_cache() -> ToolCache:
+    """
+    Crear el cache según variables de entorno
+    TOOL_CACHE_TTL_<TOOL> permite ajustar el TTL de cada tool
+    """
+    policies = {
+        tool: CachePolicy(
+            ttl=float(os.getenv(f"TOOL_CACHE_TTL_{tool.upper()}", str(policy.ttl))),
+            depends_on=policy.depends_on
+        )
+        for tool, policy in TOOL_CACHE_POLICIES.items()
+    }
+    return ToolCache(
+        policies,
+        max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "500")),
+        enabled=os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    )
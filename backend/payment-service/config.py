@@ -29,6 +29,7 @@ class Settings(BaseSettings):
     AUTH_SERVICE_URL: str = "http://localhost:8001"
     JWT_SECRET_KEY: str = "your-super-secret-jwt-key-change-in-production"
     JWT_ALGORITHM: str = "HS256"
+    REVOCATION_FEED_ENABLED: bool = False  # Set local de tokens revocados (long-poll al Auth Service)
     
     # Integración Bidireccional
     INTEGRACION_SECRET_KEY: str = ""
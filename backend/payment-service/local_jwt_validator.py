@@ -9,15 +9,30 @@ USO:
 2. Configurar JWT_SECRET_KEY y JWT_ALGORITHM (deben ser los mismos del Auth Service)
 3. Usar las funciones validate_access_token() o get_current_user_from_token()
 
+MODO JWKS (RS256 / EdDSA):
+- Con JWT_ALGORITHM=RS256 o EdDSA no se necesita secreto compartido
+- Las claves públicas se descargan de JWKS_URL y se cachean en memoria
+- Un `kid` desconocido (rotación de claves) fuerza una nueva descarga
+  (como máximo una cada JWKS_MIN_REFRESH_SECONDS)
+- Llamar a prefetch_jwks() en el lifespan: get_current_user_from_token()
+  descarga en un hilo, sin bloquear el event loop
+
 IMPORTANTE: 
-- Todos los servicios deben usar la MISMA clave secreta (JWT_SECRET_KEY)
+- En modo HS256 todos los servicios deben usar la MISMA clave secreta (JWT_SECRET_KEY)
 - La verificación es SOLO local (firma y expiración)
 - Para verificar blacklist, se debe consultar al Auth Service (opcional)
+  o suscribirse al feed de revocaciones con start_revocation_feed()
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import threading
+import time
 import jwt
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -26,8 +41,16 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 # CONFIGURACIÓN (ajustar según tu entorno)
 # ============================================
 JWT_SECRET_KEY = "integracion-turismo-2026-uleam-jwt-secret-key-payment-service"
-JWT_ALGORITHM = "HS256"
-AUTH_SERVICE_URL = "http://localhost:8001"  # URL del Auth Service (para verificar blacklist)
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")  # URL del Auth Service (para verificar blacklist)
+JWKS_URL = os.getenv("JWKS_URL", f"{AUTH_SERVICE_URL}/.well-known/jwks.json")
+JWKS_CACHE_SECONDS = 300  # Tiempo de vida del JWK Set cacheado
+JWKS_MIN_REFRESH_SECONDS = 30  # Intervalo mínimo entre descargas del JWKS
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "EdDSA"}
+
+TOKEN_CACHE_MAX_SIZE = 1024  # Tokens verificados que se mantienen en memoria
+REVOCATION_FEED_TIMEOUT = 25  # Segundos de long-poll contra /auth/revocations
 
 # HTTPBearer para extraer token del header
 security = HTTPBearer()
@@ -35,13 +58,15 @@ security = HTTPBearer()
 
 class TokenPayload:
     """Clase para representar el payload de un token"""
-    def __init__(self, user_id: str, email: str, role: str, exp: int, iat: int, token_type: str):
+    def __init__(self, user_id: str, email: str, role: str, exp: int, iat: int, token_type: str,
+                 jti: Optional[str] = None):
         self.user_id = user_id
         self.email = email
         self.role = role
         self.exp = exp
         self.iat = iat
         self.token_type = token_type
+        self.jti = jti
     
     def is_expired(self) -> bool:
         """Verifica si el token expiró"""
@@ -55,16 +80,265 @@ class TokenPayload:
             "role": self.role,
             "exp": self.exp,
             "iat": self.iat,
-            "token_type": self.token_type
+            "token_type": self.token_type,
+            "jti": self.jti
         }
 
 
+class VerifiedTokenCache:
+    """
+    Cache LRU de tokens ya verificados
+    
+    Guarda digest SHA-256 del token → TokenPayload hasta el `exp` del token,
+    así un mismo token repetido no vuelve a parsearse ni a verificar firma.
+    """
+    
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Tuple[float, TokenPayload]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+    
+    def get(self, token: str) -> Optional[TokenPayload]:
+        """Retorna el payload cacheado si existe y no expiró"""
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, token: str, payload: TokenPayload):
+        """Guarda un payload verificado hasta su expiración"""
+        if not payload.exp:
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (float(payload.exp), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño y tasa de aciertos del cache"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# Cache compartido por todas las funciones de validación de este módulo
+token_cache = VerifiedTokenCache()
+
+
+def get_token_cache_stats() -> Dict[str, Any]:
+    """Estadísticas del cache de tokens verificados (para /health)"""
+    return token_cache.stats()
+
+
+class RevocationFeed:
+    """
+    Set local de tokens revocados alimentado por el Auth Service
+    
+    Hace long-poll a GET /auth/revocations y guarda jti → expiración,
+    así validate_access_token() rechaza tokens revocados sin una llamada
+    HTTP por petición.
+    """
+    
+    def __init__(self, auth_service_url: str = AUTH_SERVICE_URL):
+        self.url = f"{auth_service_url}/auth/revocations"
+        self._revoked: Dict[str, float] = {}
+        self._cursor: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """Verifica si un jti está en el set local"""
+        return bool(jti) and jti in self._revoked
+    
+    def _apply(self, data: Dict[str, Any]):
+        now = time.time()
+        for entry in data.get("revocations", []):
+            expires_at = datetime.fromisoformat(entry["expires_at"])
+            if expires_at.tzinfo is None:
+                # El Auth Service usa datetimes UTC sin zona horaria
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._revoked[entry["jti"]] = expires_at.timestamp()
+        # Olvidar revocaciones de tokens que ya expiraron por sí solos
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._cursor = data.get("cursor", self._cursor)
+    
+    async def _run(self):
+        import httpx
+        
+        async with httpx.AsyncClient(timeout=REVOCATION_FEED_TIMEOUT + 10) as client:
+            while True:
+                try:
+                    params = {"timeout": REVOCATION_FEED_TIMEOUT}
+                    if self._cursor:
+                        params["since"] = self._cursor
+                    response = await client.get(self.url, params=params)
+                    response.raise_for_status()
+                    self._apply(response.json())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Warning: Feed de revocaciones no disponible: {e}")
+                    await asyncio.sleep(5)
+    
+    def start(self):
+        """Inicia el long-poll en segundo plano (llamar desde el lifespan)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Detiene el long-poll"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self._task is not None, "revoked": len(self._revoked), "cursor": self._cursor}
+
+
+revocation_feed = RevocationFeed()
+
+
+def start_revocation_feed():
+    """Activa la verificación local de blacklist vía feed de revocaciones"""
+    revocation_feed.start()
+
+
+async def stop_revocation_feed():
+    await revocation_feed.stop()
+
+
+class JWKSKeyCache:
+    """
+    Claves públicas del JWKS indexadas por `kid`
+    
+    - Solo se crea en modo asimétrico (en HS256 no hay descargas)
+    - Se recarga al vencer JWKS_CACHE_SECONDS o ante un `kid` desconocido,
+      como máximo una vez cada JWKS_MIN_REFRESH_SECONDS: tokens con kids
+      inventados no provocan una descarga por petición
+    - La descarga (urllib, bloqueante) se hace en un hilo con refresh_async();
+      los handlers async llaman a prefetch_signing_key() antes de validar
+    """
+    
+    def __init__(self, url: str, ttl: float, min_refresh_interval: float):
+        self._client = jwt.PyJWKClient(url, cache_jwk_set=False)
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[Optional[str], Any] = {}
+        self._loaded_at: Optional[float] = None
+        self._attempted_at = float("-inf")
+        self._lock = threading.Lock()
+    
+    def needs_refresh(self, kid: Optional[str] = None) -> bool:
+        now = time.monotonic()
+        if now - self._attempted_at < self.min_refresh_interval:
+            return False
+        return (
+            self._loaded_at is None
+            or now - self._loaded_at > self.ttl
+            or (kid is not None and kid not in self._keys)
+        )
+    
+    def refresh(self, kid: Optional[str] = None):
+        """Descarga el JWK Set si corresponde (bloqueante)"""
+        with self._lock:
+            if not self.needs_refresh(kid):
+                return
+            self._attempted_at = time.monotonic()
+            try:
+                jwk_set = jwt.PyJWKSet.from_dict(self._client.fetch_data())
+            except (jwt.PyJWKClientError, jwt.PyJWKSetError) as e:
+                if not self._keys:
+                    raise jwt.PyJWKClientError(str(e))
+                # Sin conexión: seguir con las claves conocidas
+                print(f"Warning: No se pudo recargar el JWKS: {e}")
+                return
+            self._keys = {key.key_id: key.key for key in jwk_set.keys}
+            self._loaded_at = time.monotonic()
+    
+    async def refresh_async(self, kid: Optional[str] = None):
+        if self.needs_refresh(kid):
+            await asyncio.to_thread(self.refresh, kid)
+    
+    def get_key(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        # Sin prefetch previo (llamada síncrona) se descarga aquí
+        self.refresh(kid)
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f"kid desconocido en el JWKS: {kid}")
+        return key
+
+
+# Solo en modo asimétrico; en HS256 nunca se contacta el JWKS
+_jwks_cache: Optional[JWKSKeyCache] = (
+    JWKSKeyCache(JWKS_URL, JWKS_CACHE_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+    if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS else None
+)
+
+
+async def prefetch_jwks():
+    """Descarga inicial del JWKS (llamar desde el lifespan; no-op en HS256)"""
+    if _jwks_cache is not None:
+        try:
+            await _jwks_cache.refresh_async()
+        except jwt.PyJWKClientError as e:
+            print(f"Warning: JWKS no disponible al iniciar: {e}")
+
+
+async def prefetch_signing_key(token: str):
+    """Asegura en un hilo la clave del `kid` del token, sin bloquear el event loop"""
+    if _jwks_cache is None:
+        return
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        await _jwks_cache.refresh_async(kid)
+    except (jwt.InvalidTokenError, jwt.PyJWKClientError):
+        # El error se informa al validar el token
+        pass
+
+
+def _get_verification_key(token: str):
+    """
+    Obtiene la clave para verificar la firma del token
+    
+    - HS256: secreto compartido
+    - RS256/EdDSA: clave pública del JWKS según el `kid` del header
+      (JWKSKeyCache vuelve a descargar el JWKS si el kid no está en cache)
+    """
+    if _jwks_cache is None:
+        return JWT_SECRET_KEY
+    return _jwks_cache.get_key(token)
+
+
 def decode_token_local(token: str) -> TokenPayload:
     """
     Decodifica y valida un token JWT localmente
     
     Verifica:
-    - Firma del token (usando la clave secreta compartida)
+    - Firma del token (clave secreta compartida o clave pública del JWKS)
     - Expiración del token
     
     NO verifica:
@@ -79,23 +353,30 @@ def decode_token_local(token: str) -> TokenPayload:
     Raises:
         HTTPException: Si el token es inválido o expiró
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    
     try:
         # Decodificar token con verificación de firma y expiración
         payload = jwt.decode(
             token,
-            JWT_SECRET_KEY,
+            _get_verification_key(token),
             algorithms=[JWT_ALGORITHM]
         )
         
         # Crear objeto TokenPayload
-        return TokenPayload(
+        token_payload = TokenPayload(
             user_id=payload.get("user_id"),
             email=payload.get("email"),
             role=payload.get("role"),
             exp=payload.get("exp"),
             iat=payload.get("iat"),
-            token_type=payload.get("type", "access")
+            token_type=payload.get("type", "access"),
+            jti=payload.get("jti")
         )
+        token_cache.put(token, token_payload)
+        return token_payload
         
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -109,14 +390,21 @@ def decode_token_local(token: str) -> TokenPayload:
             detail=f"Token inválido: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    except jwt.PyJWKClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"No se pudo obtener la clave de firma: {str(e)}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 
 def validate_access_token(token: str) -> TokenPayload:
     """
     Valida un access token localmente
     
-    Solo valida firma y expiración. Para verificar blacklist,
-    usar verify_token_with_auth_service()
+    Valida firma y expiración. Si el feed de revocaciones está activo,
+    también rechaza tokens revocados (sin llamada HTTP). Para verificar
+    blacklist contra el Auth Service, usar verify_token_with_auth_service()
     
     Args:
         token: Access token JWT
@@ -136,6 +424,13 @@ def validate_access_token(token: str) -> TokenPayload:
             detail="Se requiere un access token"
         )
     
+    if revocation_feed.is_revoked(payload.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
     return payload
 
 
@@ -171,6 +466,7 @@ async def get_current_user_from_token(
     
     token = credentials.credentials
     print(f"🔑 [AUTH] Token recibido: {token[:20]}...")
+    await prefetch_signing_key(token)
     
     try:
         payload = validate_access_token(token)
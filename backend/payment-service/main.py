@@ -8,6 +8,7 @@ from beanie import init_beanie
 from config import get_settings
 from models import Payment, Partner, WebhookLog
 from routes import payment_router, partner_router, webhook_router, health_router
+from local_jwt_validator import start_revocation_feed, stop_revocation_feed, prefetch_jwks
 
 settings = get_settings()
 
@@ -32,9 +33,17 @@ async def lifespan(app: FastAPI):
     print(f"✅ Conectado a MongoDB: {settings.DB_NAME}")
     print(f"🚀 Payment Service iniciado en http://{settings.HOST}:{settings.PORT}")
     
+    # Claves públicas del Auth Service (solo en modo RS256/EdDSA)
+    await prefetch_jwks()
+    
+    if settings.REVOCATION_FEED_ENABLED:
+        start_revocation_feed()
+        print(f"🚫 Feed de revocaciones activo: {settings.AUTH_SERVICE_URL}/auth/revocations")
+    
     yield
     
     # Shutdown: Cerrar conexiones
+    await stop_revocation_feed()
     client.close()
     print("👋 Payment Service detenido")
 
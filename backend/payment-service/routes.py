@@ -16,7 +16,7 @@ from config import get_settings
 from beanie import PydanticObjectId
 
 # Importar validador JWT local
-from local_jwt_validator import get_current_user_from_token, require_role as _require_role
+from local_jwt_validator import get_current_user_from_token, require_role as _require_role, get_token_cache_stats
 
 # Helper para convertir documentos de Beanie a schemas Pydantic
 def to_payment_response(payment: Payment) -> PaymentResponse:
@@ -550,5 +550,6 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "payment-service",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "token_cache": get_token_cache_stats()
     }
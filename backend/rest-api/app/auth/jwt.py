@@ -8,6 +8,7 @@ from config import settings
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import hashlib
+from app.services.token_cache import get_token_cache
 
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
@@ -15,6 +16,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 15  # Tokens de acceso cortos
 REFRESH_TOKEN_EXPIRE_DAYS = 7     # Tokens de refresco más largos
 
 security = HTTPBearer()
+token_cache = get_token_cache("auth")
 
 
 def _hash_token(token: str) -> str:
@@ -61,9 +63,14 @@ def verify_token(token: str) -> dict:
     
     IMPORTANTE: Esta función SOLO verifica la firma y expiración.
     Para acciones críticas (logout, etc.), verificar también en blacklist.
+    Los tokens ya verificados se sirven desde cache hasta su expiración.
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.put(token, payload)
         return payload
     except JWTError:
         return None
@@ -1,9 +1,26 @@
 from beanie import Document
-from pydantic import Field, ConfigDict
-from typing import Optional
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+from pymongo import IndexModel, GEOSPHERE
+from typing import List, Literal, Optional
 from datetime import datetime
 
 
+class GeoPoint(BaseModel):
+    """Punto GeoJSON. `coordinates` es [longitud, latitud] (orden de GeoJSON)."""
+    type: Literal["Point"] = "Point"
+    coordinates: List[float]
+
+    @field_validator("coordinates")
+    @classmethod
+    def validar_coordenadas(cls, v):
+        if len(v) != 2:
+            raise ValueError("coordinates debe ser [longitud, latitud]")
+        lng, lat = v
+        if not -180 <= lng <= 180 or not -90 <= lat <= 90:
+            raise ValueError("coordenadas fuera de rango")
+        return v
+
+
 class Destino(Document):
     nombre: str
     descripcion: Optional[str] = None
@@ -14,6 +31,8 @@ class Destino(Document):
     categoria: Optional[str] = None
     calificacion_promedio: Optional[float] = 0.0
     activo: Optional[bool] = True
+    # Opcional: se completa desde el nomenclátor de ciudades (ver app.services.gazetteer)
+    coordenadas: Optional[GeoPoint] = None
     fecha_creacion: Optional[datetime] = Field(default_factory=datetime.now)
 
     model_config = ConfigDict(
@@ -33,6 +52,8 @@ class Destino(Document):
             "nombre",
             "categoria",
             "provincia",
-            "ciudad"
+            "ciudad",
+            # 2dsphere es disperso: los destinos sin coordenadas no entran al índice
+            IndexModel([("coordenadas", GEOSPHERE)], name="coordenadas_2dsphere"),
         ]
 
@@ -1,19 +1,30 @@
 from beanie import Document
-from pydantic import Field, EmailStr, ConfigDict
+from pydantic import Field, EmailStr, ConfigDict, field_validator
+from pymongo import IndexModel, ASCENDING
 from typing import Optional
 from datetime import date, datetime
 
 
+def normalizar_identificador(valor):
+    """Email y username en minúsculas: login y unicidad sin distinguir mayúsculas."""
+    return valor.strip().lower() if isinstance(valor, str) else valor
+
+
 class Usuario(Document):
     nombre: str
     apellido: Optional[str] = None
-    email: EmailStr = Field(..., unique=True, index=True)
-    username: Optional[str] = Field(None, unique=True, index=True)
+    email: EmailStr
+    username: Optional[str] = None
     contrasena: str
     fecha_nacimiento: Optional[date] = None
     pais: Optional[str] = None
     fecha_registro: Optional[datetime] = Field(default_factory=datetime.now)
 
+    @field_validator("email", "username")
+    @classmethod
+    def normalizar_identificador(cls, v):
+        return normalizar_identificador(v)
+
     model_config = ConfigDict(
         populate_by_name=True,
         json_encoders={
@@ -28,3 +39,12 @@ class Usuario(Document):
         use_state_management = False
         use_revision = False
         use_enum_values = True
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True),
+            # Parcial: varios usuarios pueden no tener username
+            IndexModel(
+                [("username", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"username": {"$type": "string"}}
+            ),
+        ]
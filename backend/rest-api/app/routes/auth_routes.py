@@ -5,6 +5,7 @@ Fase 2: Microservicio de autenticación completo.
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from pymongo.errors import DuplicateKeyError
 from datetime import timedelta
 from typing import Optional
 
@@ -93,11 +94,8 @@ async def login(credentials: LoginRequest):
     Iniciar sesión con email/username y contraseña.
     Retorna access_token (corta duración) y refresh_token (larga duración).
     """
-    # Buscar usuario por email o username
-    usuario = await api_controllers.obtener_usuario_por_email(credentials.email)
-    
-    if not usuario:
-        usuario = await api_controllers.obtener_usuario_por_username(credentials.email)
+    # Buscar usuario por email o username (una sola consulta)
+    usuario = await api_controllers.obtener_usuario_por_identificador(credentials.email)
     
     if not usuario:
         raise HTTPException(
@@ -144,24 +142,7 @@ async def register(user_data: RegisterRequest):
     """
     Registrar un nuevo usuario y obtener tokens.
     """
-    # Verificar si el email ya existe
-    existing_user = await api_controllers.obtener_usuario_por_email(user_data.email)
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El email ya está registrado"
-        )
-    
-    # Verificar si el username ya existe
-    if user_data.username:
-        existing_username = await api_controllers.obtener_usuario_por_username(user_data.username)
-        if existing_username:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El username ya está en uso"
-            )
-    
-    # Crear usuario
+    # Crear usuario (email/username duplicados → 400 por índice único)
     payload = {
         "nombre": user_data.nombre,
         "apellido": user_data.apellido,
@@ -172,7 +153,13 @@ async def register(user_data: RegisterRequest):
         "pais": user_data.pais
     }
     
-    nuevo_usuario = await api_controllers.crear_usuario(payload)
+    try:
+        nuevo_usuario = await api_controllers.crear_usuario(payload)
+    except DuplicateKeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=api_controllers.mensaje_usuario_duplicado(e)
+        )
     
     # Crear tokens
     access_token = create_access_token(
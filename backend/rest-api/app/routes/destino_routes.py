@@ -1,20 +1,29 @@
 """
 Rutas REST para Destinos.
 """
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
-from ..models.destino_model import Destino
+from ..models.destino_model import Destino, GeoPoint
 import controllers as api_controllers
-from ..controllers.base_controller import update as base_update, delete as base_delete
+from ..controllers.base_controller import get_by_id, update as base_update, delete as base_delete
 from ..websocket_client import notificar_destino_creado
+from ..services.search_index import search_documents
+from ..services.gazetteer import completar_coordenadas
 
 router = APIRouter(prefix="/destinos", tags=["destinos"])
 
 
 @router.get("/")
-async def list_destinos():
+async def list_destinos(
+    search: Optional[str] = None,
+    categoria: Optional[str] = None,
+    provincia: Optional[str] = None,
+):
+    # Con filtros: resultados del índice de búsqueda ordenados por relevancia
+    if search or categoria or provincia:
+        return await search_documents("destinos", q=search, categoria=categoria, provincia=provincia)
     destinos = await api_controllers.listar_destinos()
     # Serializar con id incluido
     return [
@@ -26,6 +35,25 @@ async def list_destinos():
     ]
 
 
+@router.get("/near")
+async def list_destinos_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(50, gt=0, le=2000, description="Radio en km"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Destinos cercanos a un punto, ordenados por distancia."""
+    cercanos = await api_controllers.listar_destinos_cercanos(lat, lng, radius, limit)
+    return [
+        {
+            "id": str(d.id),
+            **d.model_dump(exclude={"id", "revision_id"}),
+            "distancia_km": distancia_km,
+        }
+        for d, distancia_km in cercanos
+    ]
+
+
 @router.get("/{id}")
 async def get_destino(id: str):
     destino = await api_controllers.obtener_destino_por_id(id)
@@ -62,12 +90,25 @@ async def create_destino(payload: dict):
 
 @router.put("/{id}")
 async def update_destino(id: str, payload: dict):
-    updated = await base_update(Destino, id, payload)
-    if not updated:
+    destino = await get_by_id(Destino, id)
+    if not destino:
         raise HTTPException(status_code=404, detail="Destino no encontrado")
+
+    # Geocodificar con la ubicación resultante (guardada + cambios), no solo el payload
+    datos = completar_coordenadas(payload, actual=destino)
+    if isinstance(datos.get("coordenadas"), dict):
+        try:
+            datos["coordenadas"] = GeoPoint(**datos["coordenadas"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Coordenadas inválidas: {e}")
+
+    for key, value in datos.items():
+        if hasattr(destino, key):
+            setattr(destino, key, value)
+    await destino.save()
     return {
-        "id": str(updated.id),
-        **updated.model_dump(exclude={"id", "revision_id"}),
+        "id": str(destino.id),
+        **destino.model_dump(exclude={"id", "revision_id"}),
     }
 
 
@@ -26,6 +26,22 @@ async def list_reservas():
     ]
 
 
+@router.get("/usuario/{usuario_id}")
+async def list_reservas_usuario(usuario_id: str):
+    """
+    Reservas de un usuario con el nombre del tour (`tour_nombre`) ya resuelto.
+    """
+    reservas = await api_controllers.listar_reservas_usuario(usuario_id)
+    return [
+        {
+            "id": str(r.id),
+            **r.model_dump(exclude={"id", "revision_id"}),
+            "tour_nombre": tour_nombre,
+        }
+        for r, tour_nombre in reservas
+    ]
+
+
 @router.get("/{id}")
 async def get_reserva(id: str):
     from ..controllers.base_controller import get_by_id
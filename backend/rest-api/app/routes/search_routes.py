@@ -0,0 +1,33 @@
+"""
+Rutas REST para la búsqueda de texto completo (destinos, tours y servicios).
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..services.search_index import search_index, SEARCH_TYPES
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("")
+async def search(
+    q: Optional[str] = Query(None, description="Texto a buscar (sin tildes y por prefijo)"),
+    tipo: Optional[str] = Query(None, description="destinos, tours y/o servicios separados por coma"),
+    categoria: Optional[str] = None,
+    provincia: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Buscar con relevancia y facetas por categoría y provincia."""
+    tipos = tuple(t.strip() for t in tipo.split(",") if t.strip()) if tipo else SEARCH_TYPES
+    invalidos = [t for t in tipos if t not in SEARCH_TYPES]
+    if invalidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo no soportado: {', '.join(invalidos)}. Use: {', '.join(SEARCH_TYPES)}"
+        )
+    result = await search_index.search(
+        q=q, tipos=tipos, categoria=categoria, provincia=provincia, limit=limit, offset=offset
+    )
+    return {"query": q, "tipos": list(tipos), **result}
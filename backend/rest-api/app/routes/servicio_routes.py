@@ -1,7 +1,7 @@
 """
 Rutas REST para Servicios.
 """
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
 
@@ -9,12 +9,20 @@ from ..models.servicio_model import Servicio
 import controllers as api_controllers
 from ..controllers.base_controller import update as base_update, delete as base_delete
 from ..websocket_client import notificar_servicio_creado
+from ..services.search_index import search_documents
 
 router = APIRouter(prefix="/servicios", tags=["servicios"])
 
 
 @router.get("/")
-async def list_servicios():
+async def list_servicios(
+    search: Optional[str] = None,
+    categoria: Optional[str] = None,
+    provincia: Optional[str] = None,
+):
+    # Con filtros: resultados del índice de búsqueda ordenados por relevancia
+    if search or categoria or provincia:
+        return await search_documents("servicios", q=search, categoria=categoria, provincia=provincia)
     servicios = await api_controllers.listar_servicios()
     # Serializar con id incluido
     return [
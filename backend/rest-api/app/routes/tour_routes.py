@@ -1,20 +1,28 @@
 """
 Rutas REST para Tours.
 """
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 from ..models.tour_model import Tour
 import controllers as api_controllers
 from ..controllers.base_controller import update as base_update, delete as base_delete
 from ..websocket_client import notificar_tour_creado
+from ..services.search_index import search_documents
 
 router = APIRouter(prefix="/tours", tags=["tours"])
 
 
 @router.get("/")
-async def list_tours():
+async def list_tours(
+    search: Optional[str] = None,
+    categoria: Optional[str] = None,
+    provincia: Optional[str] = None,
+):
+    # Con filtros: resultados del índice de búsqueda (categoría y provincia del destino)
+    if search or categoria or provincia:
+        return await search_documents("tours", q=search, categoria=categoria, provincia=provincia)
     tours = await api_controllers.listar_tours()
     # Serializar con id incluido
     result = []
@@ -27,6 +35,26 @@ async def list_tours():
     return result
 
 
+@router.get("/near")
+async def list_tours_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(50, gt=0, le=2000, description="Radio en km"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Tours disponibles en destinos cercanos a un punto, ordenados por distancia."""
+    cercanos = await api_controllers.listar_tours_cercanos(lat, lng, radius, limit)
+    return [
+        {
+            "id": str(t.id),
+            **t.model_dump(exclude={"id", "revision_id"}),
+            "destino_nombre": destino.nombre,
+            "distancia_km": distancia_km,
+        }
+        for t, destino, distancia_km in cercanos
+    ]
+
+
 @router.get("/{id}")
 async def get_tour(id: str):
     # usamos el helper genérico
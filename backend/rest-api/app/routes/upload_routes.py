@@ -7,6 +7,7 @@ from typing import Optional
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from app.auth.jwt import verify_admin_token
+from app.services.upload_stream import save_upload_stream
 
 router = APIRouter(prefix="/admin/upload", tags=["Upload"])
 
@@ -14,6 +15,8 @@ router = APIRouter(prefix="/admin/upload", tags=["Upload"])
 UPLOAD_DIR = "uploads"
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+# Margen del multipart (boundaries y cabeceras) para el límite por Content-Length
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 64 * 1024
 
 def get_file_extension(filename: str) -> str:
     """Obtener la extensión del archivo en minúsculas"""
@@ -89,27 +92,10 @@ async def upload_image(file: UploadFile, category: str) -> JSONResponse:
         )
     
     try:
-        # Leer contenido del archivo
-        contents = await file.read()
-        
-        # Validar tamaño del archivo
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"El archivo es demasiado grande. Tamaño máximo: {MAX_FILE_SIZE / (1024*1024)}MB"
-            )
-        
-        # Crear directorio si no existe
+        # Guardar por bloques: se aborta al superar MAX_FILE_SIZE y el tipo se
+        # valida por los magic bytes (el nombre único usa la extensión detectada)
         upload_path = os.path.join(UPLOAD_DIR, category)
-        os.makedirs(upload_path, exist_ok=True)
-        
-        # Generar nombre único para el archivo
-        unique_filename = generate_unique_filename(file.filename)
-        file_path = os.path.join(upload_path, unique_filename)
-        
-        # Guardar archivo
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        unique_filename, size = await save_upload_stream(file, upload_path, MAX_FILE_SIZE)
         
         # Construir URL de acceso
         file_url = f"/uploads/{category}/{unique_filename}"
@@ -122,7 +108,7 @@ async def upload_image(file: UploadFile, category: str) -> JSONResponse:
                 "filename": unique_filename,
                 "original_filename": file.filename,
                 "category": category,
-                "size": len(contents)
+                "size": size
             }
         )
     
@@ -8,10 +8,11 @@ from datetime import timedelta
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
 
 from ..models.usuario_model import Usuario
 import controllers as api_controllers
-from ..controllers.base_controller import update as base_update, delete as base_delete
+from ..controllers.base_controller import delete as base_delete
 from ..auth.jwt import create_access_token, verify_token
 from utils import verify_password
 from ..websocket_client import notificar_usuario_registrado, notificar_usuario_inicio_sesion
@@ -45,12 +46,8 @@ class LoginResponse(BaseModel):
 @router.post("/login", response_model=LoginResponse)
 async def login(credentials: LoginRequest):
     """Iniciar sesión con email o username y contraseña."""
-    # Buscar usuario por email o username
-    usuario = await api_controllers.obtener_usuario_por_email(credentials.email)
-    
-    # Si no se encuentra por email, intentar buscar por username
-    if not usuario:
-        usuario = await api_controllers.obtener_usuario_por_username(credentials.email)
+    # Buscar usuario por email o username (una sola consulta)
+    usuario = await api_controllers.obtener_usuario_por_identificador(credentials.email)
     
     if not usuario:
         raise HTTPException(status_code=401, detail="Credenciales incorrectas")
@@ -87,18 +84,7 @@ async def login(credentials: LoginRequest):
 @router.post("/register", response_model=Usuario)
 async def register(user_data: RegisterRequest):
     """Registrar un nuevo usuario."""
-    # Verificar si el email ya existe
-    existing_user = await api_controllers.obtener_usuario_por_email(user_data.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="El email ya está registrado")
-    
-    # Verificar si el username ya existe
-    if user_data.username:
-        existing_username = await api_controllers.obtener_usuario_por_username(user_data.username)
-        if existing_username:
-            raise HTTPException(status_code=400, detail="El username ya está en uso")
-    
-    # Crear usuario
+    # Crear usuario (email/username duplicados → 400 por índice único)
     payload = {
         "nombre": user_data.nombre,
         "apellido": user_data.apellido,
@@ -109,7 +95,10 @@ async def register(user_data: RegisterRequest):
         "pais": user_data.pais
     }
     
-    nuevo_usuario = await api_controllers.crear_usuario(payload)
+    try:
+        nuevo_usuario = await api_controllers.crear_usuario(payload)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=api_controllers.mensaje_usuario_duplicado(e))
     
     # Notificar registro vía WebSocket
     await notificar_usuario_registrado(
@@ -137,12 +126,18 @@ async def get_usuario(id: str):
 
 @router.post("/", response_model=Usuario)
 async def create_usuario(payload: dict):
-    return await api_controllers.crear_usuario(payload)
+    try:
+        return await api_controllers.crear_usuario(payload)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=api_controllers.mensaje_usuario_duplicado(e))
 
 
 @router.put("/{id}", response_model=Usuario)
 async def update_usuario(id: str, payload: dict):
-    updated = await base_update(Usuario, id, payload)
+    try:
+        updated = await api_controllers.actualizar_usuario(id, payload)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=api_controllers.mensaje_usuario_duplicado(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return updated
@@ -94,6 +94,9 @@ async def receive_partner_webhook(
     except HTTPException as e:
         raise e
     
+    # Clave pública del JWKS (modo RS256/EdDSA) sin bloquear el event loop
+    await JWTValidator.prefetch_signing_key(token)
+    
     # Validar seguridad dual: JWT + HMAC
     security_result = WebhookSecurityValidator.validate_webhook_security(
         token=token,
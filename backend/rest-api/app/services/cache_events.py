@@ -0,0 +1,117 @@
+"""
+Eventos de escritura para invalidar caches externos.
+El MCP Server cachea resultados de sus tools de consulta (destinos, guías,
+estadísticas de reservas); cuando una escritura en este REST API modifica uno
+de esos recursos se le envía `POST {MCP_SERVER_URL}/cache/invalidate`.
+
+El envío es en segundo plano y no afecta a la respuesta: si el MCP Server no
+está disponible, sus entradas expiran igualmente por TTL.
+
+Los caches locales (p. ej. el índice de búsqueda) se suscriben con
+`add_resource_listener`.
+"""
+import asyncio
+import logging
+from typing import Callable, List, Optional, Set
+
+import httpx
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Prefijo de ruta → recurso que modifica
+RESOURCE_PREFIXES = {
+    "/destinos": "destinos",
+    "/tours": "tours",
+    "/guias": "guias",
+    "/servicios": "servicios",
+    "/reservas": "reservas",
+    "/api/pagos": "reservas",
+    "/webhooks": "reservas",
+}
+
+_client: Optional[httpx.AsyncClient] = None
+# Referencias a las tareas en curso (evita que el recolector las cancele)
+_pending: Set[asyncio.Task] = set()
+# Callbacks locales invocados con el recurso modificado
+_listeners: List[Callable[[str], None]] = []
+
+
+def resource_for_path(path: str) -> Optional[str]:
+    for prefix, resource in RESOURCE_PREFIXES.items():
+        if path == prefix or path.startswith(prefix + "/"):
+            return resource
+    return None
+
+
+async def _send_invalidation(resource: str):
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=2.0)
+    try:
+        await _client.post(
+            f"{settings.mcp_server_url}/cache/invalidate",
+            json={"resource": resource}
+        )
+    except httpx.HTTPError as e:
+        logger.debug(f"No se pudo notificar la invalidación de '{resource}': {e}")
+
+
+def add_resource_listener(listener: Callable[[str], None]):
+    """Registrar un callback local que recibe el recurso modificado."""
+    _listeners.append(listener)
+
+
+def notify_resource_changed(resource: str):
+    """Avisar a los listeners locales y programar el aviso al MCP Server sin esperar su resultado."""
+    for listener in _listeners:
+        try:
+            listener(resource)
+        except Exception as e:
+            logger.warning(f"Listener de cambios falló para '{resource}': {e}")
+    if not settings.mcp_cache_invalidation_enabled:
+        return
+    task = asyncio.create_task(_send_invalidation(resource))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def close_cache_events_client():
+    """Cerrar el cliente HTTP (shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class ResourceChangeMiddleware:
+    """
+    Middleware ASGI: tras una escritura exitosa (status < 400) sobre un
+    recurso de RESOURCE_PREFIXES notifica su cambio.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        resource = resource_for_path(scope["path"])
+        if resource is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if status.get("code", 500) < 400:
+            notify_resource_changed(resource)
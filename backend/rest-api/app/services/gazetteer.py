@@ -0,0 +1,214 @@
+"""
+Nomenclátor offline de ciudades y lugares turísticos de Ecuador.
+Geocodifica destinos a partir de sus campos de texto sin servicios externos:
+
+1. `ciudad` (nombre exacto o alias)
+2. `nombre` y `ubicacion` (un lugar conocido mencionado en el texto)
+3. `provincia` (coordenadas de su capital, menos precisas)
+
+La precisión es de nivel ciudad: suficiente para ordenar recomendaciones por
+cercanía, no para navegación. Usado al crear/actualizar destinos y por el job
+de backfill (`backfill_coordenadas.py`).
+"""
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from .search_index import fold_text
+
+# Lugar → (latitud, longitud)
+ECUADOR_GAZETTEER: Dict[str, Tuple[float, float]] = {
+    # Capitales de provincia
+    "Quito": (-0.1807, -78.4678),
+    "Guayaquil": (-2.1894, -79.8891),
+    "Cuenca": (-2.9006, -79.0045),
+    "Ambato": (-1.2417, -78.6197),
+    "Riobamba": (-1.6710, -78.6483),
+    "Loja": (-3.9931, -79.2042),
+    "Machala": (-3.2581, -79.9554),
+    "Portoviejo": (-1.0546, -80.4545),
+    "Esmeraldas": (0.9592, -79.6539),
+    "Ibarra": (0.3517, -78.1223),
+    "Tulcán": (0.8119, -77.7173),
+    "Latacunga": (-0.9352, -78.6155),
+    "Guaranda": (-1.5926, -79.0010),
+    "Babahoyo": (-1.8022, -79.5344),
+    "Azogues": (-2.7397, -78.8486),
+    "Macas": (-2.3087, -78.1114),
+    "Puyo": (-1.4924, -77.9986),
+    "Tena": (-0.9938, -77.8129),
+    "Nueva Loja": (0.0847, -76.8828),
+    "Puerto Francisco de Orellana": (-0.4625, -76.9842),
+    "Zamora": (-4.0692, -78.9567),
+    "Puerto Baquerizo Moreno": (-0.9017, -89.6103),
+    "Santo Domingo": (-0.2530, -79.1754),
+    "Santa Elena": (-2.2262, -80.8590),
+    # Otras ciudades y lugares turísticos
+    "Manta": (-0.9677, -80.7089),
+    "Quevedo": (-1.0286, -79.4635),
+    "Otavalo": (0.2343, -78.2625),
+    "Cotacachi": (0.3011, -78.2647),
+    "Puerto Ayora": (-0.7436, -90.3134),
+    "Puerto Villamil": (-0.9562, -90.9664),
+    "Salinas": (-2.2145, -80.9521),
+    "Montañita": (-1.8283, -80.7531),
+    "Olón": (-1.7936, -80.7567),
+    "Puerto López": (-1.5597, -80.8133),
+    "Playas": (-2.6300, -80.3890),
+    "Baños de Agua Santa": (-1.3964, -78.4247),
+    "Mindo": (-0.0527, -78.7750),
+    "Vilcabamba": (-4.2611, -79.2222),
+    "Atacames": (0.8681, -79.8453),
+    "Canoa": (-0.4650, -80.4550),
+    "Bahía de Caráquez": (-0.5983, -80.4242),
+    "Mitad del Mundo": (-0.0022, -78.4558),
+    "Papallacta": (-0.3667, -78.1436),
+    "Alausí": (-2.2020, -78.8460),
+    "Gualaceo": (-2.8927, -78.7770),
+    "Ingapirca": (-2.5453, -78.8758),
+    "Quilotoa": (-0.8589, -78.9047),
+    "Misahuallí": (-1.0347, -77.6650),
+    "Volcán Cotopaxi": (-0.6836, -78.4366),
+    "Volcán Chimborazo": (-1.4693, -78.8175),
+}
+
+# Nombres alternativos frecuentes → lugar del nomenclátor
+ALIASES = {
+    "Baños": "Baños de Agua Santa",
+    "Lago Agrio": "Nueva Loja",
+    "Coca": "Puerto Francisco de Orellana",
+    "El Coca": "Puerto Francisco de Orellana",
+    "San Cristóbal": "Puerto Baquerizo Moreno",
+    "Santa Cruz": "Puerto Ayora",
+    "Isabela": "Puerto Villamil",
+    "San Antonio de Pichincha": "Mitad del Mundo",
+    "Santo Domingo de los Colorados": "Santo Domingo",
+    "Parque Nacional Cotopaxi": "Volcán Cotopaxi",
+    "General Villamil": "Playas",
+}
+
+# Nombres que también son palabras comunes: solo se aceptan en `ciudad`,
+# no dentro de un texto libre ("Paseo en canoa", "Playas de Atacames")
+CITY_ONLY = {"Canoa", "Playas", "Coca", "Santa Cruz", "Isabela"}
+
+# Provincia → capital
+PROVINCE_CAPITALS = {
+    "Azuay": "Cuenca",
+    "Bolívar": "Guaranda",
+    "Cañar": "Azogues",
+    "Carchi": "Tulcán",
+    "Chimborazo": "Riobamba",
+    "Cotopaxi": "Latacunga",
+    "El Oro": "Machala",
+    "Esmeraldas": "Esmeraldas",
+    "Galápagos": "Puerto Baquerizo Moreno",
+    "Guayas": "Guayaquil",
+    "Imbabura": "Ibarra",
+    "Loja": "Loja",
+    "Los Ríos": "Babahoyo",
+    "Manabí": "Portoviejo",
+    "Morona Santiago": "Macas",
+    "Napo": "Tena",
+    "Orellana": "Puerto Francisco de Orellana",
+    "Pastaza": "Puyo",
+    "Pichincha": "Quito",
+    "Santa Elena": "Santa Elena",
+    "Santo Domingo de los Tsáchilas": "Santo Domingo",
+    "Sucumbíos": "Nueva Loja",
+    "Tungurahua": "Ambato",
+    "Zamora Chinchipe": "Zamora",
+}
+
+# Índices por nombre normalizado (sin tildes, minúsculas)
+_PLACES = {fold_text(name): coords for name, coords in ECUADOR_GAZETTEER.items()}
+_PLACES.update({fold_text(alias): ECUADOR_GAZETTEER[name] for alias, name in ALIASES.items()})
+_PROVINCES = {fold_text(p): ECUADOR_GAZETTEER[c] for p, c in PROVINCE_CAPITALS.items()}
+# Para buscar lugares dentro de un texto libre: nombres más largos primero
+_FREE_TEXT_PLACES = sorted(set(_PLACES) - {fold_text(name) for name in CITY_ONLY}, key=len, reverse=True)
+_PLACE_PATTERN = re.compile(r"\b(" + "|".join(re.escape(name) for name in _FREE_TEXT_PLACES) + r")\b")
+
+# Campos del destino que determinan su ubicación
+LOCATION_FIELDS = ("ciudad", "nombre", "ubicacion", "provincia")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(fold_text(text).replace(",", " ").split())
+
+
+def geocodificar(
+    ciudad: Optional[str] = None,
+    nombre: Optional[str] = None,
+    ubicacion: Optional[str] = None,
+    provincia: Optional[str] = None,
+) -> Optional[Tuple[float, float, str]]:
+    """
+    Coordenadas de un destino según sus campos de texto.
+
+    Returns:
+        (latitud, longitud, fuente) donde fuente es el campo usado, o None
+    """
+    ciudad_n = _normalize(ciudad)
+    if ciudad_n in _PLACES:
+        return (*_PLACES[ciudad_n], "ciudad")
+    for field, value in (("nombre", nombre), ("ubicacion", ubicacion)):
+        match = _PLACE_PATTERN.search(_normalize(value))
+        if match:
+            return (*_PLACES[match.group(1)], field)
+    provincia_n = _normalize(provincia)
+    if provincia_n in _PROVINCES:
+        return (*_PROVINCES[provincia_n], "provincia")
+    return None
+
+
+def punto_geojson(lat: float, lng: float) -> Dict[str, Any]:
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def completar_coordenadas(payload: Dict[str, Any], actual: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Agregar `coordenadas` al payload de creación/actualización de un destino
+    cuando trae ciudad, ubicación o provincia pero no coordenadas explícitas
+    (renombrar un destino no cambia sus coordenadas).
+
+    En una actualización `actual` es el destino guardado: se geocodifica con
+    sus campos de ubicación combinados con los del payload, y solo si el
+    payload cambia alguno (o el destino aún no tiene coordenadas). Si la
+    nueva ubicación no está en el nomenclátor se quitan las anteriores.
+    """
+    if payload.get("coordenadas") or not any(payload.get(f) for f in ("ciudad", "ubicacion", "provincia")):
+        return payload
+    campos = {f: payload[f] if f in payload else getattr(actual, f, None) for f in LOCATION_FIELDS}
+    if actual is not None and actual.coordenadas and all(
+        campos[f] == getattr(actual, f, None) for f in ("ciudad", "ubicacion", "provincia")
+    ):
+        return payload
+    result = geocodificar(**campos)
+    if result is None:
+        return payload if actual is None else {**payload, "coordenadas": None}
+    lat, lng, _ = result
+    return {**payload, "coordenadas": punto_geojson(lat, lng)}
+
+
+async def backfill_coordenadas(sobrescribir: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Geocodificar los destinos sin coordenadas (o todos con `sobrescribir`).
+
+    Returns:
+        Conteo por fuente usada y destinos sin resolver
+    """
+    from app.models.destino_model import Destino, GeoPoint
+
+    query = Destino.find_all() if sobrescribir else Destino.find(Destino.coordenadas == None)  # noqa: E711
+    resumen: Dict[str, Any] = {"revisados": 0, "actualizados": 0, "por_fuente": {}, "sin_resolver": []}
+    async for destino in query:
+        resumen["revisados"] += 1
+        result = geocodificar(destino.ciudad, destino.nombre, destino.ubicacion, destino.provincia)
+        if result is None:
+            resumen["sin_resolver"].append(destino.nombre)
+            continue
+        lat, lng, fuente = result
+        resumen["por_fuente"][fuente] = resumen["por_fuente"].get(fuente, 0) + 1
+        if not dry_run:
+            destino.coordenadas = GeoPoint(coordinates=[lng, lat])
+            await destino.save()
+            resumen["actualizados"] += 1
+    return resumen
@@ -3,19 +3,101 @@ Servicio de validación JWT - Semana 4
 Valida tokens JWT en endpoints de webhook
 Integración con Auth Service
 """
+import asyncio
 import os
 import logging
+import threading
+import time
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 import jwt
 from fastapi import HTTPException
 
+from .token_cache import get_token_cache
+
 logger = logging.getLogger(__name__)
 
 # Configuración
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "tu_jwt_secret_key_muy_seguro_aqui")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_MINUTES = int(os.getenv("JWT_EXPIRATION_MINUTES", "30"))
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
+JWKS_URL = os.getenv("JWKS_URL", f"{AUTH_SERVICE_URL}/.well-known/jwks.json")
+JWKS_CACHE_SECONDS = int(os.getenv("JWKS_CACHE_SECONDS", "300"))
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+
+# Algoritmos con par de claves: se validan con el JWKS del Auth Service
+ASYMMETRIC_ALGORITHMS = {"RS256", "EdDSA"}
+
+
+class JWKSKeyCache:
+    """
+    Claves públicas del JWKS indexadas por `kid`.
+    
+    Solo se crea en modo asimétrico. Se recarga al vencer JWKS_CACHE_SECONDS o
+    ante un `kid` desconocido, como máximo una vez cada JWKS_MIN_REFRESH_SECONDS
+    (tokens con kids inventados no provocan una descarga por petición). La
+    descarga es bloqueante: los handlers async la hacen en un hilo con
+    `refresh_async` antes de validar.
+    """
+
+    def __init__(self, url: str, ttl: float, min_refresh_interval: float):
+        self._client = jwt.PyJWKClient(url, cache_jwk_set=False)
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[Optional[str], Any] = {}
+        self._loaded_at: Optional[float] = None
+        self._attempted_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def needs_refresh(self, kid: Optional[str] = None) -> bool:
+        now = time.monotonic()
+        if now - self._attempted_at < self.min_refresh_interval:
+            return False
+        return (
+            self._loaded_at is None
+            or now - self._loaded_at > self.ttl
+            or (kid is not None and kid not in self._keys)
+        )
+
+    def refresh(self, kid: Optional[str] = None):
+        """Descarga el JWK Set si corresponde (bloqueante)."""
+        with self._lock:
+            if not self.needs_refresh(kid):
+                return
+            self._attempted_at = time.monotonic()
+            try:
+                jwk_set = jwt.PyJWKSet.from_dict(self._client.fetch_data())
+            except (jwt.PyJWKClientError, jwt.PyJWKSetError) as e:
+                if not self._keys:
+                    raise jwt.PyJWKClientError(str(e))
+                # Sin conexión: seguir con las claves conocidas
+                logger.warning(f"⚠️ No se pudo recargar el JWKS: {str(e)}")
+                return
+            self._keys = {key.key_id: key.key for key in jwk_set.keys}
+            self._loaded_at = time.monotonic()
+
+    async def refresh_async(self, kid: Optional[str] = None):
+        if self.needs_refresh(kid):
+            await asyncio.to_thread(self.refresh, kid)
+
+    def get_key(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        self.refresh(kid)
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f"kid desconocido en el JWKS: {kid}")
+        return key
+
+
+# Solo en modo asimétrico; con HS256 nunca se contacta el JWKS
+_jwks_cache: Optional[JWKSKeyCache] = (
+    JWKSKeyCache(JWKS_URL, JWKS_CACHE_SECONDS, JWKS_MIN_REFRESH_SECONDS)
+    if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS else None
+)
+
+# Tokens ya verificados (evita re-verificar la firma en cada webhook)
+token_cache = get_token_cache("webhooks")
 
 
 class JWTValidator:
@@ -43,6 +125,13 @@ class JWTValidator:
         Returns:
             Dict con token y tiempo de expiración
         """
+        if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS:
+            # Sin clave privada local: en modo JWKS los tokens los emite el Auth Service
+            raise HTTPException(
+                status_code=400,
+                detail=f"Con {JWT_ALGORITHM} los tokens se obtienen del Auth Service"
+            )
+        
         if expires_delta is None:
             expires_delta = timedelta(minutes=JWT_EXPIRATION_MINUTES)
         
@@ -67,6 +156,33 @@ class JWTValidator:
             "expires_in": int(expires_delta.total_seconds())
         }
 
+    @staticmethod
+    def get_verification_key(token: str):
+        """
+        Obtiene la clave para verificar la firma del token.
+        
+        Con HS256 usa el secreto compartido; con RS256/EdDSA busca la clave
+        pública por `kid` en el JWKS cacheado (se recarga ante un kid nuevo).
+        """
+        if _jwks_cache is None:
+            return JWT_SECRET
+        return _jwks_cache.get_key(token)
+
+    @staticmethod
+    async def prefetch_signing_key(token: Optional[str] = None):
+        """
+        Descarga en un hilo el JWKS si hace falta para validar `token` (o al
+        iniciar, sin token), así `verify_token` no bloquea el event loop.
+        """
+        if _jwks_cache is None:
+            return
+        try:
+            kid = jwt.get_unverified_header(token).get("kid") if token else None
+            await _jwks_cache.refresh_async(kid)
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError) as e:
+            # El error se informa al validar el token
+            logger.warning(f"⚠️ JWKS no disponible: {str(e)}")
+
     @staticmethod
     def verify_token(token: str) -> Dict[str, Any]:
         """
@@ -81,12 +197,17 @@ class JWTValidator:
         Raises:
             HTTPException si el token es inválido o expirado
         """
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached
+        
         try:
             payload = jwt.decode(
                 token,
-                JWT_SECRET,
+                JWTValidator.get_verification_key(token),
                 algorithms=[JWT_ALGORITHM]
             )
+            token_cache.put(token, payload)
             logger.info(f"✅ Token JWT válido para usuario: {payload.get('user_id')}")
             return payload
         
@@ -98,6 +219,10 @@ class JWTValidator:
             logger.warning("⚠️ Token JWT inválido")
             raise HTTPException(status_code=401, detail="Token inválido")
         
+        except jwt.PyJWKClientError as e:
+            logger.error(f"❌ No se pudo obtener la clave del JWKS: {str(e)}")
+            raise HTTPException(status_code=401, detail="No se pudo obtener la clave de firma")
+        
         except Exception as e:
             logger.error(f"❌ Error verificando token: {str(e)}")
             raise HTTPException(status_code=401, detail="Error en validación de token")
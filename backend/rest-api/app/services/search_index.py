@@ -0,0 +1,304 @@
+"""
+Índice de búsqueda de texto completo para destinos, tours y servicios.
+Índice invertido en memoria (el catálogo es pequeño y cabe completo):
+
+- Normalización para español: minúsculas y sin tildes ("Baños" = "banos"),
+  sin palabras vacías ("de", "la", "en"...).
+- Cada término de la consulta debe aparecer en el documento (AND) y se compara
+  por prefijo ("gala" encuentra "Galápagos"); la coincidencia exacta y los
+  campos principales (nombre) pesan más en la relevancia.
+- Facetas por `categoria` y `provincia`: cada una se cuenta aplicando los
+  demás filtros pero no el propio, para que el cliente pueda ofrecer las
+  alternativas.
+
+Los tours no tienen categoría ni provincia propias: se toman de su destino.
+Los servicios se asocian a un destino por id o por nombre (`Servicio.destino`).
+
+El índice se reconstruye de forma perezosa desde MongoDB: tras una escritura
+en los recursos indexados (ver `cache_events.add_resource_listener`) o al
+vencer `settings.search_index_ttl_seconds` (cambios hechos fuera de la API).
+"""
+import asyncio
+import bisect
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+
+# Tipos de documento indexados (mismo nombre que sus rutas REST)
+SEARCH_TYPES = ("destinos", "tours", "servicios")
+
+# Peso de cada campo en la relevancia
+FIELD_WEIGHTS = {
+    "nombre": 3.0,
+    "categoria": 2.0,
+    "ciudad": 2.0,
+    "provincia": 2.0,
+    "ubicacion": 1.5,
+    "destino": 1.5,
+    "descripcion": 1.0,
+    "ruta": 1.0,
+    "proveedor": 1.0,
+}
+
+# Factor para términos encontrados solo por prefijo
+PREFIX_FACTOR = 0.5
+# Longitud mínima para comparar por prefijo (más corta: solo coincidencia exacta)
+MIN_PREFIX_LENGTH = 2
+
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "para", "por", "que", "se", "su", "un", "una", "y", "o", "e",
+}
+
+DocKey = Tuple[str, str]
+
+
+def fold_text(text: Optional[str]) -> str:
+    """Minúsculas y sin tildes ni diéresis (la ñ también se pliega: "Baños" → "banos")."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Términos normalizados del texto, sin palabras vacías."""
+    return [t for t in re.findall(r"\w+", fold_text(text)) if t not in STOPWORDS]
+
+
+def _serialize(doc) -> Dict[str, Any]:
+    return {"id": str(doc.id), **doc.model_dump(exclude={"id", "revision_id"})}
+
+
+class SearchIndex:
+    """Índice invertido con facetas sobre destinos, tours y servicios."""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        # término → {documento: peso}
+        self._postings: Dict[str, Dict[DocKey, float]] = {}
+        # vocabulario ordenado para búsquedas por prefijo (bisect)
+        self._vocabulary: List[str] = []
+        self._documents: Dict[DocKey, Dict[str, Any]] = {}
+        # documento → (categoria, provincia) para filtros y facetas
+        self._facets: Dict[DocKey, Tuple[Optional[str], Optional[str]]] = {}
+        self._built_at: Optional[float] = None
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self.builds = 0
+        self.queries = 0
+        self.last_build_ms: Optional[float] = None
+
+    # --- Construcción ---
+
+    def invalidate(self, resource: Optional[str] = None):
+        """Marcar el índice para reconstrucción (ignora recursos no indexados)."""
+        if resource is None or resource in SEARCH_TYPES:
+            self._stale = True
+
+    def _needs_build(self) -> bool:
+        return (
+            self._stale
+            or self._built_at is None
+            or time.monotonic() - self._built_at > self.ttl_seconds
+        )
+
+    async def ensure_built(self):
+        if not self._needs_build():
+            return
+        async with self._lock:
+            if self._needs_build():
+                await self._build()
+
+    async def _build(self):
+        from app.models.destino_model import Destino
+        from app.models.tour_model import Tour
+        from app.models.servicio_model import Servicio
+
+        started = time.perf_counter()
+        # Marcar antes de leer: una escritura durante la carga vuelve a invalidarlo
+        self._stale = False
+        try:
+            destinos, tours, servicios = await asyncio.gather(
+                Destino.find_all().to_list(),
+                Tour.find_all().to_list(),
+                Servicio.find_all().to_list(),
+            )
+        except Exception:
+            self._stale = True
+            raise
+
+        postings: Dict[str, Dict[DocKey, float]] = defaultdict(dict)
+        documents: Dict[DocKey, Dict[str, Any]] = {}
+        facets: Dict[DocKey, Tuple[Optional[str], Optional[str]]] = {}
+
+        def add(tipo: str, data: Dict[str, Any], fields: Dict[str, Any], categoria, provincia):
+            key = (tipo, data["id"])
+            documents[key] = data
+            facets[key] = (categoria or None, provincia or None)
+            for field, value in fields.items():
+                weight = FIELD_WEIGHTS.get(field, 1.0)
+                for term in tokenize(value):
+                    # Un término repetido no suma: cuenta el campo de mayor peso
+                    if postings[term].get(key, 0.0) < weight:
+                        postings[term][key] = weight
+
+        destinos_por_id = {str(d.id): d for d in destinos}
+        destinos_por_nombre = {fold_text(d.nombre): d for d in destinos}
+
+        for d in destinos:
+            add("destinos", _serialize(d), {
+                "nombre": d.nombre,
+                "descripcion": d.descripcion,
+                "ubicacion": d.ubicacion,
+                "ruta": d.ruta,
+                "provincia": d.provincia,
+                "ciudad": d.ciudad,
+                "categoria": d.categoria,
+            }, d.categoria, d.provincia)
+
+        for t in tours:
+            destino = destinos_por_id.get(str(t.destino_id)) if t.destino_id else None
+            add("tours", _serialize(t), {
+                "nombre": t.nombre,
+                "descripcion": t.descripcion,
+                "destino": destino.nombre if destino else None,
+                "ciudad": destino.ciudad if destino else None,
+                "provincia": destino.provincia if destino else None,
+            }, destino.categoria if destino else None, destino.provincia if destino else None)
+
+        for s in servicios:
+            destino = None
+            if s.destino:
+                destino = destinos_por_id.get(s.destino) or destinos_por_nombre.get(fold_text(s.destino))
+            add("servicios", _serialize(s), {
+                "nombre": s.nombre,
+                "descripcion": s.descripcion,
+                "categoria": s.categoria,
+                "proveedor": s.proveedor,
+                "destino": destino.nombre if destino else s.destino,
+                "ciudad": destino.ciudad if destino else None,
+                "provincia": destino.provincia if destino else None,
+            }, s.categoria, destino.provincia if destino else None)
+
+        self._postings = dict(postings)
+        self._vocabulary = sorted(postings)
+        self._documents = documents
+        self._facets = facets
+        self._built_at = time.monotonic()
+        self.builds += 1
+        self.last_build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # --- Consulta ---
+
+    def _match_term(self, term: str) -> Dict[DocKey, float]:
+        """Documentos que contienen el término, exacto o como prefijo de otro."""
+        matches: Dict[DocKey, float] = dict(self._postings.get(term, {}))
+        if len(term) < MIN_PREFIX_LENGTH:
+            return matches
+        start = bisect.bisect_right(self._vocabulary, term)
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            for key, weight in self._postings[candidate].items():
+                score = weight * PREFIX_FACTOR
+                if matches.get(key, 0.0) < score:
+                    matches[key] = score
+        return matches
+
+    def _match_query(self, q: Optional[str], tipos: Iterable[str]) -> Dict[DocKey, float]:
+        tipos = set(tipos)
+        terms = tokenize(q)
+        if not terms:
+            # Sin texto (o solo palabras vacías): todos los documentos de los tipos pedidos
+            return {key: 0.0 for key in self._documents if key[0] in tipos}
+
+        scores: Optional[Dict[DocKey, float]] = None
+        for term in dict.fromkeys(terms):
+            matches = {key: s for key, s in self._match_term(term).items() if key[0] in tipos}
+            if scores is None:
+                scores = matches
+            else:
+                scores = {key: scores[key] + s for key, s in matches.items() if key in scores}
+            if not scores:
+                return {}
+        return scores
+
+    async def search(
+        self,
+        q: Optional[str] = None,
+        tipos: Iterable[str] = SEARCH_TYPES,
+        categoria: Optional[str] = None,
+        provincia: Optional[str] = None,
+        limit: Optional[int] = 20,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Buscar en el índice.
+
+        Returns:
+            {"total", "results": [{"tipo", "score", **documento}], "facets": {"categoria", "provincia"}}
+        """
+        await self.ensure_built()
+        self.queries += 1
+        scores = self._match_query(q, tipos)
+        categoria_f, provincia_f = fold_text(categoria), fold_text(provincia)
+
+        def passes(key: DocKey, skip: str = "") -> bool:
+            cat, prov = self._facets[key]
+            if categoria_f and skip != "categoria" and fold_text(cat) != categoria_f:
+                return False
+            if provincia_f and skip != "provincia" and fold_text(prov) != provincia_f:
+                return False
+            return True
+
+        facet_categoria: Counter = Counter()
+        facet_provincia: Counter = Counter()
+        matched: List[DocKey] = []
+        for key in scores:
+            cat, prov = self._facets[key]
+            if cat and passes(key, skip="categoria"):
+                facet_categoria[cat] += 1
+            if prov and passes(key, skip="provincia"):
+                facet_provincia[prov] += 1
+            if passes(key):
+                matched.append(key)
+
+        # Relevancia descendente; empates por nombre
+        matched.sort(key=lambda k: (-scores[k], fold_text(self._documents[k].get("nombre"))))
+        page = matched[offset:offset + limit] if limit is not None else matched[offset:]
+        return {
+            "total": len(matched),
+            "results": [
+                {"tipo": key[0], "score": round(scores[key], 2), **self._documents[key]}
+                for key in page
+            ],
+            "facets": {
+                "categoria": dict(facet_categoria.most_common()),
+                "provincia": dict(facet_provincia.most_common()),
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._documents),
+            "terms": len(self._vocabulary),
+            "stale": self._needs_build(),
+            "builds": self.builds,
+            "last_build_ms": self.last_build_ms,
+            "queries": self.queries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+search_index = SearchIndex(ttl_seconds=settings.search_index_ttl_seconds)
+
+
+async def search_documents(tipo: str, **filters) -> List[Dict[str, Any]]:
+    """Documentos serializados de un tipo que cumplen la búsqueda (para las rutas de listado)."""
+    result = await search_index.search(tipos=(tipo,), limit=None, **filters)
+    return [{k: v for k, v in r.items() if k not in ("tipo", "score")} for r in result["results"]]
@@ -0,0 +1,85 @@
+"""
+Cache de tokens JWT ya verificados.
+Usado por `app.auth.jwt` y `app.services.jwt_validator` para no volver a
+parsear ni verificar la firma de un token que el cliente repite en cada petición.
+
+Cada validador usa su propio cache con nombre (pueden tener secretos distintos,
+así que un token verificado por uno no debe darse por válido en el otro).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+TOKEN_CACHE_MAX_SIZE = 1024
+
+
+class VerifiedTokenCache:
+    """
+    Cache LRU acotado: digest SHA-256 del token → payload decodificado.
+    Cada entrada vive hasta el `exp` del propio token.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Retornar el payload cacheado si existe y no ha expirado."""
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: Dict[str, Any]):
+        """Guardar un payload verificado hasta su expiración."""
+        exp = payload.get("exp")
+        if not exp:
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (float(exp), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño y tasa de aciertos del cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+_caches: Dict[str, VerifiedTokenCache] = {}
+
+
+def get_token_cache(name: str) -> VerifiedTokenCache:
+    """Obtener (o crear) el cache de un validador."""
+    if name not in _caches:
+        _caches[name] = VerifiedTokenCache()
+    return _caches[name]
+
+
+def get_token_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Estadísticas de todos los caches de tokens (para /health)."""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,121 @@
+"""
+Recepción de archivos subidos por streaming.
+Usado por `app.routes.upload_routes` para no cargar el archivo completo en memoria:
+
+- `UploadSizeLimitMiddleware` responde 413 antes de leer el cuerpo cuando el
+  Content-Length ya excede el límite.
+- `save_upload_stream` copia el archivo por bloques a un temporal junto al
+  destino, aborta en cuanto se supera el límite y valida el tipo real por los
+  magic bytes del primer bloque (no por la extensión).
+"""
+import asyncio
+import os
+import uuid
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 256 * 1024
+
+# Tipo detectado → extensión con la que se guarda el archivo
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Tipo MIME de imagen según los magic bytes (None si no es una imagen soportada)."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def save_upload_stream(file: UploadFile, directory: str, max_bytes: int) -> Tuple[str, int]:
+    """
+    Guardar una imagen subida en `directory` con un nombre único.
+
+    Returns:
+        (nombre del archivo guardado, tamaño en bytes)
+
+    Raises:
+        HTTPException 400 si no es una imagen soportada, 413 si excede `max_bytes`
+    """
+    os.makedirs(directory, exist_ok=True)
+    unique_id = str(uuid.uuid4())
+    tmp_path = os.path.join(directory, f".{unique_id}.part")
+    size = 0
+    extension = None
+
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = IMAGE_EXTENSIONS.get(sniff_image_type(chunk))
+                    if extension is None:
+                        raise HTTPException(
+                            status_code=400,
+                            detail="El contenido del archivo no es una imagen válida (JPEG, PNG, WEBP o GIF)"
+                        )
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"El archivo es demasiado grande. Tamaño máximo: {max_bytes / (1024*1024)}MB"
+                    )
+                await asyncio.to_thread(f.write, chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="El archivo está vacío")
+
+        # Publicar el archivo solo cuando está completo y validado
+        filename = f"{unique_id}{extension}"
+        os.replace(tmp_path, os.path.join(directory, filename))
+        return filename, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Middleware ASGI: 413 inmediato para peticiones a `paths` cuyo
+    Content-Length excede `max_bytes` (el multipart no llega a parsearse).
+    """
+
+    def __init__(self, app, max_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            length = dict(scope["headers"]).get(b"content-length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                body = (
+                    f'{{"detail": "El archivo es demasiado grande. Tamaño máximo: '
+                    f'{self.max_bytes / (1024*1024)}MB"}}'
+                ).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 413,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close"),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,42 @@
+"""
+Job de backfill: completar `Destino.coordenadas` desde el nomenclátor offline
+de ciudades de Ecuador (app/services/gazetteer.py).
+
+Uso:
+    python backfill_coordenadas.py              # solo destinos sin coordenadas
+    python backfill_coordenadas.py --dry-run    # mostrar el resultado sin guardar
+    python backfill_coordenadas.py --sobrescribir
+"""
+import argparse
+import asyncio
+
+from beanie import init_beanie
+
+from db import connect_to_mongo, get_database, close_mongo_connection
+from app.models.destino_model import Destino
+from app.services.gazetteer import backfill_coordenadas
+
+
+async def main(sobrescribir: bool, dry_run: bool):
+    await connect_to_mongo()
+    # Registrar el modelo también crea el índice 2dsphere si no existe
+    await init_beanie(database=get_database(), document_models=[Destino])
+    try:
+        resumen = await backfill_coordenadas(sobrescribir=sobrescribir, dry_run=dry_run)
+    finally:
+        await close_mongo_connection()
+
+    print(f"Destinos revisados: {resumen['revisados']}")
+    print(f"Destinos actualizados: {resumen['actualizados']}{' (dry-run)' if dry_run else ''}")
+    for fuente, total in resumen["por_fuente"].items():
+        print(f"  - por {fuente}: {total}")
+    if resumen["sin_resolver"]:
+        print(f"⚠️ Sin resolver ({len(resumen['sin_resolver'])}): {', '.join(resumen['sin_resolver'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocodificar destinos desde el nomenclátor offline")
+    parser.add_argument("--sobrescribir", action="store_true", help="Recalcular también los que ya tienen coordenadas")
+    parser.add_argument("--dry-run", action="store_true", help="No guardar cambios")
+    args = parser.parse_args()
+    asyncio.run(main(args.sobrescribir, args.dry_run))
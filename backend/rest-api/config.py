@@ -23,6 +23,13 @@ class Settings(BaseSettings):
     equipo_b_enabled: bool = True
     equipo_b_verify_ssl: bool = False
 
+    # MCP Server: aviso de escrituras para invalidar su cache de tools
+    mcp_server_url: str = "http://localhost:8005"
+    mcp_cache_invalidation_enabled: bool = True
+
+    # Índice de búsqueda: antigüedad máxima antes de reconstruirlo desde MongoDB
+    search_index_ttl_seconds: int = 300
+
     # Cargar variables desde .env si existe, ignorando campos extra
     model_config = SettingsConfigDict(
         env_file=".env", 
@@ -5,9 +5,15 @@ definidos en `app.models`.
 Estas funciones usan las helpers de `app.controllers.base_controller` para mantener
 la lógica genérica en un lugar.
 """
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from app.models.usuario_model import Usuario
+from beanie import PydanticObjectId
+from beanie.operators import In, Or
+from bson.errors import InvalidId
+from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
+
+from app.models.usuario_model import Usuario, normalizar_identificador
 from app.models.destino_model import Destino
 from app.models.tour_model import Tour
 from app.models.servicio_model import Servicio
@@ -17,6 +23,7 @@ from app.models.recomendacion_model import Recomendacion
 from app.models.contratacion_model import ContratacionServicio
 
 from app.controllers.base_controller import get_all, get_by_id, create, update, delete
+from app.services.gazetteer import completar_coordenadas, punto_geojson
 
 
 async def listar_usuarios() -> List[Usuario]:
@@ -28,6 +35,10 @@ async def obtener_usuario_por_id(id: str) -> Optional[Usuario]:
 
 
 async def crear_usuario(payload) -> Usuario:
+    """
+    Crear usuario; la unicidad de email/username la garantizan los índices únicos
+    (un duplicado propaga DuplicateKeyError, ver `campo_duplicado`).
+    """
     # Hashear la contraseña antes de guardar
     from utils import hash_password
     if "contrasena" in payload:
@@ -35,18 +46,100 @@ async def crear_usuario(payload) -> Usuario:
     return await create(Usuario, payload)
 
 
+async def actualizar_usuario(id: str, payload: dict) -> Optional[Usuario]:
+    """
+    Actualizar usuario. La asignación de campos no pasa por los validadores
+    del modelo: email y username se normalizan aquí.
+    """
+    datos = dict(payload)
+    for campo in ("email", "username"):
+        if campo in datos:
+            datos[campo] = normalizar_identificador(datos[campo])
+    return await update(Usuario, id, datos)
+
+
+def campo_duplicado(error: DuplicateKeyError) -> str:
+    """Campo ("email" o "username") cuyo índice único rechazó la escritura."""
+    return next(iter((error.details or {}).get("keyPattern", {})), "email")
+
+
+def mensaje_usuario_duplicado(error: DuplicateKeyError) -> str:
+    if campo_duplicado(error) == "username":
+        return "El username ya está en uso"
+    return "El email ya está registrado"
+
+
 async def obtener_usuario_por_email(email: str) -> Optional[Usuario]:
     """Obtener usuario por email."""
-    return await Usuario.find_one(Usuario.email == email)
+    return await Usuario.find_one(Usuario.email == email.strip().lower())
 
 
 async def obtener_usuario_por_username(username: str) -> Optional[Usuario]:
     """Obtener usuario por username."""
-    return await Usuario.find_one(Usuario.username == username)
+    return await Usuario.find_one(Usuario.username == username.strip().lower())
+
+
+async def obtener_usuario_por_identificador(identificador: str) -> Optional[Usuario]:
+    """
+    Obtener usuario por email o username en una sola consulta ($or sobre índices únicos).
+    Si el valor es el email de un usuario y el username de otro, gana el email
+    (un username con "@" no puede suplantar el login por email).
+    """
+    valor = identificador.strip().lower()
+    usuarios = await Usuario.find(Or(Usuario.email == valor, Usuario.username == valor)).limit(2).to_list()
+    por_email = next((u for u in usuarios if u.email == valor), None)
+    return por_email or (usuarios[0] if usuarios else None)
 
 
 async def crear_destino(payload) -> Destino:
-    return await create(Destino, payload)
+    return await create(Destino, completar_coordenadas(dict(payload)))
+
+
+# Destinos considerados al buscar tours cercanos
+MAX_DESTINOS_CERCANOS = 200
+
+
+async def listar_destinos_cercanos(lat: float, lng: float, radio_km: float, limit: int = 20) -> List[Tuple[Destino, float]]:
+    """
+    Destinos activos dentro de `radio_km` ordenados por distancia, con la
+    distancia en km. `$geoNear` usa el índice 2dsphere de `coordenadas`
+    (los destinos sin coordenadas no participan).
+    """
+    pipeline = [
+        {
+            "$geoNear": {
+                "near": punto_geojson(lat, lng),
+                "key": "coordenadas",
+                "distanceField": "distancia_m",
+                "maxDistance": radio_km * 1000,
+                "spherical": True,
+                "query": {"activo": {"$ne": False}},
+            }
+        },
+        {"$limit": limit},
+    ]
+    resultados = await Destino.aggregate(pipeline).to_list()
+    cercanos = []
+    for raw in resultados:
+        distancia_m = raw.pop("distancia_m")
+        cercanos.append((Destino.model_validate(raw), round(distancia_m / 1000, 2)))
+    return cercanos
+
+
+async def listar_tours_cercanos(lat: float, lng: float, radio_km: float, limit: int = 20) -> List[Tuple[Tour, Destino, float]]:
+    """
+    Tours disponibles cuyo destino está dentro de `radio_km`, ordenados por
+    distancia del destino y luego por precio. Dos consultas: `$geoNear` sobre
+    destinos y los tours de esos destinos en un solo `$in`.
+    """
+    cercanos = await listar_destinos_cercanos(lat, lng, radio_km, limit=MAX_DESTINOS_CERCANOS)
+    destinos = {str(d.id): (d, km) for d, km in cercanos}
+    if not destinos:
+        return []
+
+    tours = await Tour.find(In(Tour.destino_id, list(destinos)), Tour.disponible != False).to_list()  # noqa: E712
+    tours.sort(key=lambda t: (destinos[t.destino_id][1], t.precio or 0.0))
+    return [(t, *destinos[t.destino_id]) for t in tours[:limit]]
 
 
 async def crear_tour(payload) -> Tour:
@@ -93,6 +186,38 @@ async def listar_reservas() -> List[Reserva]:
     return await get_all(Reserva)
 
 
+class TourNombre(BaseModel):
+    """Proyección de Tour: solo el id y el nombre."""
+    id: PydanticObjectId = Field(alias="_id")
+    nombre: Optional[str] = None
+
+    class Settings:
+        projection = {"_id": 1, "nombre": 1}
+
+
+async def listar_reservas_usuario(usuario_id: str) -> List[Tuple[Reserva, Optional[str]]]:
+    """
+    Reservas de un usuario junto con el nombre de su tour.
+    Dos consultas acotadas a las reservas del usuario: las reservas por el índice
+    `usuario_id` y los tours referenciados en un solo `$in` (proyectando el nombre).
+    """
+    reservas = await Reserva.find(Reserva.usuario_id == usuario_id).to_list()
+
+    tour_ids = []
+    for tour_id in {r.tour_id for r in reservas if r.tour_id}:
+        try:
+            tour_ids.append(PydanticObjectId(tour_id))
+        except (InvalidId, TypeError, ValueError):
+            continue
+
+    nombres = {}
+    if tour_ids:
+        tours = await Tour.find(In(Tour.id, tour_ids)).project(TourNombre).to_list()
+        nombres = {str(t.id): t.nombre for t in tours}
+
+    return [(r, nombres.get(r.tour_id)) for r in reservas]
+
+
 async def crear_reserva(payload) -> Reserva:
     return await create(Reserva, payload)
 
@@ -11,6 +11,11 @@ from beanie import init_beanie
 
 # Importar funciones de conexión a DB
 from db import connect_to_mongo, get_database, close_mongo_connection
+from app.services.token_cache import get_token_cache_stats
+from app.services.upload_stream import UploadSizeLimitMiddleware
+from app.services.jwt_validator import JWTValidator
+from app.services.cache_events import ResourceChangeMiddleware, close_cache_events_client, add_resource_listener
+from app.services.search_index import search_index
 
 # Importar routers
 from app.routes import (
@@ -26,7 +31,8 @@ from app.routes import (
     upload_routes,
     pago_routes,
     webhook_routes,
-    integracion_routes
+    integracion_routes,
+    search_routes
 )
 
 
@@ -64,9 +70,13 @@ async def startup_event():
     # Crear usuario admin si no existe
     await crear_admin_inicial()
 
+    # Claves públicas del Auth Service (solo en modo RS256/EdDSA)
+    await JWTValidator.prefetch_signing_key()
+
 
 async def shutdown_event():
-    """Eventos de shutdown: cerrar conexión a MongoDB."""
+    """Eventos de shutdown: cerrar clientes HTTP y la conexión a MongoDB."""
+    await close_cache_events_client()
     try:
         await close_mongo_connection()
         print("✅ Conexión a MongoDB cerrada correctamente")
@@ -95,7 +105,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Avisar al MCP Server de las escrituras para que invalide su cache de tools
+app.add_middleware(ResourceChangeMiddleware)
+
+# Rechazar uploads demasiado grandes antes de leer el cuerpo
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=upload_routes.MAX_REQUEST_SIZE,
+    paths=(upload_routes.router.prefix,)
+)
+
 # Configurar CORS para permitir peticiones desde el frontend
+# (se agrega al final para envolver también las respuestas 413)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000"],  # URLs del frontend
@@ -127,6 +148,10 @@ app.include_router(upload_routes.router)
 app.include_router(pago_routes.router)
 app.include_router(webhook_routes.router)
 app.include_router(integracion_routes.router)
+app.include_router(search_routes.router)
+
+# Reconstruir el índice de búsqueda tras escrituras en destinos, tours o servicios
+add_resource_listener(search_index.invalidate)
 
 
 async def crear_admin_inicial():
@@ -162,7 +187,8 @@ async def health():
         db_connected = db is not None
     except Exception:
         db_connected = False
-    return {"status": "ok", "db_connected": db_connected}
+    return {"status": "ok", "db_connected": db_connected, "token_cache": get_token_cache_stats(),
+            "search_index": search_index.stats()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""
+Normalización única de email/username de usuarios existentes.
+
+Desde que `Usuario` guarda email y username en minúsculas (login sin distinguir
+mayúsculas) y ambos tienen índice único:
+
+- Los usuarios guardados antes con mayúsculas ("Ana@Mail.com") ya no coinciden
+  con la búsqueda del login, que compara en minúsculas.
+- Si existen variantes que solo difieren en mayúsculas ("ana@mail.com" y
+  "Ana@mail.com"), la creación del índice único falla al arrancar.
+
+Ejecutar ANTES de desplegar la versión con los índices únicos. Trabaja sobre
+la colección directamente (sin Beanie, que intentaría crear los índices):
+
+    python normalize_usuarios.py --dry-run   # solo reportar
+    python normalize_usuarios.py             # aplicar
+
+Los usuarios sin conflicto se normalizan. Los duplicados se reportan y se dejan
+intactos para resolverlos a mano (fusionar o cambiar el email/username de uno);
+en ese caso el script termina con código 1 y hay que volver a ejecutarlo.
+Un username vacío o solo espacios se elimina (varios vacíos chocarían en el índice).
+"""
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from db import connect_to_mongo, get_database, close_mongo_connection
+
+CAMPOS = ("email", "username")
+
+
+def normalizar(valor: Any) -> Any:
+    return valor.strip().lower() if isinstance(valor, str) else valor
+
+
+async def normalizar_usuarios(dry_run: bool) -> Dict[str, Any]:
+    coleccion = get_database()["usuarios"]
+    usuarios = await coleccion.find({}, {"email": 1, "username": 1}).to_list(length=None)
+
+    # Agrupar por valor normalizado para detectar variantes de mayúsculas
+    grupos: Dict[str, Dict[str, List[Dict[str, Any]]]] = {campo: defaultdict(list) for campo in CAMPOS}
+    for usuario in usuarios:
+        for campo in CAMPOS:
+            valor = normalizar(usuario.get(campo))
+            if isinstance(valor, str) and valor:
+                grupos[campo][valor].append(usuario)
+
+    duplicados = {
+        campo: {valor: docs for valor, docs in por_valor.items() if len(docs) > 1}
+        for campo, por_valor in grupos.items()
+    }
+    en_conflicto = {
+        doc["_id"] for por_valor in duplicados.values() for docs in por_valor.values() for doc in docs
+    }
+
+    resumen = {"revisados": len(usuarios), "normalizados": 0, "usernames_vacios": 0, "duplicados": duplicados}
+    for usuario in usuarios:
+        if usuario["_id"] in en_conflicto:
+            continue
+        cambios: Dict[str, Any] = {}
+        eliminar: Dict[str, str] = {}
+        for campo in CAMPOS:
+            valor = usuario.get(campo)
+            if not isinstance(valor, str):
+                continue
+            if campo == "username" and not valor.strip():
+                eliminar[campo] = ""
+                resumen["usernames_vacios"] += 1
+            elif normalizar(valor) != valor:
+                cambios[campo] = normalizar(valor)
+        if not cambios and not eliminar:
+            continue
+        resumen["normalizados"] += 1
+        if not dry_run:
+            update: Dict[str, Any] = {}
+            if cambios:
+                update["$set"] = cambios
+            if eliminar:
+                update["$unset"] = eliminar
+            await coleccion.update_one({"_id": usuario["_id"]}, update)
+    return resumen
+
+
+async def main(dry_run: bool) -> int:
+    await connect_to_mongo()
+    try:
+        resumen = await normalizar_usuarios(dry_run)
+    finally:
+        await close_mongo_connection()
+
+    print(f"Usuarios revisados: {resumen['revisados']}")
+    print(f"Usuarios normalizados: {resumen['normalizados']}{' (dry-run)' if dry_run else ''}")
+    if resumen["usernames_vacios"]:
+        print(f"  - usernames vacíos eliminados: {resumen['usernames_vacios']}")
+
+    hay_duplicados = False
+    for campo, por_valor in resumen["duplicados"].items():
+        for valor, docs in por_valor.items():
+            hay_duplicados = True
+            variantes = ", ".join(f"{doc['_id']} ({doc.get(campo)!r})" for doc in docs)
+            print(f"❌ {campo} duplicado '{valor}': {variantes}")
+    if hay_duplicados:
+        print("⚠️ Resolver los duplicados y volver a ejecutar antes de desplegar (el índice único fallaría).")
+        return 1
+    print("✅ Sin duplicados: los índices únicos de email/username pueden crearse.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalizar email/username y reportar duplicados")
+    parser.add_argument("--dry-run", action="store_true", help="Solo reportar, sin guardar cambios")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.dry_run)))